@@ -37,3 +37,9 @@ pytest_plugins = [
     'tests.fixtures.fixture_user',
     'tests.fixtures.fixture_data',
 ]
+
+
+def pytest_configure(config):
+    # До сбора тестов: при сборе уже создаётся кеш default.
+    from core.testing import isolate_cache
+    isolate_cache()
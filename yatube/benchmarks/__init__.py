@@ -0,0 +1,6 @@
+"""Замеры производительности на одноразовой базе.
+
+Запуск из каталога yatube/, например:
+
+    python -m benchmarks.query_plans
+"""
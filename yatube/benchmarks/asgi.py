@@ -0,0 +1,245 @@
+"""Пропускная способность WSGI и ASGI при одинаковом числе потоков.
+
+    python -m benchmarks.asgi --workers 4 --concurrency 64 --output asgi.json
+
+Оба сервера запускаются отдельными процессами на одной базе:
+WSGI — wsgiref с пулом из --workers потоков, ASGI — uvicorn
+с yatube.asgi и ASGI_THREADS = --workers. Нагрузку даёт
+асинхронный клиент с --concurrency одновременными соединениями.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from . import environment
+from .load import PERCENTILES, get_commit, percentile
+
+PATHS = {'index': '/', 'follow_index': '/follow/'}
+
+
+class PooledWSGIServer(WSGIServer):
+    """wsgiref, обрабатывающий запросы в пуле из workers потоков."""
+
+    request_queue_size = 1024
+    workers = 1
+
+    def server_activate(self):
+        super().server_activate()
+        self.pool = ThreadPoolExecutor(max_workers=self.workers)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_wsgi(port, workers):
+    from yatube.wsgi import application
+
+    PooledWSGIServer.workers = workers
+    server = make_server(
+        '127.0.0.1', port, application,
+        server_class=PooledWSGIServer, handler_class=QuietHandler,
+    )
+    server.serve_forever()
+
+
+def get_free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode, port, workers, database):
+    env = dict(
+        os.environ,
+        DJANGO_SETTINGS_MODULE='benchmarks.settings',
+        BENCHMARK_DATABASE=database,
+        BENCHMARK_WORKERS=str(workers),
+    )
+    if mode == 'wsgi':
+        command = [
+            sys.executable, '-m', 'benchmarks.asgi', 'serve-wsgi',
+            '--port', str(port), '--workers', str(workers),
+        ]
+    else:
+        command = [
+            sys.executable, '-m', 'uvicorn', 'yatube.asgi:application',
+            '--port', str(port), '--log-level', 'warning', '--no-access-log',
+        ]
+    process = subprocess.Popen(
+        command, env=env, cwd=os.path.dirname(os.path.dirname(__file__))
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process
+        except OSError:
+            if process.poll() is not None:
+                break
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f'Сервер {mode} не запустился')
+
+
+async def fetch(port, path, cookie):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(
+        f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\n'
+        f'Cookie: {cookie}\r\nConnection: close\r\n\r\n'.encode()
+    )
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return int(response.split(b' ', 2)[1])
+
+
+async def drive(port, path, cookie, requests, concurrency):
+    latencies, errors = [], 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            start = time.perf_counter()
+            try:
+                status = await fetch(port, path, cookie)
+            except (OSError, ValueError, IndexError):
+                status = None
+            latencies.append((time.perf_counter() - start) * 1000)
+            if status != 200:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    total = time.perf_counter() - start
+    latencies.sort()
+    result = {
+        'requests': requests,
+        'errors': errors,
+        'throughput_rps': requests / total,
+        'mean_ms': sum(latencies) / len(latencies),
+    }
+    for rank in PERCENTILES:
+        result[f'p{rank}_ms'] = percentile(latencies, rank)
+    return result
+
+
+def prepare(options, database):
+    """Заполняет базу и возвращает cookie сессии самого активного читателя."""
+    old_name = environment.setup(database)
+    try:
+        from django.conf import settings
+        from django.db import connection
+        from django.db.models import Count
+        from django.test import Client
+
+        from posts.models import Follow
+        from .dataset import seed
+
+        counts = seed(
+            users=options.users, groups=options.groups,
+            posts=options.posts, follows=options.follows,
+            comments=options.comments,
+        )
+        reader = Follow.objects.values('user').annotate(
+            total=Count('id')
+        ).order_by('-total').first()
+        client = Client()
+        client.force_login(
+            Follow.objects.filter(user=reader['user']).first().user
+        )
+        cookie = client.cookies[settings.SESSION_COOKIE_NAME].value
+        connection.close()
+        return counts, f'{settings.SESSION_COOKIE_NAME}={cookie}'
+    finally:
+        environment.teardown(old_name, keep=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest='command')
+    serve = subparsers.add_parser('serve-wsgi')
+    serve.add_argument('--port', type=int, required=True)
+    serve.add_argument('--workers', type=int, required=True)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--warmup', type=int, default=100)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--groups', type=int, default=50)
+    parser.add_argument('--posts', type=int, default=10000)
+    parser.add_argument('--follows', type=int, default=50000)
+    parser.add_argument('--comments', type=int, default=0)
+    parser.add_argument('--output', help='Файл для отчёта JSON.')
+    options = parser.parse_args(argv)
+    if options.command == 'serve-wsgi':
+        serve_wsgi(options.port, options.workers)
+        return
+
+    descriptor, database = tempfile.mkstemp(suffix='.sqlite3')
+    os.close(descriptor)
+    try:
+        started = datetime.now(timezone.utc)
+        counts, cookie = prepare(options, database)
+        results = {}
+        for mode in ('wsgi', 'asgi'):
+            port = get_free_port()
+            process = start_server(mode, port, options.workers, database)
+            try:
+                for name, path in PATHS.items():
+                    asyncio.run(drive(
+                        port, path, cookie, options.warmup,
+                        options.concurrency
+                    ))
+                    result = asyncio.run(drive(
+                        port, path, cookie, options.requests,
+                        options.concurrency
+                    ))
+                    results.setdefault(mode, {})[name] = result
+                    print(
+                        f'{mode} {name:>13}: '
+                        f'{result["throughput_rps"]:7.1f} запр./с, '
+                        f'p50 {result["p50_ms"]:7.1f} мс, '
+                        f'p99 {result["p99_ms"]:7.1f} мс, '
+                        f'ошибок {result["errors"]}'
+                    )
+            finally:
+                process.terminate()
+                process.wait()
+        if options.output:
+            with open(options.output, 'w') as output:
+                json.dump({
+                    'commit': get_commit(),
+                    'started': started.isoformat(),
+                    'dataset': counts,
+                    'options': vars(options),
+                    'results': results,
+                }, output, ensure_ascii=False, indent=2)
+    finally:
+        environment.remove(database)
+
+
+if __name__ == '__main__':
+    main()
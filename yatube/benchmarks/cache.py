@@ -0,0 +1,116 @@
+"""Задержка операций кеша: LocMem, файловый кеш Django и SQLiteCache.
+
+    python -m benchmarks.cache --operations 5000 --value-size 20000
+
+Значение по умолчанию близко по размеру к HTML главной страницы.
+Каждый кеш создаётся напрямую, без MeasuredCacheMixin, поэтому
+сравниваются только сами хранилища.
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from .load import PERCENTILES, get_commit, percentile
+
+BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'filebased': 'django.core.cache.backends.filebased.FileBasedCache',
+    'sqlite': 'core.cache.BaseSQLiteCache',
+}
+
+
+def make_cache(backend, directory):
+    from django.utils.module_loading import import_string
+
+    location = os.path.join(directory, backend)
+    if backend == 'sqlite':
+        location += '.sqlite3'
+    return import_string(BACKENDS[backend])(location, {
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    })
+
+
+def timed(operation, keys):
+    timings = []
+    for key in keys:
+        started = time.perf_counter()
+        operation(key)
+        timings.append(time.perf_counter() - started)
+    return summarize(timings)
+
+
+def summarize(timings):
+    timings.sort()
+    result = {
+        f'p{rank}_us': round(percentile(timings, rank) * 1e6, 1)
+        for rank in PERCENTILES
+    }
+    result['ops_per_second'] = round(len(timings) / sum(timings))
+    return result
+
+
+def measure(cache, operations, keys, value):
+    keys = [f'key:{number}' for number in range(keys)]
+    for key in keys:
+        cache.set(key, value)
+    hits = [keys[number % len(keys)] for number in range(operations)]
+    misses = [f'missing:{number}' for number in range(operations)]
+    cache.set('counter', 0)
+    return {
+        'get_hit': timed(cache.get, hits),
+        'get_miss': timed(cache.get, misses),
+        'set': timed(lambda key: cache.set(key, value), hits),
+        'incr': timed(lambda key: cache.incr('counter'), hits),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--operations', type=int, default=5000)
+    parser.add_argument('--keys', type=int, default=100)
+    parser.add_argument('--value-size', type=int, default=20000)
+    parser.add_argument('--backends', nargs='*', choices=BACKENDS,
+                        default=list(BACKENDS))
+    parser.add_argument('--output', help='Файл для отчёта JSON.')
+    options = parser.parse_args(argv)
+
+    import django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+    django.setup()
+
+    started = datetime.now(timezone.utc)
+    value = 'x' * options.value_size
+    directory = tempfile.mkdtemp()
+    results = {}
+    try:
+        for backend in options.backends:
+            result = measure(
+                make_cache(backend, directory),
+                options.operations, options.keys, value
+            )
+            results[backend] = result
+            for operation, timings in result.items():
+                print(
+                    f'{backend:>9} {operation:>8}: '
+                    f'p50 {timings["p50_us"]:8.1f} мкс, '
+                    f'p99 {timings["p99_us"]:8.1f} мкс, '
+                    f'{timings["ops_per_second"]:8} оп./с'
+                )
+    finally:
+        shutil.rmtree(directory)
+    if options.output:
+        with open(options.output, 'w') as output:
+            json.dump({
+                'commit': get_commit(),
+                'started': started.isoformat(),
+                'options': vars(options),
+                'results': results,
+            }, output, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+import random
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+
+from posts import counters, timeline
+from posts.models import Comment, Follow, Group, Post, TimelineEntry
+
+User = get_user_model()
+
+
+def pick_author(rng, users):
+    """Случайный автор: популярность распределена с длинным хвостом."""
+    return users[int(len(users) * rng.random() ** 3)]
+
+
+def insert(model, objects, batch_size, **kwargs):
+    batch = []
+    for obj in objects:
+        batch.append(obj)
+        if len(batch) == batch_size:
+            model.objects.bulk_create(batch, **kwargs)
+            batch = []
+    model.objects.bulk_create(batch, **kwargs)
+
+
+def seed(users=100, groups=10, posts=1000, follows=1000, comments=1000,
+         batch_size=5000, seed=0):
+    """Заполняет базу синтетическими данными пакетными вставками.
+
+    bulk_create не отправляет сигналы, поэтому ленты подписок
+    и счётчики AuthorStats заполняются отдельно в конце.
+    Возвращает словарь с числом созданных строк каждой модели.
+    """
+    rng = random.Random(seed)
+    with transaction.atomic():
+        insert(User, (
+            User(username=f'user{number}', password='!')
+            for number in range(users)
+        ), batch_size)
+        insert(Group, (
+            Group(title=f'Группа {number}', slug=f'group-{number}')
+            for number in range(groups)
+        ), batch_size)
+        user_ids = list(User.objects.values_list('pk', flat=True))
+        group_ids = [None] + list(Group.objects.values_list('pk', flat=True))
+        insert(Post, (
+            Post(
+                text=f'Запись {number} ' + 'текст ' * rng.randint(5, 50),
+                author_id=pick_author(rng, user_ids),
+                group_id=rng.choice(group_ids),
+            )
+            for number in range(posts)
+        ), batch_size)
+        insert(Follow, (
+            Follow(user_id=user_id, author_id=author_id)
+            for user_id, author_id in (
+                (rng.choice(user_ids), pick_author(rng, user_ids))
+                for _ in range(follows)
+            )
+            if user_id != author_id
+        ), batch_size, ignore_conflicts=True)
+        post_ids = list(Post.objects.values_list('pk', flat=True))
+        insert(Comment, (
+            Comment(
+                post_id=rng.choice(post_ids),
+                author_id=rng.choice(user_ids),
+                text='Комментарий ' * rng.randint(1, 10),
+            )
+            for _ in range(comments if post_ids else 0)
+        ), batch_size)
+    counters.reconcile(batch_size=batch_size)
+    timeline.rebuild()
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    return {
+        model._meta.model_name: model.objects.count()
+        for model in (User, Group, Post, Follow, Comment, TimelineEntry)
+    }
@@ -0,0 +1,56 @@
+import atexit
+import glob
+import os
+import shutil
+import tempfile
+
+import django
+
+
+def setup(database=None):
+    """Настраивает Django и создаёт одноразовую базу со всеми миграциями.
+
+    По умолчанию база SQLite создаётся в памяти; database — путь
+    к файлу, если данных больше, чем помещается в память.
+    Кеш — отдельный файл рядом с базой или во временном каталоге,
+    общий cache.sqlite3 не затрагивается.
+    Возвращает имя рабочей базы для teardown().
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+    django.setup()
+    from django.conf import settings
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+
+    from core.testing import isolate_cache
+
+    if database:
+        isolate_cache(database + '.cache')
+    else:
+        directory = tempfile.mkdtemp()
+        atexit.register(shutil.rmtree, directory, ignore_errors=True)
+        isolate_cache(os.path.join(directory, 'cache.sqlite3'))
+    setup_test_environment()
+    old_name = settings.DATABASES['default']['NAME']
+    if database:
+        settings.DATABASES['default'].setdefault('TEST', {})
+        settings.DATABASES['default']['TEST']['NAME'] = database
+    connection.creation.create_test_db(
+        verbosity=0, autoclobber=True, keepdb=False
+    )
+    return old_name
+
+
+def teardown(old_name, keep=False):
+    from django.db import connection
+    from django.test.utils import teardown_test_environment
+
+    if not keep:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+    teardown_test_environment()
+
+
+def remove(database):
+    """Удаляет файл базы вместе с WAL и кешем benchmarks.settings."""
+    for path in glob.glob(glob.escape(database) + '*'):
+        os.remove(path)
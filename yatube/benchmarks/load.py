@@ -0,0 +1,261 @@
+"""Нагрузочный прогон всех страниц posts.urls на синтетических данных.
+
+    python -m benchmarks.load --posts 1000000 --users 100000 \\
+        --follows 5000000 --comments 10000000 --database /tmp/load.sqlite3 \\
+        --output load.json
+
+Каждая страница запрашивается последовательно через тестовый клиент,
+в отчёт попадают p50/p95/p99 задержки, число SQL-запросов на запрос
+и пропускная способность одного процесса.
+"""
+import argparse
+import json
+import random
+import subprocess
+import time
+from datetime import datetime, timezone
+
+from . import environment
+
+PERCENTILES = (50, 95, 99)
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def percentile(values, rank):
+    """Значение по методу ближайшего ранга; values отсортированы."""
+    if not values:
+        return None
+    index = max(0, -(-len(values) * rank // 100) - 1)
+    return values[index]
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ('git', 'rev-parse', 'HEAD'), capture_output=True, text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Scenario:
+    """Готовит клиентов и выдаёт запросы к каждой странице posts.urls."""
+
+    def __init__(self, rng, clients=20, sample=1000):
+        from django.contrib.auth import get_user_model
+        from django.test import Client
+
+        from posts.models import Group, Post
+
+        User = get_user_model()
+        self.rng = rng
+        self.group_slugs = list(
+            Group.objects.values_list('slug', flat=True)[:sample]
+        )
+        self.post_ids = list(Post.objects.values_list('pk', flat=True)[
+            :sample
+        ])
+        self.usernames = list(
+            User.objects.values_list('username', flat=True)[:sample]
+        )
+        # Авторы с записями: их клиенты могут редактировать свои записи.
+        own_posts = {}
+        for author_id, post_id in Post.objects.values_list(
+            'author_id', 'pk'
+        )[:sample]:
+            own_posts.setdefault(author_id, post_id)
+        self.clients = []
+        for user in User.objects.filter(pk__in=list(own_posts)[:clients]):
+            client = Client()
+            client.force_login(user)
+            self.clients.append((client, user, own_posts[user.pk]))
+        self.anonymous = Client()
+        self.number = 0
+
+    def get_views(self):
+        return {
+            'index': self.index,
+            'group_list': self.group_list,
+            'search': self.search,
+            'profile': self.profile,
+            'post_detail': self.post_detail,
+            'follow_index': self.follow_index,
+            'post_create': self.post_create,
+            'post_edit': self.post_edit,
+            'add_comment': self.add_comment,
+            'profile_follow': self.profile_follow,
+            'profile_unfollow': self.profile_unfollow,
+        }
+
+    def pick_client(self):
+        return self.rng.choice(self.clients)
+
+    def url(self, name, *args):
+        from django.urls import reverse
+
+        return reverse(f'posts:{name}', args=args)
+
+    def index(self):
+        return self.anonymous, 'get', self.url('index'), None
+
+    def group_list(self):
+        slug = self.rng.choice(self.group_slugs)
+        return self.anonymous, 'get', self.url('group_list', slug), None
+
+    def search(self):
+        return self.anonymous, 'get', self.url('search'), {'q': 'текст'}
+
+    def profile(self):
+        username = self.rng.choice(self.usernames)
+        return self.anonymous, 'get', self.url('profile', username), None
+
+    def post_detail(self):
+        post_id = self.rng.choice(self.post_ids)
+        return self.anonymous, 'get', self.url('post_detail', post_id), None
+
+    def follow_index(self):
+        client, _, _ = self.pick_client()
+        return client, 'get', self.url('follow_index'), None
+
+    def post_create(self):
+        client, _, _ = self.pick_client()
+        self.number += 1
+        data = {'text': f'Нагрузочная запись {self.number}'}
+        return client, 'post', self.url('post_create'), data
+
+    def post_edit(self):
+        client, _, post_id = self.pick_client()
+        self.number += 1
+        data = {'text': f'Отредактированная запись {self.number}'}
+        return client, 'post', self.url('post_edit', post_id), data
+
+    def add_comment(self):
+        client, _, _ = self.pick_client()
+        post_id = self.rng.choice(self.post_ids)
+        data = {'text': 'Нагрузочный комментарий'}
+        return client, 'post', self.url('add_comment', post_id), data
+
+    def profile_follow(self):
+        client, _, _ = self.pick_client()
+        username = self.rng.choice(self.usernames)
+        return client, 'get', self.url('profile_follow', username), None
+
+    def profile_unfollow(self):
+        from posts.models import Follow
+
+        client, user, _ = self.pick_client()
+        follow = Follow.objects.filter(user=user).select_related(
+            'author'
+        ).first()
+        if follow is None:
+            return self.profile_follow()
+        url = self.url('profile_unfollow', follow.author.username)
+        return client, 'get', url, None
+
+
+def measure(make_request, requests, warmup):
+    from django.db import connection
+
+    latencies, queries, errors = [], [], 0
+    started = None
+    for number in range(warmup + requests):
+        client, method, url, data = make_request()
+        if number == warmup:
+            started = time.perf_counter()
+        counter = QueryCounter()
+        begin = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            response = getattr(client, method)(url, data)
+        elapsed = time.perf_counter() - begin
+        if number < warmup:
+            continue
+        latencies.append(elapsed * 1000)
+        queries.append(counter.count)
+        if response.status_code >= 400:
+            errors += 1
+    total = time.perf_counter() - started if started else 0
+    latencies.sort()
+    result = {
+        'requests': requests,
+        'errors': errors,
+        'mean_ms': sum(latencies) / len(latencies) if latencies else None,
+        'queries_per_request': (
+            sum(queries) / len(queries) if queries else None
+        ),
+        'max_queries': max(queries, default=None),
+        'throughput_rps': requests / total if total else None,
+    }
+    for rank in PERCENTILES:
+        result[f'p{rank}_ms'] = percentile(latencies, rank)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--groups', type=int, default=50)
+    parser.add_argument('--posts', type=int, default=10000)
+    parser.add_argument('--follows', type=int, default=50000)
+    parser.add_argument('--comments', type=int, default=100000)
+    parser.add_argument('--requests', type=int, default=200,
+                        help='Запросов к каждой странице.')
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--views', nargs='*',
+                        help='Только эти страницы (имена из posts.urls).')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--database', help='Файл базы вместо памяти.')
+    parser.add_argument('--output', help='Файл для отчёта JSON.')
+    options = parser.parse_args(argv)
+
+    old_name = environment.setup(options.database)
+    try:
+        from .dataset import seed
+
+        started = datetime.now(timezone.utc)
+        begin = time.perf_counter()
+        counts = seed(
+            users=options.users, groups=options.groups,
+            posts=options.posts, follows=options.follows,
+            comments=options.comments, seed=options.seed,
+        )
+        seeded = time.perf_counter() - begin
+        scenario = Scenario(random.Random(options.seed))
+        views = scenario.get_views()
+        results = {}
+        for name in options.views or views:
+            results[name] = measure(
+                views[name], options.requests, options.warmup
+            )
+            print(
+                f'{name:>17}: p50 {results[name]["p50_ms"]:7.2f} мс, '
+                f'p95 {results[name]["p95_ms"]:7.2f} мс, '
+                f'p99 {results[name]["p99_ms"]:7.2f} мс, '
+                f'{results[name]["queries_per_request"]:5.1f} SQL, '
+                f'{results[name]["throughput_rps"]:7.1f} запр./с'
+            )
+        report = {
+            'commit': get_commit(),
+            'started': started.isoformat(),
+            'seed_seconds': seeded,
+            'dataset': counts,
+            'options': vars(options),
+            'views': results,
+        }
+        if options.output:
+            with open(options.output, 'w') as output:
+                json.dump(report, output, ensure_ascii=False, indent=2)
+    finally:
+        environment.teardown(old_name, keep=bool(options.database))
+
+
+if __name__ == '__main__':
+    main()
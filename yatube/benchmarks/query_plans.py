@@ -0,0 +1,174 @@
+"""EXPLAIN QUERY PLAN запросов лент до и после составных индексов.
+
+    python -m benchmarks.query_plans --posts 20000 --follows 20000
+"""
+import argparse
+
+from . import environment
+
+FEED_INDEXES = (
+    'post_group_date_idx',
+    'post_author_date_idx',
+    'comment_post_created_idx',
+    'follow_user_author_idx',
+)
+
+
+class QueryCollector:
+    """execute_wrapper, запоминающий SELECT-запросы с параметрами."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.lstrip().upper().startswith('SELECT') and (
+            'django_session' not in sql
+        ):
+            self.queries.append((sql, params))
+        return execute(sql, params, many, context)
+
+
+def get_feed_indexes():
+    from posts.models import Comment, Follow, Post
+
+    return [
+        (model, index)
+        for model in (Post, Comment, Follow)
+        for index in model._meta.indexes
+        if index.name in FEED_INDEXES
+    ]
+
+
+def set_indexes(enabled):
+    from django.db import connection
+
+    with connection.schema_editor() as editor:
+        for model, index in get_feed_indexes():
+            if enabled:
+                editor.add_index(model, index)
+            else:
+                editor.remove_index(model, index)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+def explain(sql, params):
+    from django.db import connection
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        rows = cursor.fetchall()
+    depth = {0: -1}
+    lines = []
+    for node, parent, _, detail in rows:
+        depth[node] = depth.get(parent, -1) + 1
+        lines.append('  ' * depth[node] + detail)
+    return lines
+
+
+def get_targets():
+    """URL каждой ленты на самых нагруженных группе, авторе и записи."""
+    from django.db.models import Count
+    from django.urls import reverse
+
+    from posts.models import Follow, Group, Post
+
+    group = Group.objects.annotate(
+        total=Count('posts')
+    ).order_by('-total').first()
+    author_id, _ = Post.objects.values_list('author_id').annotate(
+        total=Count('id')
+    ).order_by('-total').first()
+    author = Post.objects.filter(author_id=author_id).first().author
+    post_id, _ = Post.objects.values_list('id').annotate(
+        total=Count('comments')
+    ).order_by('-total').first()
+    reader = Follow.objects.values_list('user_id').annotate(
+        total=Count('id')
+    ).order_by('-total').first()
+    return reader[0], {
+        'index': reverse('posts:index'),
+        'group_list': reverse('posts:group_list', args=(group.slug,)),
+        'profile': reverse('posts:profile', args=(author.username,)),
+        'post_detail': reverse('posts:post_detail', args=(post_id,)),
+        'follow_index': reverse('posts:follow_index'),
+    }
+
+
+def capture(client, url):
+    from django.core.cache import cache
+    from django.db import connection
+
+    cache.clear()
+    collector = QueryCollector()
+    with connection.execute_wrapper(collector):
+        client.get(url)
+    # Повторы одного запроса (N+1) достаточно разобрать один раз.
+    unique = {}
+    for sql, params in collector.queries:
+        first_params, count = unique.get(sql, (params, 0))
+        unique[sql] = first_params, count + 1
+    return [(sql, params, count) for sql, (params, count) in unique.items()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--groups', type=int, default=20)
+    parser.add_argument('--posts', type=int, default=10000)
+    parser.add_argument('--follows', type=int, default=5000)
+    parser.add_argument('--comments', type=int, default=20000)
+    parser.add_argument(
+        '--fanout-threshold', type=int, default=50,
+        help='TIMELINE_FANOUT_THRESHOLD, чтобы в ленте подписок '
+             'были и разложенные, и подмешанные авторы.'
+    )
+    parser.add_argument('--database', help='Файл базы вместо памяти.')
+    options = parser.parse_args(argv)
+
+    old_name = environment.setup(options.database)
+    try:
+        from django.conf import settings
+        from django.contrib.auth import get_user_model
+        from django.test import Client
+
+        from .dataset import seed
+
+        settings.TIMELINE_FANOUT_THRESHOLD = options.fanout_threshold
+        seed(
+            users=options.users, groups=options.groups,
+            posts=options.posts, follows=options.follows,
+            comments=options.comments,
+        )
+        reader_id, targets = get_targets()
+        client = Client()
+        client.force_login(get_user_model().objects.get(pk=reader_id))
+        queries = {
+            name: capture(client, url) for name, url in targets.items()
+        }
+        plans = {}
+        for enabled in (False, True):
+            set_indexes(enabled)
+            for name, view_queries in queries.items():
+                for number, (sql, params, _) in enumerate(view_queries):
+                    plans.setdefault((name, number), []).append(
+                        explain(sql, params)
+                    )
+        for name, view_queries in queries.items():
+            print(f'=== {name} ({targets[name]})')
+            for number, (sql, _, count) in enumerate(view_queries):
+                before, after = plans[name, number]
+                repeats = f' (×{count})' if count > 1 else ''
+                print(f'---{repeats} {sql}')
+                for title, lines in (('до', before), ('после', after)):
+                    marker = '' if before != after else ' (без изменений)'
+                    print(f'  {title}{marker}:')
+                    for line in lines:
+                        print(f'    {line}')
+            print()
+    finally:
+        environment.teardown(old_name, keep=bool(options.database))
+
+
+if __name__ == '__main__':
+    main()
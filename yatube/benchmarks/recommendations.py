@@ -0,0 +1,125 @@
+"""Построение графа подписок и расчёт подсказок (posts.recommendations).
+
+    python -m benchmarks.recommendations --edges 10000000 --users 1000000
+
+Граф строится в памяти из синтетических подписок с длинным хвостом
+популярности, как в benchmarks.dataset, без базы: замеряются только
+матрицы и расчёт. Подсказки считаются пачками по --batch-size для
+--sample случайных пользователей, время на всех пользователей
+экстраполируется.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import time
+from datetime import datetime, timezone
+
+from .load import PERCENTILES, get_commit, percentile
+
+
+def generate(users, edges, seed):
+    """Пары (подписчик, автор) по возрастанию подписчика, без повторов."""
+    rng = random.Random(seed)
+    per_user = edges / users
+    for user in range(1, users + 1):
+        count = min(int(rng.expovariate(1 / per_user)), users - 1)
+        authors = {
+            1 + int(users * rng.random() ** 3) for _ in range(count)
+        }
+        authors.discard(user)
+        for author in sorted(authors):
+            yield user, author
+
+
+def get_rss():
+    """Пиковый размер процесса в МБ."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--edges', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--sample', type=int, default=10000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--cofollow-sample', type=int, default=20)
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Файл для отчёта JSON.')
+    options = parser.parse_args(argv)
+
+    import django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+    django.setup()
+    from posts.recommendations import Graph, top
+
+    started = datetime.now(timezone.utc)
+    rss_before = get_rss()
+    begin = time.perf_counter()
+    graph = Graph(
+        options.users + 1,
+        generate(options.users, options.edges, options.seed),
+    )
+    build_seconds = time.perf_counter() - begin
+    users = graph.users()
+    rng = random.Random(options.seed)
+    sample = sorted(rng.sample(
+        list(users), min(options.sample, len(users))
+    ))
+    begin = time.perf_counter()
+    graph.cofollow(options.cofollow_sample)
+    cofollow_seconds = time.perf_counter() - begin
+    timings = []
+    for start in range(0, len(sample), options.batch_size):
+        batch = sample[start:start + options.batch_size]
+        begin = time.perf_counter()
+        top(
+            graph.author_scores(batch, options.cofollow_sample),
+            options.limit
+        )
+        timings.append(time.perf_counter() - begin)
+    timings.sort()
+    per_user = sum(timings) / len(sample) if sample else 0
+    result = {
+        'edges': len(graph),
+        'users_with_follows': len(users),
+        'build_seconds': round(build_seconds, 1),
+        'cofollow_seconds': round(cofollow_seconds, 1),
+        'graph_mb': round(graph.nbytes() / 2 ** 20, 1),
+        'peak_rss_mb': round(get_rss(), 1),
+        'rss_growth_mb': round(get_rss() - rss_before, 1),
+        'suggest_ms_per_user': round(per_user * 1000, 3),
+        'suggest_all_users_seconds_estimate': round(per_user * len(users)),
+    }
+    for rank in PERCENTILES:
+        value = percentile(timings, rank)
+        result[f'suggest_batch_p{rank}_ms'] = (
+            round(value * 1000, 3) if value is not None else None
+        )
+    print(
+        f'Граф: {result["edges"]} подписок, {result["graph_mb"]} МБ '
+        f'матриц, построен за {result["build_seconds"]} с, '
+        f'W·R за {result["cofollow_seconds"]} с; '
+        f'пик процесса {result["peak_rss_mb"]} МБ.'
+    )
+    print(
+        f'Подсказки: {result["suggest_ms_per_user"]} мс на пользователя '
+        f'(пачка из {options.batch_size}: p99 '
+        f'{result["suggest_batch_p99_ms"]} мс), на всех '
+        f'{result["users_with_follows"]} — около '
+        f'{result["suggest_all_users_seconds_estimate"]} с.'
+    )
+    if options.output:
+        with open(options.output, 'w') as output:
+            json.dump({
+                'commit': get_commit(),
+                'started': started.isoformat(),
+                'options': vars(options),
+                'results': result,
+            }, output, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,16 @@
+"""Настройки процессов, которые запускают benchmarks.asgi и sqlite."""
+import os
+
+from yatube.settings import *  # noqa: F401,F403
+from yatube.settings import ASGI_THREADS, CACHES, DATABASES
+
+DEBUG = False
+DATABASES['default']['NAME'] = os.environ['BENCHMARK_DATABASE']
+CACHES['default']['LOCATION'] = os.environ['BENCHMARK_DATABASE'] + '.cache'
+ASGI_THREADS = int(os.environ.get('BENCHMARK_WORKERS', ASGI_THREADS))
+# BENCHMARK_SQLITE=plain — исходная настройка базы для сравнения:
+# django.db.backends.sqlite3 без PRAGMA и соединение на запрос.
+if os.environ.get('BENCHMARK_SQLITE') == 'plain':
+    DATABASES['default'].update(
+        ENGINE='django.db.backends.sqlite3', OPTIONS={}, CONN_MAX_AGE=0
+    )
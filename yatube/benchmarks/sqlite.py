@@ -0,0 +1,176 @@
+"""Параллельные читатели и писатели: исходный SQLite против core.sqlite3.
+
+    python -m benchmarks.sqlite --readers 8 --writers 4 --duration 10
+
+Каждый участник — отдельный процесс со своим соединением, как
+воркер сервера. Читатель выбирает страницу главной ленты, писатель
+в одной транзакции создаёт запись и комментарий со всеми сигналами,
+как post_create и add_comment. После каждой операции соединение
+обрабатывается как в конце запроса (close_old_connections).
+Обе настройки работают на копиях одной и той же базы.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from . import environment
+from .load import PERCENTILES, get_commit, percentile
+
+MODES = ('plain', 'tuned')
+
+
+def work(role, mode, database, duration, number, results):
+    os.environ.update(
+        DJANGO_SETTINGS_MODULE='benchmarks.settings',
+        BENCHMARK_DATABASE=database,
+        BENCHMARK_SQLITE=mode,
+    )
+    import django
+    django.setup()
+    from django.contrib.auth import get_user_model
+    from django.db import OperationalError, close_old_connections
+    from django.db import transaction
+
+    from posts.models import Comment, Post
+
+    user = get_user_model().objects.order_by('pk')[number]
+    post_ids = list(Post.objects.values_list('pk', flat=True)[:100])
+    close_old_connections()
+
+    def read():
+        list(Post.objects.for_feed()[:10])
+
+    def write():
+        with transaction.atomic():
+            post = Post.objects.create(text='Новая запись', author=user)
+            Comment.objects.create(
+                post_id=post_ids[post.pk % len(post_ids)], author=user,
+                text='Новый комментарий',
+            )
+
+    operation = read if role == 'reader' else write
+    latencies, errors = [], 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            operation()
+        except OperationalError:
+            errors += 1
+        else:
+            latencies.append(time.perf_counter() - started)
+        close_old_connections()
+    results.put((role, latencies, errors))
+
+
+def run(mode, database, options):
+    if mode == 'plain':
+        # WAL сохраняется в файле базы; исходная настройка — журнал.
+        with sqlite3.connect(database) as connection:
+            connection.execute('PRAGMA journal_mode = DELETE')
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    roles = (
+        ['reader'] * options.readers + ['writer'] * options.writers
+    )
+    processes = [
+        context.Process(target=work, args=(
+            role, mode, database, options.duration, number, results
+        ))
+        for number, role in enumerate(roles)
+    ]
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    report = {}
+    for role in ('reader', 'writer'):
+        latencies = sorted(
+            latency
+            for name, values, _ in collected if name == role
+            for latency in values
+        )
+        result = {
+            'operations': len(latencies),
+            'ops_per_second': round(len(latencies) / options.duration, 1),
+            'locked_errors': sum(
+                errors for name, _, errors in collected if name == role
+            ),
+        }
+        for rank in PERCENTILES:
+            value = percentile(latencies, rank)
+            result[f'p{rank}_ms'] = (
+                round(value * 1000, 2) if value is not None else None
+            )
+        report[role] = result
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--groups', type=int, default=50)
+    parser.add_argument('--posts', type=int, default=10000)
+    parser.add_argument('--follows', type=int, default=20000)
+    parser.add_argument('--comments', type=int, default=10000)
+    parser.add_argument('--output', help='Файл для отчёта JSON.')
+    options = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp()
+    source = os.path.join(directory, 'source.sqlite3')
+    started = datetime.now(timezone.utc)
+    try:
+        old_name = environment.setup(source)
+        try:
+            from django.db import connection
+            from .dataset import seed
+
+            counts = seed(
+                users=options.users, groups=options.groups,
+                posts=options.posts, follows=options.follows,
+                comments=options.comments,
+            )
+            connection.close()
+        finally:
+            environment.teardown(old_name, keep=True)
+        results = {}
+        for mode in MODES:
+            database = os.path.join(directory, f'{mode}.sqlite3')
+            with sqlite3.connect(source) as connection, sqlite3.connect(
+                database
+            ) as target:
+                connection.backup(target)
+            results[mode] = run(mode, database, options)
+            for role, result in results[mode].items():
+                print(
+                    f'{mode:>5} {role}: '
+                    f'{result["ops_per_second"]:8.1f} оп./с, '
+                    f'p50 {result["p50_ms"]} мс, '
+                    f'p99 {result["p99_ms"]} мс, '
+                    f'database is locked: {result["locked_errors"]}'
+                )
+    finally:
+        shutil.rmtree(directory)
+    if options.output:
+        with open(options.output, 'w') as output:
+            json.dump({
+                'commit': get_commit(),
+                'started': started.isoformat(),
+                'dataset': counts,
+                'options': vars(options),
+                'results': results,
+            }, output, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,342 @@
+import asyncio
+import contextvars
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib import auth
+from django.core.exceptions import ImproperlyConfigured
+from django.core.handlers.exception import response_for_exception
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connections
+from django.urls import Resolver404, resolve
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.module_loading import import_string
+
+from . import metrics, replicas
+from .middleware import MetricsMiddleware
+
+# Их работу AsyncViews делает сам.
+OWN_MIDDLEWARE = (
+    'core.middleware.ReplicaMiddleware', 'core.middleware.MetricsMiddleware',
+)
+
+# Конец ответа в очереди моста.
+END = object()
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    """Общий пул ASGI_THREADS потоков для синхронного кода."""
+    return ThreadPoolExecutor(
+        max_workers=settings.ASGI_THREADS, thread_name_prefix='asgi'
+    )
+
+
+async def run_sync(func, *args, **kwargs):
+    """Выполняет синхронный код (ORM, шаблоны) в пуле, не занимая цикл."""
+    def call():
+        stats = metrics.current()
+        try:
+            if stats is None:
+                return func(*args, **kwargs)
+            with metrics.count_queries(stats):
+                return func(*args, **kwargs)
+        finally:
+            # Как close_old_connections после запроса: соединение потока
+            # живёт CONN_MAX_AGE секунд и закрывается, если сломано.
+            for connection in connections.all():
+                connection.close_if_unusable_or_obsolete()
+
+    # Контекст (core.replicas) переходит в поток вместе с вызовом.
+    return await asyncio.get_event_loop().run_in_executor(
+        get_executor(), contextvars.copy_context().run, call
+    )
+
+
+def load_user(request):
+    """Загружает пользователя запроса в потоке, а не в цикле событий."""
+    request.user = auth.get_user(request)
+    return request.user
+
+
+async def send_status(send, status, body=b''):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'text/plain; charset=utf-8')],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def read_body(receive):
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        body.extend(message.get('body', b''))
+        if not message.get('more_body'):
+            return bytes(body)
+
+
+class Router:
+    """Отправляет HTTP-запрос приложению ASGI по точному пути.
+
+    Остальные запросы уходят в default. Lifespan поддерживается
+    без действий, чтобы сервер не ругался на его отсутствие.
+    """
+
+    def __init__(self, routes, default):
+        self.routes = routes
+        self.default = default
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                kind = message['type'].rsplit('.', 1)[-1]
+                await send({'type': f'lifespan.{kind}.complete'})
+                if kind == 'shutdown':
+                    return
+        application = self.routes.get(scope.get('path'), self.default)
+        await application(scope, receive, send)
+
+
+async def send_response(send, response, head=False):
+    headers = [
+        (name.lower().encode('latin1'), value.encode('latin1'))
+        for name, value in response.items()
+    ]
+    for cookie in response.cookies.values():
+        headers.append((b'set-cookie', cookie.output(header='').strip()
+                        .encode('latin1')))
+    await send({
+        'type': 'http.response.start',
+        'status': response.status_code,
+        'headers': headers,
+    })
+    await send({
+        'type': 'http.response.body',
+        'body': b'' if head else response.content,
+    })
+
+
+class AsyncViews:
+    """Выполняет асинхронные варианты view для GET и HEAD.
+
+    views — {имя URL: путь к корутине}. Запрос проходит MIDDLEWARE
+    через их process_request, process_view, process_exception
+    и process_response, каждый этап одним вызовом в пуле; реплики
+    и метрики AsyncViews ведёт сам. Остальные запросы уходят
+    в fallback.
+    """
+
+    def __init__(self, views, fallback):
+        self.views = {
+            name: import_string(path) for name, path in views.items()
+        }
+        self.fallback = fallback
+        self.middleware = []
+        for path in settings.MIDDLEWARE:
+            if path in OWN_MIDDLEWARE:
+                continue
+            middleware = import_string(path)
+            if not issubclass(middleware, MiddlewareMixin):
+                raise ImproperlyConfigured(
+                    f'AsyncViews: {path} должен наследовать MiddlewareMixin.'
+                )
+            self.middleware.append(middleware())
+
+    def match(self, scope):
+        if scope['type'] != 'http' or scope['method'] not in ('GET', 'HEAD'):
+            return None, None
+        try:
+            match = resolve(scope['path'])
+        except Resolver404:
+            return None, None
+        return match, self.views.get(match.view_name)
+
+    def process_request(self, request, view, match):
+        """Ответ middleware вместо view и число пройденных middleware."""
+        for passed, middleware in enumerate(self.middleware, 1):
+            if hasattr(middleware, 'process_request'):
+                response = middleware.process_request(request)
+                if response is not None:
+                    return response, passed
+        replicas.choose(request)
+        for middleware in self.middleware:
+            if hasattr(middleware, 'process_view'):
+                response = middleware.process_view(
+                    request, view, match.args, match.kwargs
+                )
+                if response is not None:
+                    return response, len(self.middleware)
+        return None, len(self.middleware)
+
+    def process_exception(self, request, exc):
+        for middleware in reversed(self.middleware):
+            if hasattr(middleware, 'process_exception'):
+                response = middleware.process_exception(request, exc)
+                if response is not None:
+                    return response
+        return response_for_exception(request, exc)
+
+    def process_response(self, request, response, passed):
+        for middleware in reversed(self.middleware[:passed]):
+            if hasattr(middleware, 'process_response'):
+                response = middleware.process_response(request, response)
+        return response
+
+    async def __call__(self, scope, receive, send):
+        match, view = self.match(scope)
+        if view is None:
+            await self.fallback(scope, receive, send)
+            return
+        body = await read_body(receive)
+        if body is None:
+            return
+        start = time.perf_counter()
+        request = WSGIRequest(get_environ(scope, body))
+        request.resolver_match = match
+        token = replicas.start()
+        stats = metrics.start_request()
+        passed = 0
+        try:
+            response, passed = await run_sync(
+                self.process_request, request, view, match
+            )
+            if response is None:
+                response = await view(request, *match.args, **match.kwargs)
+        except Exception as exc:
+            response = await run_sync(self.process_exception, request, exc)
+        try:
+            response = await run_sync(
+                self.process_response, request, response, passed
+            )
+        finally:
+            metrics.finish_request()
+            state = replicas.finish(token)
+        replicas.stick(state, response)
+        MetricsMiddleware.report(
+            request, response, time.perf_counter() - start, stats
+        )
+        await send_response(send, response, head=scope['method'] == 'HEAD')
+
+
+class WsgiBridge:
+    """Обслуживает приложение WSGI из пула потоков (по умолчанию общего).
+
+    Тело ответа передаётся по частям, поэтому потоковые ответы
+    не собираются в памяти целиком.
+    """
+
+    def __init__(self, application, executor=None):
+        self.application = application
+        self.executor = executor or get_executor()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return
+        body = await read_body(receive)
+        if body is None:
+            return
+        loop = asyncio.get_event_loop()
+        queue = asyncio.Queue(maxsize=8)
+        future = loop.run_in_executor(
+            self.executor, self.run, get_environ(scope, body), loop, queue
+        )
+        finished = False
+        try:
+            start = await queue.get()
+            finished = start is END
+            if finished:
+                await future
+                return
+            status, headers = start
+            await send({
+                'type': 'http.response.start',
+                'status': status,
+                'headers': headers,
+            })
+            while True:
+                chunk = await queue.get()
+                finished = chunk is END
+                if finished:
+                    break
+                await send({
+                    'type': 'http.response.body',
+                    'body': chunk,
+                    'more_body': True,
+                })
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            # Если клиент ушёл, поток всё равно должен дописать ответ.
+            while not finished:
+                finished = await queue.get() is END
+            await future
+
+    def run(self, environ, loop, queue):
+        def put(item):
+            asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['start'] = (int(status.split(' ', 1)[0]), [
+                (name.lower().encode('latin1'), value.encode('latin1'))
+                for name, value in headers
+            ])
+
+        try:
+            result = self.application(environ, start_response)
+            try:
+                started = False
+                for chunk in result:
+                    if not started:
+                        put(response['start'])
+                        started = True
+                    if chunk:
+                        put(chunk)
+                if not started:
+                    put(response['start'])
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+        finally:
+            put(END)
+
+
+def get_environ(scope, body):
+    """Окружение WSGI (PEP 3333) для запроса ASGI."""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f'HTTP/{scope.get("http_version", "1.1")}',
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin1').upper().replace('-', '_')
+        value = value.decode('latin1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+            continue
+        key = f'HTTP_{name}'
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
@@ -0,0 +1,326 @@
+import math
+import pickle
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends import locmem
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from . import metrics
+
+MISSING = object()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+CREATE TABLE IF NOT EXISTS cache_stats (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    entries INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO cache_stats VALUES (1, 0, 0);
+CREATE TRIGGER IF NOT EXISTS cache_insert AFTER INSERT ON cache BEGIN
+    UPDATE cache_stats SET entries = entries + 1, size = size + new.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_update AFTER UPDATE OF size ON cache BEGIN
+    UPDATE cache_stats SET size = size - old.size + new.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_delete AFTER DELETE ON cache BEGIN
+    UPDATE cache_stats SET entries = entries - 1, size = size - old.size;
+END;
+"""
+UPSERT_SQL = """
+INSERT INTO cache (key, value, expires, accessed, size)
+VALUES (:key, :value, :expires, :now, :size)
+ON CONFLICT (key) DO UPDATE SET
+    value = excluded.value, expires = excluded.expires,
+    accessed = excluded.accessed, size = excluded.size
+"""
+# Перезаписывает только просроченное значение.
+ADD_SQL = UPSERT_SQL + """
+WHERE cache.expires IS NOT NULL AND cache.expires <= :now
+"""
+
+
+class MeasuredCacheMixin:
+    """Считает попадания и промахи get() в замерах текущего запроса.
+
+    get_many() и get_or_set() базового класса вызывают get().
+    """
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, MISSING, version)
+        stats = metrics.current()
+        if stats is not None:
+            if value is MISSING:
+                stats.cache_misses += 1
+            else:
+                stats.cache_hits += 1
+        return default if value is MISSING else value
+
+
+class LocMemCache(MeasuredCacheMixin, locmem.LocMemCache):
+    pass
+
+
+class BaseSQLiteCache(BaseCache):
+    """Кеш в файле SQLite, общий для всех процессов на машине.
+
+    LOCATION — путь к файлу. Помимо MAX_ENTRIES и CULL_FREQUENCY
+    понимает OPTIONS['MAX_SIZE'] — предел суммарного размера значений
+    в байтах. При превышении любого предела удаляются просроченные
+    записи, а затем давно не читанные (LRU). Время чтения
+    обновляется не чаще раза в OPTIONS['LRU_RESOLUTION'] секунд,
+    чтобы попадание в кеш почти никогда не было записью.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.location = location
+        self.max_size = options.get('MAX_SIZE')
+        self.lru_resolution = options.get('LRU_RESOLUTION', 1)
+        self.busy_timeout = options.get('BUSY_TIMEOUT', 5)
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.location, timeout=self.busy_timeout,
+                isolation_level=None, check_same_thread=False,
+            )
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.execute('PRAGMA synchronous = NORMAL')
+            connection.executescript(SCHEMA)
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def transaction(self):
+        """BEGIN IMMEDIATE: запись блокируется сразу, до чтения."""
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def encode(self, value):
+        # Целые хранятся как есть, чтобы incr не распаковывал значение.
+        if type(value) is int:
+            return value
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def decode(self, value):
+        return value if isinstance(value, int) else pickle.loads(value)
+
+    def get_size(self, value):
+        return len(value) if isinstance(value, bytes) else 8
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        now = time.time()
+        row = self.connection.execute(
+            'SELECT value, accessed FROM cache '
+            'WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (key, now)
+        ).fetchone()
+        if row is None:
+            return default
+        value, accessed = row
+        if accessed < now - self.lru_resolution:
+            self.connection.execute(
+                'UPDATE cache SET accessed = ? WHERE key = ?', (now, key)
+            )
+        return self.decode(value)
+
+    def write(self, sql, key, value, timeout):
+        value = self.encode(value)
+        now = time.time()
+        with self.transaction() as connection:
+            cursor = connection.execute(sql, {
+                'key': key, 'value': value, 'now': now,
+                'expires': self.get_backend_timeout(timeout),
+                'size': self.get_size(value),
+            })
+            written = cursor.rowcount > 0
+            if written:
+                self.cull(connection, now)
+        return written
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self.write(UPSERT_SQL, key, value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self.write(ADD_SQL, key, value, timeout)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        now = time.time()
+        cursor = self.connection.execute(
+            'UPDATE cache SET expires = ?, accessed = ? '
+            'WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), now, key, now)
+        )
+        return cursor.rowcount > 0
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        now = time.time()
+        with self.transaction() as connection:
+            row = connection.execute(
+                'SELECT value FROM cache '
+                'WHERE key = ? AND (expires IS NULL OR expires > ?)',
+                (key, now)
+            ).fetchone()
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = self.decode(row[0]) + delta
+            encoded = self.encode(value)
+            connection.execute(
+                'UPDATE cache SET value = ?, size = ?, accessed = ? '
+                'WHERE key = ?',
+                (encoded, self.get_size(encoded), now, key)
+            )
+        return value
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self.connection.execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self.connection.execute(
+            'SELECT 1 FROM cache '
+            'WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (key, time.time())
+        ).fetchone() is not None
+
+    def clear(self):
+        self.connection.execute('DELETE FROM cache')
+
+    def cull(self, connection, now):
+        entries, size = connection.execute(
+            'SELECT entries, size FROM cache_stats'
+        ).fetchone()
+        if not self.is_full(entries, size):
+            return
+        connection.execute(
+            'DELETE FROM cache WHERE expires IS NOT NULL AND expires <= ?',
+            (now,)
+        )
+        entries, size = connection.execute(
+            'SELECT entries, size FROM cache_stats'
+        ).fetchone()
+        while entries and self.is_full(entries, size):
+            count = max(entries // self._cull_frequency, 1)
+            connection.execute(
+                'DELETE FROM cache WHERE key IN ('
+                'SELECT key FROM cache ORDER BY accessed LIMIT ?)',
+                (count,)
+            )
+            entries, size = connection.execute(
+                'SELECT entries, size FROM cache_stats'
+            ).fetchone()
+
+    def is_full(self, entries, size):
+        return entries > self._max_entries or (
+            self.max_size is not None and size > self.max_size
+        )
+
+    def close(self, **kwargs):
+        # Соединение остаётся открытым на всё время жизни потока.
+        pass
+
+
+class SQLiteCache(MeasuredCacheMixin, BaseSQLiteCache):
+    pass
+
+
+def get_or_recompute(key, compute, timeout, generation=None, name='default'):
+    """Значение из кеша, пересчитываемое одним запросом из всех.
+
+    Пересчёт начинается с вероятностью, растущей к концу timeout
+    (XFetch: чем дольше считается значение, тем раньше), или сразу,
+    если сменилось поколение generation. Пересчитывает тот, кто взял
+    аренду ключа; остальные отдают прежнее значение, а если его нет —
+    ждут результат до CACHE_LEASE_WAIT секунд. Устаревшее значение
+    хранится ещё CACHE_STALE_TIMEOUT секунд после timeout.
+    """
+    entry = cache.get(key)
+    if entry is not None:
+        value, entry_generation, delta, expires = entry
+        early = delta * settings.CACHE_EARLY_EXPIRY_BETA * math.log(
+            1 - random.random()
+        )
+        if entry_generation == generation and time.time() - early < expires:
+            return value
+    lease_key = f'{key}:lease'
+    if cache.add(lease_key, True, settings.CACHE_LEASE_TIMEOUT):
+        try:
+            return recompute(key, compute, timeout, generation, name)
+        finally:
+            cache.delete(lease_key)
+    if entry is not None:
+        coalesce(key, name)
+        return entry[0]
+    deadline = time.monotonic() + settings.CACHE_LEASE_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(settings.CACHE_LEASE_POLL)
+        entry = cache.get(key)
+        if entry is not None and entry[1] == generation:
+            coalesce(key, name)
+            return entry[0]
+    return recompute(key, compute, timeout, generation, name)
+
+
+def recompute(key, compute, timeout, generation, name):
+    started = time.time()
+    value = compute()
+    finished = time.time()
+    cache.set(
+        key, (value, generation, finished - started, finished + timeout),
+        timeout + settings.CACHE_STALE_TIMEOUT
+    )
+    metrics.increment('yatube_cache_recomputes_total', {'cache': name})
+    return value
+
+
+def coalesce(key, name):
+    """Отмечает запрос, обошедшийся без своего пересчёта."""
+    counter_key = f'{key}:coalesced'
+    cache.add(counter_key, 0, None)
+    try:
+        cache.incr(counter_key)
+    except ValueError:
+        pass
+    metrics.increment('yatube_cache_coalesced_total', {'cache': name})
+
+
+def get_coalesced(key):
+    """Сколько пересчётов key было сэкономлено."""
+    return cache.get(f'{key}:coalesced', 0)
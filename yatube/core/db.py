@@ -0,0 +1,18 @@
+from django.db import connections, router
+
+
+def bulk_create(model, objects, batch_size=None, **kwargs):
+    """bulk_create пачками, которые примет база.
+
+    bulk_create в Django 2.2 не уменьшает переданный batch_size
+    до предела базы, а SQLite не принимает больше 999 параметров
+    в одном INSERT. Поэтому пачка не больше bulk_batch_size.
+    """
+    objects = list(objects)
+    connection = connections[router.db_for_write(model)]
+    limit = connection.ops.bulk_batch_size(
+        model._meta.concrete_fields, objects
+    )
+    if batch_size is not None:
+        limit = min(batch_size, limit)
+    return model.objects.bulk_create(objects, batch_size=limit, **kwargs)
@@ -0,0 +1,41 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from core import replicas
+
+
+class Command(BaseCommand):
+    help = (
+        'Копирует базу default в реплики SQLite — заменитель репликации '
+        'для локальной проверки READ_REPLICAS.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'aliases', nargs='*',
+            help='Реплики; по умолчанию READ_REPLICAS.'
+        )
+        parser.add_argument(
+            '--interval', type=float,
+            help='Повторять каждые столько секунд — отставание реплики.'
+        )
+
+    def handle(self, *args, **options):
+        aliases = options['aliases'] or settings.READ_REPLICAS
+        if not aliases:
+            raise CommandError('Не указаны реплики и пуст READ_REPLICAS.')
+        for alias in aliases:
+            if alias not in connections:
+                raise CommandError(f'Нет базы {alias} в DATABASES.')
+            if connections[alias].vendor != 'sqlite':
+                raise CommandError(f'{alias}: поддерживается только SQLite.')
+        while True:
+            for alias in aliases:
+                replicas.replicate(alias)
+                self.stdout.write(f'Скопировано в {alias}.')
+            if options['interval'] is None:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,169 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+_stats = ContextVar('request_stats', default=None)
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+
+HELP = {
+    'yatube_request_duration_seconds': 'Время обработки запроса.',
+    'yatube_request_queries': 'Число SQL-запросов на запрос.',
+    'yatube_request_sql_seconds': 'Время SQL-запросов на запрос.',
+    'yatube_request_template_seconds': 'Время отрисовки шаблонов на запрос.',
+    'yatube_cache_requests_total': 'Обращения к кешу по результату.',
+    'yatube_cache_recomputes_total': 'Пересчёты значений get_or_recompute.',
+    'yatube_cache_coalesced_total': (
+        'Запросы, получившие значение без своего пересчёта.'
+    ),
+    'yatube_write_buffer_rows_total': 'Строки, принятые в буфер записи.',
+    'yatube_write_buffer_flushes_total': 'Сохранённые пачки буфера записи.',
+}
+
+
+class RequestStats:
+    """Замеры одного запроса, накапливаются в его контексте."""
+
+    def __init__(self):
+        self.queries = []
+        self.query_count = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.rendering = False
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        """execute_wrapper: считает запросы и их время."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.query_count += 1
+            self.sql_time += elapsed
+            if len(self.queries) < settings.METRICS_TRACE_QUERIES:
+                self.queries.append((sql, elapsed))
+
+
+def start_request():
+    stats = RequestStats()
+    _stats.set(stats)
+    return stats
+
+
+def finish_request():
+    _stats.set(None)
+
+
+def current():
+    """Замеры текущего запроса или None вне запроса.
+
+    Контекст (core.asgi.run_sync) переходит в потоки пула, поэтому
+    замеры асинхронного view собираются со всех его потоков.
+    """
+    return _stats.get()
+
+
+@contextmanager
+def count_queries(stats):
+    """Считает в stats SQL соединений текущего потока."""
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(stats))
+        yield
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+def observe(name, labels, value, buckets=None):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram(
+                buckets or settings.METRICS_BUCKETS
+            )
+        histogram.observe(value)
+
+
+def increment(name, labels, amount=1):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+def format_labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ''
+    escaped = (
+        (key, str(value).replace('\\', r'\\').replace('"', r'\"'))
+        for key, value in pairs
+    )
+    return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+
+def format_bound(bound):
+    return f'{bound:g}'
+
+
+def render():
+    """Все метрики процесса в текстовом формате Prometheus."""
+    with _lock:
+        histograms = sorted(
+            (key, list(h.counts), h.buckets, h.total, h.count)
+            for key, h in _histograms.items()
+        )
+        counters = sorted(_counters.items())
+    lines = []
+    described = set()
+
+    def describe(name, kind):
+        if name not in described:
+            described.add(name)
+            lines.append(f'# HELP {name} {HELP.get(name, name)}')
+            lines.append(f'# TYPE {name} {kind}')
+
+    for (name, labels), counts, buckets, total, count in histograms:
+        describe(name, 'histogram')
+        cumulative = 0
+        for bound, bucket_count in zip(buckets, counts):
+            cumulative += bucket_count
+            lines.append(
+                f'{name}_bucket'
+                f'{format_labels(labels, le=format_bound(bound))} '
+                f'{cumulative}'
+            )
+        lines.append(
+            f'{name}_bucket{format_labels(labels, le="+Inf")} {count}'
+        )
+        lines.append(f'{name}_sum{format_labels(labels)} {total}')
+        lines.append(f'{name}_count{format_labels(labels)} {count}')
+    for (name, labels), value in counters:
+        describe(name, 'counter')
+        lines.append(f'{name}{format_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,105 @@
+import logging
+import random
+import time
+
+from django.conf import settings
+
+from . import metrics, replicas
+
+logger = logging.getLogger('core.slow_requests')
+
+
+def get_view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else 'unresolved'
+
+
+class MetricsMiddleware:
+    """Собирает время, SQL, шаблоны и кеш по каждому view.
+
+    Гистограммы живут в памяти процесса и отдаются в /metrics/,
+    медленные запросы выборочно пишутся в журнал core.slow_requests.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = metrics.start_request()
+        start = time.perf_counter()
+        try:
+            with metrics.count_queries(stats):
+                response = self.get_response(request)
+        finally:
+            metrics.finish_request()
+        self.report(request, response, time.perf_counter() - start, stats)
+        return response
+
+    @classmethod
+    def report(cls, request, response, duration, stats):
+        """Записывает замеры запроса; его же вызывает core.asgi."""
+        view = get_view_name(request)
+        cls.record(view, duration, stats)
+        if (
+            duration >= settings.METRICS_SLOW_REQUEST_THRESHOLD
+            and random.random() < settings.METRICS_SLOW_REQUEST_SAMPLE_RATE
+        ):
+            cls.trace(request, response, view, duration, stats)
+
+    @staticmethod
+    def record(view, duration, stats):
+        labels = {'view': view}
+        metrics.observe('yatube_request_duration_seconds', labels, duration)
+        metrics.observe(
+            'yatube_request_queries', labels, stats.query_count,
+            buckets=settings.METRICS_QUERY_BUCKETS
+        )
+        metrics.observe('yatube_request_sql_seconds', labels, stats.sql_time)
+        metrics.observe(
+            'yatube_request_template_seconds', labels, stats.template_time
+        )
+        for result, count in (
+            ('hit', stats.cache_hits), ('miss', stats.cache_misses)
+        ):
+            if count:
+                metrics.increment(
+                    'yatube_cache_requests_total',
+                    {'view': view, 'result': result}, count
+                )
+
+    @staticmethod
+    def trace(request, response, view, duration, stats):
+        queries = '\n'.join(
+            f'  {elapsed * 1000:8.2f} мс  {sql}'
+            for sql, elapsed in stats.queries
+        )
+        logger.warning(
+            '%s %s (%s) %s: %.0f мс, SQL %d за %.0f мс, шаблоны %.0f мс, '
+            'кеш %d/%d\n%s',
+            request.method, request.get_full_path(), view,
+            response.status_code, duration * 1000, stats.query_count,
+            stats.sql_time * 1000, stats.template_time * 1000,
+            stats.cache_hits, stats.cache_hits + stats.cache_misses,
+            queries,
+        )
+
+
+class ReplicaMiddleware:
+    """Включает чтение с реплик для view из READ_REPLICA_VIEWS.
+
+    Стоит первым, чтобы записи сессии в ответе тоже учитывались.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = replicas.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            state = replicas.finish(token)
+        return replicas.stick(state, response)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        replicas.choose(request)
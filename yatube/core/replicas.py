@@ -0,0 +1,121 @@
+"""Чтение с реплик для страниц из READ_REPLICA_VIEWS.
+
+Реплика выбирается на весь запрос: GET и HEAD к view из
+READ_REPLICA_VIEWS читают с одной из READ_REPLICAS, всё остальное
+и любые записи идут в default. После записи клиент получает cookie
+READ_REPLICA_COOKIE и следующие READ_REPLICA_STICKY_SECONDS секунд
+читает с default, чтобы сразу видеть свою запись или комментарий,
+пока реплика догоняет.
+"""
+import random
+import sqlite3
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_state = ContextVar('replica_state', default=None)
+
+# Сессии всегда читаются с default: только что созданная при входе
+# сессия может ещё не дойти до реплики.
+PRIMARY_APPS = {'sessions'}
+
+
+class RoutingState:
+    def __init__(self):
+        self.replica = None
+        self.wrote = False
+
+
+def start():
+    """Начинает запрос; вернуть результат нужно в finish()."""
+    return _state.set(RoutingState())
+
+
+def finish(token):
+    """Заканчивает запрос и возвращает его состояние."""
+    state = _state.get()
+    _state.reset(token)
+    return state
+
+
+def is_sticky(request):
+    try:
+        until = float(request.COOKIES.get(settings.READ_REPLICA_COOKIE, 0))
+    except ValueError:
+        return False
+    return until > time.time()
+
+
+def choose(request):
+    """Направляет чтение запроса на реплику, если это разрешено."""
+    state = _state.get()
+    match = getattr(request, 'resolver_match', None)
+    if (
+        state is None or not settings.READ_REPLICAS or match is None
+        or request.method not in ('GET', 'HEAD')
+        or match.view_name not in settings.READ_REPLICA_VIEWS
+        or is_sticky(request)
+    ):
+        return None
+    state.replica = random.choice(settings.READ_REPLICAS)
+    return state.replica
+
+
+def stick(state, response):
+    """После записи читаем с default ещё несколько секунд."""
+    if state is not None and state.wrote:
+        seconds = settings.READ_REPLICA_STICKY_SECONDS
+        response.set_cookie(
+            settings.READ_REPLICA_COOKIE, str(time.time() + seconds),
+            max_age=seconds, httponly=True, samesite='Lax',
+        )
+    return response
+
+
+def get_read_alias():
+    """База, с которой сейчас читает текущий запрос."""
+    state = _state.get()
+    if state is None or state.replica is None or state.wrote:
+        return DEFAULT_DB_ALIAS
+    return state.replica
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in PRIMARY_APPS:
+            return DEFAULT_DB_ALIAS
+        return get_read_alias()
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики — копии default, объекты с разных баз совместимы.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.READ_REPLICAS:
+            return False
+        return None
+
+
+def replicate(alias):
+    """Заменитель репликации для SQLite: копирует default в реплику.
+
+    Использует backup API, поэтому открытые соединения реплики
+    видят новую копию без переподключения.
+    """
+    source = sqlite3.connect(
+        connections[DEFAULT_DB_ALIAS].settings_dict['NAME']
+    )
+    target = sqlite3.connect(connections[alias].settings_dict['NAME'])
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
@@ -0,0 +1,42 @@
+"""SQLite с настройками для одновременных чтения и записи.
+
+Подключается как ENGINE 'core.sqlite3'. Помимо параметров
+sqlite3.connect OPTIONS понимает:
+
+- 'pragmas' — PRAGMA, выполняемые на каждом новом соединении
+  (journal_mode, synchronous, mmap_size, cache_size, busy_timeout…);
+- 'transaction_mode' — режим BEGIN для atomic(): DEFERRED, IMMEDIATE
+  или EXCLUSIVE.
+
+В режиме DEFERRED транзакция, начавшая с чтения, при первой записи
+повышает блокировку и получает «database is locked» сразу, минуя
+busy_timeout, если другое соединение уже пишет. IMMEDIATE берёт
+блокировку на запись в начале транзакции и ждёт её busy_timeout.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        self.pragmas = kwargs.pop('pragmas', {})
+        self.transaction_mode = kwargs.pop(
+            'transaction_mode', 'DEFERRED'
+        ).upper()
+        if self.transaction_mode not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                f'transaction_mode должен быть одним из {TRANSACTION_MODES}.'
+            )
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            connection.execute(f'PRAGMA {name} = {value}')
+        return connection
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f'BEGIN {self.transaction_mode}')
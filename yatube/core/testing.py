@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+
+def isolate_cache(location=None):
+    """Уводит кеш default процесса от общего файла BASE_DIR/cache.sqlite3.
+
+    location — отдельный файл SQLite, без него кеш хранится в памяти.
+    Вызывается до первого обращения к кешу.
+    """
+    if location:
+        settings.CACHES['default'] = {
+            **settings.CACHES['default'], 'LOCATION': location,
+        }
+    else:
+        settings.CACHES['default'] = {'BACKEND': 'core.cache.LocMemCache'}
+
+
+class TestRunner(DiscoverRunner):
+    """manage.py test с кешем в памяти."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        isolate_cache()
@@ -0,0 +1,489 @@
+import asyncio
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core import db, metrics, replicas
+from core.cache import SQLiteCache, get_coalesced, get_or_recompute
+from core.sqlite3.base import DatabaseWrapper
+from posts.models import Follow, Group, Post
+
+User = get_user_model()
+
+
+class SQLiteCacheTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def make_cache(self, **options):
+        return SQLiteCache(
+            os.path.join(self.directory, 'cache.sqlite3'),
+            {'OPTIONS': options},
+        )
+
+    def test_set_get_delete(self):
+        cache = self.make_cache()
+        cache.set('key', {'value': [1, 2]})
+        self.assertEqual(cache.get('key'), {'value': [1, 2]})
+        self.assertTrue(cache.has_key('key'))
+        cache.delete('key')
+        self.assertIsNone(cache.get('key'))
+        self.assertEqual(cache.get('key', 'default'), 'default')
+
+    def test_shared_between_instances(self):
+        self.make_cache().set('key', 'value')
+        self.assertEqual(self.make_cache().get('key'), 'value')
+        self.make_cache().clear()
+        self.assertIsNone(self.make_cache().get('key'))
+
+    def test_expiry_and_add(self):
+        cache = self.make_cache()
+        cache.set('key', 'old', 0.05)
+        self.assertFalse(cache.add('key', 'new'))
+        time.sleep(0.1)
+        self.assertIsNone(cache.get('key'))
+        self.assertFalse(cache.has_key('key'))
+        self.assertTrue(cache.add('key', 'new'))
+        self.assertEqual(cache.get('key'), 'new')
+        self.assertTrue(cache.touch('key', 0.05))
+        time.sleep(0.1)
+        self.assertFalse(cache.touch('key'))
+
+    def test_versions(self):
+        cache = self.make_cache()
+        cache.set('key', 'first', version=1)
+        cache.set('key', 'second', version=2)
+        self.assertEqual(cache.get('key', version=1), 'first')
+        self.assertEqual(cache.incr_version('key', version=2), 3)
+        self.assertEqual(cache.get('key', version=3), 'second')
+        self.assertIsNone(cache.get('key', version=2))
+
+    def test_incr_is_atomic(self):
+        cache = self.make_cache()
+        cache.set('counter', 0)
+
+        def increment():
+            for _ in range(50):
+                cache.incr('counter')
+
+        threads = [threading.Thread(target=increment) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(cache.get('counter'), 200)
+        self.assertEqual(cache.decr('counter', 10), 190)
+        with self.assertRaises(ValueError):
+            cache.incr('missing')
+
+    def test_cull_least_recently_used(self):
+        cache = self.make_cache(
+            MAX_ENTRIES=3, CULL_FREQUENCY=3, LRU_RESOLUTION=0
+        )
+        for key in ('a', 'b', 'c'):
+            cache.set(key, key)
+        cache.get('a')
+        cache.set('d', 'd')
+        self.assertIsNone(cache.get('b'))
+        for key in ('a', 'c', 'd'):
+            self.assertEqual(cache.get(key), key)
+
+    def test_cull_by_size(self):
+        cache = self.make_cache(MAX_SIZE=3000, LRU_RESOLUTION=0)
+        for number in range(5):
+            cache.set(number, b'x' * 1000)
+        self.assertIsNone(cache.get(0))
+        self.assertIsNotNone(cache.get(4))
+
+
+class SQLiteBackendTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def make_connection(self, **options):
+        wrapper = DatabaseWrapper({
+            **connection.settings_dict,
+            'NAME': os.path.join(self.directory, 'db.sqlite3'),
+            'OPTIONS': options,
+        }, alias='tuning')
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def pragma(self, wrapper, name):
+        with wrapper.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_on_new_connection(self):
+        wrapper = self.make_connection(pragmas={
+            'journal_mode': 'WAL', 'synchronous': 'NORMAL',
+            'busy_timeout': 1234, 'cache_size': -4000,
+        })
+        self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma(wrapper, 'synchronous'), 1)
+        self.assertEqual(self.pragma(wrapper, 'busy_timeout'), 1234)
+        self.assertEqual(self.pragma(wrapper, 'cache_size'), -4000)
+        self.assertEqual(self.pragma(wrapper, 'foreign_keys'), 1)
+
+    def test_immediate_transaction_takes_write_lock(self):
+        options = {
+            'transaction_mode': 'IMMEDIATE',
+            'pragmas': {'journal_mode': 'WAL', 'busy_timeout': 10},
+        }
+        writer = self.make_connection(**options)
+        other = self.make_connection(**options)
+        writer.ensure_connection()
+        writer._start_transaction_under_autocommit()
+        self.addCleanup(writer.connection.rollback)
+        with self.assertRaisesMessage(OperationalError, 'locked'):
+            other.ensure_connection()
+            other._start_transaction_under_autocommit()
+        self.assertEqual(self.pragma(other, 'user_version'), 0)
+
+    def test_unknown_transaction_mode(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.make_connection(transaction_mode='LAZY').ensure_connection()
+
+
+class BulkCreateTest(TestCase):
+    def test_batch_size_capped_by_backend(self):
+        groups = [
+            Group(title=f'Группа {n}', slug=f'group-{n}', description='')
+            for n in range(400)
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            db.bulk_create(Group, groups, batch_size=10000)
+        self.assertEqual(Group.objects.count(), 400)
+        self.assertGreater(len(queries), 1)
+
+
+class RecomputeTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        return self.calls
+
+    def test_value_is_cached_until_generation_changes(self):
+        self.assertEqual(get_or_recompute('key', self.compute, 60, 1), 1)
+        self.assertEqual(get_or_recompute('key', self.compute, 60, 1), 1)
+        self.assertEqual(get_or_recompute('key', self.compute, 60, 2), 2)
+        self.assertEqual(get_coalesced('key'), 0)
+
+    def test_stale_value_is_served_while_leased(self):
+        get_or_recompute('key', self.compute, 60, 1)
+        cache.add('key:lease', True)
+        self.assertEqual(get_or_recompute('key', self.compute, 60, 2), 1)
+        self.assertEqual(get_or_recompute('key', self.compute, 60, 2), 1)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(get_coalesced('key'), 2)
+        cache.delete('key:lease')
+        self.assertEqual(get_or_recompute('key', self.compute, 60, 2), 2)
+
+    @override_settings(CACHE_LEASE_WAIT=0.05)
+    def test_cold_miss_waits_for_leaseholder(self):
+        cache.add('key:lease', True)
+        timer = threading.Timer(
+            0.01, lambda: cache.set('key', ('ready', 1, 0, time.time() + 60))
+        )
+        timer.start()
+        self.assertEqual(get_or_recompute('key', self.compute, 60, 1), 'ready')
+        timer.join()
+        self.assertEqual(self.calls, 0)
+        self.assertEqual(get_coalesced('key'), 1)
+
+    @override_settings(CACHE_LEASE_WAIT=0)
+    def test_cold_miss_computes_when_leaseholder_is_slow(self):
+        cache.add('key:lease', True)
+        self.assertEqual(get_or_recompute('key', self.compute, 60, 1), 1)
+
+    def test_early_expiry(self):
+        cache.set('key', ('old', 1, 10, time.time() + 1))
+        values = {
+            get_or_recompute('key', self.compute, 60, 1) for _ in range(20)
+        }
+        self.assertIn(1, values)
+
+
+class MetricsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.admin = User.objects.create_user(username='admin', is_staff=True)
+        cls.user = User.objects.create_user(username='user')
+        Post.objects.create(author=cls.user, text='Запись')
+
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+
+    def get_metrics(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_metrics_are_admin_only(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_request_histograms(self):
+        self.client.get(reverse('posts:index'))
+        text = self.get_metrics()
+        self.assertIn('# TYPE yatube_request_duration_seconds histogram', text)
+        self.assertIn(
+            'yatube_request_duration_seconds_count{view="posts:index"} 1',
+            text
+        )
+        self.assertIn(
+            'yatube_request_queries_bucket{view="posts:index",le="2"} 1',
+            text
+        )
+        self.assertIn(
+            'yatube_request_template_seconds_count{view="posts:index"} 1',
+            text
+        )
+
+    def test_cache_hits_and_misses(self):
+        self.client.get(reverse('posts:index'))
+        self.client.get(reverse('posts:index'))
+        text = self.get_metrics()
+        # Поколение кеша лент, страница ленты и карточка записи:
+        # первый запрос промахивается по всем трём и перечитывает
+        # созданное поколение, второй попадает во все три.
+        self.assertIn(
+            'yatube_cache_requests_total{result="miss",view="posts:index"} 3',
+            text
+        )
+        self.assertIn(
+            'yatube_cache_requests_total{result="hit",view="posts:index"} 4',
+            text
+        )
+
+    @override_settings(
+        METRICS_SLOW_REQUEST_THRESHOLD=0,
+        METRICS_SLOW_REQUEST_SAMPLE_RATE=1,
+    )
+    def test_slow_request_trace(self):
+        with self.assertLogs('core.slow_requests') as logs:
+            self.client.get(reverse('posts:index'))
+        self.assertIn('GET / (posts:index) 200', logs.output[0])
+        self.assertIn('FROM "posts_post"', logs.output[0])
+
+
+class AsgiTest(TransactionTestCase):
+    def request(self, path, headers=()):
+        from yatube.asgi import application
+
+        async def run():
+            sent = []
+            messages = [{'type': 'http.request', 'body': b''}]
+
+            async def receive():
+                return messages.pop(0) if messages else {
+                    'type': 'http.disconnect'
+                }
+
+            async def send(message):
+                sent.append(message)
+
+            await application({
+                'type': 'http',
+                'method': 'GET',
+                'path': path,
+                'query_string': b'',
+                'headers': [(b'host', b'testserver'), *headers],
+                'server': ('testserver', 80),
+            }, receive, send)
+            return sent
+
+        sent = asyncio.run(run())
+        self.assertFalse(sent[-1].get('more_body', False))
+        body = b''.join(message.get('body', b'') for message in sent[1:])
+        return sent[0]['status'], dict(sent[0]['headers']), body.decode()
+
+    def login(self, user):
+        client = Client()
+        client.force_login(user)
+        cookie = client.cookies[settings.SESSION_COOKIE_NAME].value
+        return [(
+            b'cookie', f'{settings.SESSION_COOKIE_NAME}={cookie}'.encode()
+        )]
+
+    @override_settings(ALLOWED_HOSTS=['testserver'])
+    def test_async_feeds(self):
+        author = User.objects.create_user(username='author')
+        reader = User.objects.create_user(username='reader')
+        Group.objects.create(title='Группа', slug='group')
+        Post.objects.create(
+            author=author, group_id=1, text='Запись через ASGI'
+        )
+        Follow.objects.create(user=reader, author=author)
+        headers = self.login(reader)
+        for path in ('/', '/group/group/', '/profile/author/', '/follow/'):
+            with self.subTest(path=path):
+                status, response_headers, body = self.request(path, headers)
+                self.assertEqual(status, 200)
+                self.assertIn('Запись через ASGI', body)
+                self.assertIn('Пользователь: reader', body)
+                self.assertEqual(
+                    response_headers[b'x-frame-options'], b'SAMEORIGIN'
+                )
+                # Заголовок SessionMiddleware: MIDDLEWARE выполнены.
+                self.assertEqual(response_headers[b'vary'], b'Cookie')
+        self.assertIn(settings.EVENTS_PATH, body)
+
+    @override_settings(ALLOWED_HOSTS=['testserver'])
+    def test_async_metrics(self):
+        metrics.reset()
+        Post.objects.create(
+            author=User.objects.create_user(username='author'), text='Запись'
+        )
+        self.request('/')
+        text = metrics.render()
+        self.assertIn(
+            'yatube_request_duration_seconds_count{view="posts:index"} 1',
+            text
+        )
+        self.assertNotIn(
+            'yatube_request_queries_bucket{view="posts:index",le="1"} 1',
+            text
+        )
+        self.assertIn(
+            'yatube_request_template_seconds_count{view="posts:index"} 1',
+            text
+        )
+
+    @override_settings(ALLOWED_HOSTS=['testserver'])
+    def test_async_errors(self):
+        status, headers, _ = self.request('/follow/')
+        self.assertEqual(status, 302)
+        self.assertTrue(headers[b'location'].startswith(b'/auth/login/'))
+        status, _, _ = self.request('/group/missing/')
+        self.assertEqual(status, 404)
+
+    @override_settings(ALLOWED_HOSTS=['testserver'])
+    def test_other_pages_go_through_wsgi(self):
+        status, _, body = self.request('/about/author/')
+        self.assertEqual(status, 200)
+        status, _, _ = self.request(settings.EVENTS_PATH)
+        self.assertEqual(status, 403)
+
+
+@override_settings(READ_REPLICAS=['replica'])
+class ReplicaTest(TransactionTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='user')
+        self.post = Post.objects.create(text='Запись', author=self.user)
+        self.client.force_login(self.user)
+
+    def get(self, url):
+        with CaptureQueriesContext(connections['replica']) as replica, \
+                CaptureQueriesContext(connection) as primary:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(replica), [
+            query['sql'] for query in primary
+            if 'django_session' not in query['sql']
+        ]
+
+    def test_feed_reads_go_to_replica(self):
+        for url in (
+            reverse('posts:index'),
+            reverse('posts:profile', kwargs={'username': 'user'}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+            reverse('posts:follow_index'),
+        ):
+            with self.subTest(url=url):
+                replica, primary = self.get(url)
+                self.assertGreater(replica, 0)
+                self.assertEqual(primary, [])
+
+    def test_other_views_read_from_primary(self):
+        replica, primary = self.get(reverse('posts:post_create'))
+        self.assertEqual(replica, 0)
+
+    @override_settings(READ_REPLICAS=[])
+    def test_disabled_without_replicas(self):
+        replica, primary = self.get(reverse('posts:index'))
+        self.assertEqual(replica, 0)
+        self.assertNotEqual(primary, [])
+
+    def test_reads_stick_to_primary_after_write(self):
+        response = self.client.post(
+            reverse('posts:post_create'), {'text': 'Новая запись'}
+        )
+        self.assertIn(settings.READ_REPLICA_COOKIE, response.cookies)
+        replica, primary = self.get(reverse('posts:index'))
+        self.assertEqual(replica, 0)
+        self.assertNotEqual(primary, [])
+        self.client.cookies[settings.READ_REPLICA_COOKIE] = '0'
+        replica, primary = self.get(reverse('posts:index'))
+        self.assertGreater(replica, 0)
+
+    def test_feed_cache_is_separate_for_replica(self):
+        self.get(reverse('posts:index'))
+        self.client.cookies[settings.READ_REPLICA_COOKIE] = str(
+            time.time() + 60
+        )
+        replica, primary = self.get(reverse('posts:index'))
+        self.assertEqual(replica, 0)
+        self.assertNotEqual(primary, [])
+
+    def test_router(self):
+        from django.contrib.sessions.models import Session
+
+        router = replicas.ReplicaRouter()
+        token = replicas.start()
+        try:
+            self.assertEqual(router.db_for_read(Post), 'default')
+            replicas._state.get().replica = 'replica'
+            self.assertEqual(router.db_for_read(Post), 'replica')
+            self.assertEqual(router.db_for_read(Session), 'default')
+            self.assertEqual(router.db_for_write(Post), 'default')
+            self.assertEqual(router.db_for_read(Post), 'default')
+        finally:
+            replicas.finish(token)
+        self.assertFalse(router.allow_migrate('replica', 'posts'))
+
+    def test_replicate_copies_primary(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        primary = os.path.join(directory, 'primary.sqlite3')
+        replica = os.path.join(directory, 'replica.sqlite3')
+        with sqlite3.connect(primary) as source:
+            source.execute('CREATE TABLE item (name TEXT)')
+            source.execute("INSERT INTO item VALUES ('запись')")
+        with mock.patch.dict(connection.settings_dict, NAME=primary), \
+                mock.patch.dict(connections['replica'].settings_dict,
+                                NAME=replica):
+            call_command('replicate', 'replica', stdout=StringIO())
+        with sqlite3.connect(replica) as target:
+            self.assertEqual(
+                target.execute('SELECT name FROM item').fetchall(),
+                [('запись',)]
+            )
@@ -1,5 +1,11 @@
-from django.contrib import admin
-from .models import Post, Group, Comment, Follow
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.http import StreamingHttpResponse
+from django.shortcuts import redirect
+from django.urls import path
+
+from . import exporter, search
+from .models import AuthorStats, Post, Group, Comment, Follow
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -9,6 +15,60 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        # Ищем по полнотекстовому индексу вместо LIKE '%…%' по text.
+        return search.filter_posts(queryset, search_term), False
+
+    def get_urls(self):
+        return [
+            path(
+                'export/', self.admin_site.admin_view(self.export_view),
+                name='posts_export'
+            ),
+        ] + super().get_urls()
+
+    def export_view(self, request):
+        """Потоковая выгрузка, параметры как у manage.py export_content."""
+        names = [
+            name for name in request.GET.getlist('content')
+            if name in exporter.CONTENT
+        ] or list(exporter.CONTENT)
+        for name in names:
+            model = exporter.CONTENT[name][1]
+            if not request.user.has_perm(
+                f'posts.view_{model._meta.model_name}'
+            ):
+                raise PermissionDenied
+        file_format = request.GET.get('format')
+        if file_format not in exporter.FORMATS:
+            file_format = 'ndjson'
+        compress = 'gzip' in request.GET
+        try:
+            since = exporter.parse_since(request.GET.get('since'))
+            until = exporter.get_watermarks(names, since)
+            chunks = exporter.export(names, file_format, since, until)
+        except ValueError as error:
+            self.message_user(request, str(error), messages.ERROR)
+            return redirect('admin:posts_post_changelist')
+        response = StreamingHttpResponse(
+            exporter.encode(chunks, compress),
+            content_type=(
+                'application/gzip' if compress
+                else exporter.FORMATS[file_format]
+            )
+        )
+        filename = f'yatube-{"-".join(names)}.{file_format}'
+        if compress:
+            filename += '.gz'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        # Водяные знаки для следующей выгрузки с ?since=.
+        for name, watermark in until.items():
+            if watermark is not None:
+                response[f'X-Export-Watermark-{name}'] = (
+                    watermark.isoformat()
+                )
+        return response
+
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = ('title', 'slug', 'description')
@@ -26,7 +86,16 @@ class FollowAdmin(admin.ModelAdmin):
     list_display = ('user', 'author')
 
 
+class AuthorStatsAdmin(admin.ModelAdmin):
+    list_display = (
+        'user', 'posts_count', 'comments_count',
+        'followers_count', 'following_count',
+    )
+    search_fields = ('user__username',)
+
+
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group, GroupAdmin)
 admin.site.register(Comment, CommentAdmin)
 admin.site.register(Follow, FollowAdmin)
+admin.site.register(AuthorStats, AuthorStatsAdmin)
@@ -0,0 +1,171 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Count, Max
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from . import write_buffer
+from .models import Group, Post
+from .paginator import CursorPaginator, get_cursor, get_page
+from .timeline import get_follow_feed
+from .views import get_comments
+
+User = get_user_model()
+
+JSON_PARAMS = {'ensure_ascii': False, 'separators': (',', ':')}
+
+
+def serialize_post(post):
+    return {
+        'id': post.pk,
+        'text': post.text,
+        'pub_date': post.pub_date.isoformat(),
+        'author': post.author.username,
+        'group': post.group.slug if post.group_id else None,
+        'image': post.image.url if post.image else None,
+    }
+
+
+def serialize_group(group):
+    return {
+        'slug': group.slug,
+        'title': group.title,
+        'description': group.description,
+    }
+
+
+def serialize_comment(comment):
+    return {
+        'id': comment.pk,
+        'author': comment.author.username,
+        'text': comment.text,
+        'created': comment.created.isoformat(),
+    }
+
+
+def conditional_json(request, state, last_modified, get_data):
+    """Отвечает 304, если состояние не изменилось, иначе — JSON.
+
+    state — значения, от которых зависит ответ; из них и адреса
+    запроса получается сильный ETag. get_data вызывается только
+    при 200, поэтому повторный опрос без изменений ничего
+    не сериализует.
+    """
+    digest = hashlib.sha1(request.get_full_path().encode())
+    for value in state:
+        digest.update(repr(value).encode())
+    etag = quote_etag(digest.hexdigest())
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(
+        request, etag=etag, last_modified=timestamp
+    )
+    if response is None:
+        response = JsonResponse(get_data(), json_dumps_params=JSON_PARAMS)
+    response['ETag'] = etag
+    if timestamp is not None:
+        response['Last-Modified'] = http_date(timestamp)
+    return response
+
+
+def feed_response(request, paginator, get_extra=dict, check_exists=None):
+    versions = paginator.get_versions(**get_cursor(request))
+    if not versions and check_exists is not None:
+        check_exists()
+
+    def get_data():
+        page = get_page(request, paginator)
+        return {
+            **get_extra(),
+            'results': [serialize_post(post) for post in page],
+            'next': paginator.next_cursor,
+            'previous': paginator.previous_cursor,
+        }
+
+    last_modified = max((updated for _, updated in versions), default=None)
+    return conditional_json(request, versions, last_modified, get_data)
+
+
+def index(request):
+    paginator = CursorPaginator(Post.objects.for_feed(), settings.PAGE_COUNT)
+    return feed_response(request, paginator)
+
+
+def group_posts(request, slug):
+    paginator = CursorPaginator(
+        Post.objects.for_feed().filter(group__slug=slug), settings.PAGE_COUNT
+    )
+    return feed_response(
+        request, paginator,
+        get_extra=lambda: {
+            'group': serialize_group(get_object_or_404(Group, slug=slug))
+        },
+        check_exists=lambda: get_object_or_404(Group.objects.only('pk'),
+                                               slug=slug),
+    )
+
+
+def profile(request, username):
+    paginator = CursorPaginator(
+        Post.objects.for_feed().filter(author__username=username),
+        settings.PAGE_COUNT
+    )
+
+    def get_extra():
+        author = get_object_or_404(User, username=username)
+        return {'author': {
+            'username': author.username,
+            'full_name': author.get_full_name(),
+        }}
+
+    return feed_response(
+        request, paginator, get_extra=get_extra,
+        check_exists=lambda: get_object_or_404(User.objects.only('pk'),
+                                               username=username),
+    )
+
+
+def follow_index(request):
+    # Клиенту JSON нужен статус, а не переход на страницу входа.
+    if not request.user.is_authenticated:
+        return JsonResponse(
+            {'detail': 'Требуется вход.'}, status=403,
+            json_dumps_params=JSON_PARAMS,
+        )
+    return feed_response(request, get_follow_feed(request.user))
+
+
+def post_detail(request, post_id):
+    state = Post.objects.filter(pk=post_id).annotate(
+        last_comment=Max('comments__created'),
+        comments_count=Count('comments'),
+    ).values_list('updated', 'last_comment', 'comments_count').first()
+    if state is None:
+        raise Http404
+    updated, last_comment, _ = state
+    # Несохранённые комментарии буфера тоже попадают в ответ.
+    pending = [
+        comment.created for comment in write_buffer.pending_comments(post_id)
+    ]
+
+    def get_data():
+        post = get_object_or_404(
+            Post.objects.select_related('author', 'group'), pk=post_id
+        )
+        comments = get_comments(request, post_id)
+        return {
+            'post': {
+                **serialize_post(post),
+                'group': serialize_group(post.group) if post.group else None,
+            },
+            'comments': [serialize_comment(comment) for comment in comments],
+            'next': comments.paginator.next_cursor,
+        }
+
+    last_modified = max(filter(None, (updated, last_comment, *pending)))
+    return conditional_json(
+        request, (*state, pending), last_modified, get_data
+    )
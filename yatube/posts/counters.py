@@ -0,0 +1,69 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, F
+
+from core import db
+from .models import AuthorStats, Comment, Follow, Post
+
+User = get_user_model()
+
+COUNTERS = {
+    'posts_count': (Post, 'author_id'),
+    'comments_count': (Comment, 'author_id'),
+    'followers_count': (Follow, 'author_id'),
+    'following_count': (Follow, 'user_id'),
+}
+
+
+def change(user_id, field, delta):
+    """Атомарно изменяет счётчик пользователя на delta."""
+    with transaction.atomic():
+        updated = AuthorStats.objects.filter(user_id=user_id).update(
+            **{field: F(field) + delta}
+        )
+        # При удалении пользователя его строка удаляется каскадом
+        # раньше записей, поэтому отсутствующую строку создаём только
+        # при увеличении счётчика.
+        if not updated and delta > 0:
+            AuthorStats.objects.get_or_create(user_id=user_id)
+            AuthorStats.objects.filter(user_id=user_id).update(
+                **{field: F(field) + delta}
+            )
+
+
+def reconcile(batch_size=1000, dry_run=False):
+    """Пересчитывает счётчики и исправляет расхождения.
+
+    Возвращает число созданных и исправленных строк.
+    """
+    actual = {
+        field: dict(
+            model.objects.values_list(column).annotate(
+                total=Count('pk')
+            ).order_by()
+        )
+        for field, (model, column) in COUNTERS.items()
+    }
+    stored = {
+        stats.user_id: stats
+        for stats in AuthorStats.objects.all().iterator()
+    }
+    missing, drifted = [], []
+    for user_id in User.objects.values_list('pk', flat=True).iterator():
+        values = {
+            field: counts.get(user_id, 0) for field, counts in actual.items()
+        }
+        stats = stored.get(user_id)
+        if stats is None:
+            missing.append(AuthorStats(user_id=user_id, **values))
+        elif any(getattr(stats, f) != v for f, v in values.items()):
+            for field, value in values.items():
+                setattr(stats, field, value)
+            drifted.append(stats)
+    if not dry_run:
+        with transaction.atomic():
+            db.bulk_create(AuthorStats, missing, batch_size=batch_size)
+            AuthorStats.objects.bulk_update(
+                drifted, list(COUNTERS), batch_size=batch_size
+            )
+    return len(missing), len(drifted)
@@ -0,0 +1,186 @@
+import asyncio
+import json
+import threading
+from functools import lru_cache
+from importlib import import_module
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.contrib import auth
+from django.http.cookie import parse_cookie
+from django.urls import reverse
+from django.utils.module_loading import import_string
+from django.utils.text import Truncator
+
+from core.asgi import run_sync, send_status
+from .models import Follow, Post
+
+
+class Subscription:
+    """Очередь событий одного подключения в его цикле событий."""
+
+    def __init__(self, authors):
+        self.authors = authors
+        self.loop = asyncio.get_event_loop()
+        self.queue = asyncio.Queue(maxsize=settings.EVENTS_QUEUE_SIZE)
+
+    def deliver(self, message):
+        """Можно вызывать из любого потока."""
+        self.loop.call_soon_threadsafe(self.put, message)
+
+    def put(self, message):
+        # Отставший клиент пропускает события и догоняет их
+        # по Last-Event-ID после переподключения.
+        if not self.queue.full():
+            self.queue.put_nowait(message)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class LocalBroker:
+    """Публикация и подписка внутри одного процесса."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = {}
+
+    def subscribe(self, authors):
+        subscription = Subscription(frozenset(authors))
+        with self.lock:
+            for author_id in subscription.authors:
+                self.subscribers.setdefault(author_id, set()).add(
+                    subscription
+                )
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            for author_id in subscription.authors:
+                subscribers = self.subscribers.get(author_id, set())
+                subscribers.discard(subscription)
+                if not subscribers:
+                    self.subscribers.pop(author_id, None)
+
+    def publish(self, author_id, message):
+        with self.lock:
+            subscribers = list(self.subscribers.get(author_id, ()))
+        for subscription in subscribers:
+            subscription.deliver(message)
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(settings.EVENTS_BROKER)()
+
+
+def serialize(post):
+    return {
+        'id': post.pk,
+        'author': post.author.username,
+        'text': Truncator(post.text).chars(settings.EVENTS_TEXT_LENGTH),
+        'url': reverse('posts:post_detail', args=(post.pk,)),
+    }
+
+
+def publish(post):
+    """Сообщает подписчикам автора о новой записи."""
+    get_broker().publish(post.author_id, serialize(post))
+
+
+def format_event(message):
+    data = json.dumps(message, ensure_ascii=False)
+    return f'id: {message["id"]}\nevent: post\ndata: {data}\n\n'.encode()
+
+
+def get_user_id(headers):
+    cookies = parse_cookie(headers.get(b'cookie', b'').decode('latin1'))
+    session_key = cookies.get(settings.SESSION_COOKIE_NAME)
+    if not session_key:
+        return None
+    engine = import_module(settings.SESSION_ENGINE)
+    request = SimpleNamespace(session=engine.SessionStore(session_key))
+    return auth.get_user(request).pk
+
+
+def get_authors(user_id):
+    return list(
+        Follow.objects.filter(user_id=user_id).values_list(
+            'author_id', flat=True
+        )
+    )
+
+
+def get_missed(authors, last_event_id):
+    """Записи, опубликованные после события last_event_id."""
+    try:
+        last_id = int(last_event_id)
+    except (TypeError, ValueError):
+        return []
+    posts = Post.objects.filter(
+        author_id__in=authors, pk__gt=last_id
+    ).select_related('author').order_by('pk')
+    return [serialize(post) for post in posts[:settings.EVENTS_REPLAY_LIMIT]]
+
+
+async def wait_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def follow_events(scope, receive, send):
+    """Поток server-sent events о новых записях избранных авторов.
+
+    Приложение ASGI: ожидающее подключение — это корутина, а не поток.
+    """
+    if scope['type'] != 'http':
+        return
+    headers = dict(scope.get('headers', []))
+    user_id = await run_sync(get_user_id, headers)
+    if user_id is None:
+        await send_status(send, 403)
+        return
+    authors = await run_sync(get_authors, user_id)
+    broker = get_broker()
+    subscription = broker.subscribe(authors)
+    disconnect = asyncio.ensure_future(wait_disconnect(receive))
+    try:
+        missed = await run_sync(
+            get_missed, authors, headers.get(b'last-event-id', b'').decode()
+        )
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream; charset=utf-8'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+        body = b''.join(format_event(message) for message in missed)
+        await send({
+            'type': 'http.response.body',
+            'body': body or b': connected\n\n',
+            'more_body': True,
+        })
+        while not disconnect.done():
+            event = asyncio.ensure_future(subscription.get())
+            done, _ = await asyncio.wait(
+                (event, disconnect),
+                timeout=settings.EVENTS_KEEPALIVE,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if event in done:
+                body = format_event(event.result())
+            else:
+                event.cancel()
+                body = b': keepalive\n\n'
+            if not disconnect.done():
+                await send({
+                    'type': 'http.response.body',
+                    'body': body,
+                    'more_body': True,
+                })
+    finally:
+        broker.unsubscribe(subscription)
+        disconnect.cancel()
@@ -0,0 +1,160 @@
+import csv
+import json
+import zlib
+
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Comment, Follow, Post
+
+# Поля совпадают с форматом import_posts, поэтому выгрузку можно
+# загрузить обратно. Третий элемент — поле водяного знака
+# для выгрузки только новых строк.
+CONTENT = {
+    'posts': (
+        'post', Post,
+        (('id', 'pk'), ('text', 'text'), ('author', 'author__username'),
+         ('group', 'group__slug'), ('pub_date', 'pub_date'),
+         ('updated', 'updated')),
+        'pub_date',
+    ),
+    'comments': (
+        'comment', Comment,
+        (('id', 'pk'), ('post', 'post_id'), ('author', 'author__username'),
+         ('text', 'text'), ('created', 'created')),
+        'created',
+    ),
+    # У подписок нет даты, они всегда выгружаются целиком.
+    'follows': (
+        'follow', Follow,
+        (('user', 'user__username'), ('author', 'author__username')),
+        None,
+    ),
+}
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def parse_since(value):
+    """Дата --since или ?since=; без часового пояса — в текущем.
+
+    Пустое значение — None, нераспознанное — ValueError.
+    """
+    if not value:
+        return None
+    since = parse_datetime(value)
+    if since is None:
+        raise ValueError('since: ожидается дата ISO 8601.')
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    return since
+
+
+def get_queryset(name, since=None, until=None):
+    """Строки с водяным знаком в (since, until], по возрастанию id."""
+    _, model, fields, watermark = CONTENT[name]
+    queryset = model.objects.order_by('pk')
+    if watermark is not None:
+        if since is not None:
+            queryset = queryset.filter(**{f'{watermark}__gt': since})
+        if until is not None:
+            queryset = queryset.filter(**{f'{watermark}__lte': until})
+    return queryset.values_list(*(lookup for _, lookup in fields))
+
+
+def get_watermarks(names, since=None):
+    """Верхние границы выгрузки, снятые до её начала.
+
+    Строки, добавленные во время выгрузки, попадут в следующую.
+    Граница не меньше since, чтобы её можно было передать в since
+    следующей выгрузки.
+    """
+    watermarks = {}
+    for name in names:
+        _, model, _, watermark = CONTENT[name]
+        if watermark is None:
+            continue
+        value = model.objects.aggregate(value=Max(watermark))['value']
+        if since is not None and (value is None or value < since):
+            value = since
+        watermarks[name] = value
+    return watermarks
+
+
+def iter_rows(name, since=None, until=None, chunk_size=2000):
+    """Словари строк выгрузки; в памяти не больше chunk_size строк."""
+    row_type, _, fields, _ = CONTENT[name]
+    keys = [key for key, _ in fields]
+    queryset = get_queryset(name, since, until)
+    for values in queryset.iterator(chunk_size=chunk_size):
+        row = {'type': row_type}
+        for key, value in zip(keys, values):
+            row[key] = value.isoformat() if hasattr(
+                value, 'isoformat'
+            ) else value
+        yield row
+
+
+class Echo:
+    """Файл для csv.writer, который возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def to_ndjson(names, since=None, until=None, chunk_size=2000):
+    for name in names:
+        rows = iter_rows(name, since, until.get(name), chunk_size)
+        for row in rows:
+            yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+def to_csv(name, since=None, until=None, chunk_size=2000):
+    _, _, fields, _ = CONTENT[name]
+    keys = [key for key, _ in fields]
+    writer = csv.DictWriter(Echo(), keys, extrasaction='ignore')
+    yield writer.writerow(dict(zip(keys, keys)))
+    for row in iter_rows(name, since, until.get(name), chunk_size):
+        yield writer.writerow(row)
+
+
+def export(names, file_format, since=None, until=None, chunk_size=2000):
+    """Куски текста выгрузки; until — результат get_watermarks().
+
+    В CSV выгружается только один вид данных.
+    """
+    until = until or {}
+    if file_format == 'csv':
+        if len(names) != 1:
+            raise ValueError('В CSV выгружается только один вид данных.')
+        return to_csv(names[0], since, until, chunk_size)
+    return to_ndjson(names, since, until, chunk_size)
+
+
+def encode(chunks, compress=False, buffer_size=64 * 1024):
+    """Кодирует куски в UTF-8 и, если нужно, сжимает gzip на лету.
+
+    Мелкие строки собираются в блоки около buffer_size байт.
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    buffer = []
+    size = 0
+    for chunk in chunks:
+        data = chunk.encode()
+        buffer.append(data)
+        size += len(data)
+        if size >= buffer_size:
+            data = b''.join(buffer)
+            buffer, size = [], 0
+            if compressor is not None:
+                data = compressor.compress(data)
+            if data:
+                yield data
+    data = b''.join(buffer)
+    if compressor is not None:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
@@ -0,0 +1,55 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core.cache import get_or_recompute
+from core.replicas import get_read_alias
+
+from .paginator import freeze, get_cursor, paginate, thaw
+
+GENERATION_KEY = 'feed_cache:generation'
+
+
+def get_generation():
+    """Поколение кеша лент; меняется при любом изменении записей."""
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, time.time_ns(), None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def invalidate():
+    # Новое значение, а не incr: после вытеснения ключа счётчик
+    # начался бы заново и совпал бы со старыми страницами.
+    cache.set(GENERATION_KEY, time.time_ns(), None)
+
+
+def make_key(name, *args):
+    digest = hashlib.md5(':'.join(map(str, args)).encode()).hexdigest()
+    return f'feed_cache:{name}:{digest}'
+
+
+def get_key(request, name, *args):
+    # Страницы с реплики кешируются отдельно: иначе отстающая копия
+    # попала бы к тем, кто после записи читает с default.
+    return make_key(
+        name, get_read_alias(), *args, *get_cursor(request).values()
+    )
+
+
+def get_page(request, name, queryset, *args):
+    """paginate() для ленты name через общий кеш страниц.
+
+    args — то, от чего зависит queryset, кроме курсора (slug группы,
+    имя автора).
+    """
+    return thaw(get_or_recompute(
+        get_key(request, name, *args),
+        lambda: freeze(paginate(request, queryset)),
+        settings.FEED_CACHE_TIMEOUT,
+        generation=get_generation(),
+        name=name,
+    ))
@@ -0,0 +1,341 @@
+import csv
+import json
+from contextlib import contextmanager
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core import db
+from . import counters, feed_cache, timeline
+from .models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+POST, COMMENT, FOLLOW = 'post', 'comment', 'follow'
+# Порядок разбора пакета: комментарии могут ссылаться на записи
+# из того же пакета.
+TYPES = (POST, COMMENT, FOLLOW)
+MODELS = {POST: Post, COMMENT: Comment, FOLLOW: Follow}
+# id пользователей в одном запросе: SQLite принимает до 999 параметров.
+LOOKUP_SIZE = 500
+
+
+class RowError(ValueError):
+    pass
+
+
+def read_ndjson(stream):
+    """Строки NDJSON как (номер строки, словарь); пустые пропускаются."""
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as error:
+            row = RowError(f'некорректный JSON: {error}')
+        else:
+            if not isinstance(row, dict):
+                row = RowError('ожидается объект JSON')
+        yield number, row
+
+
+def read_csv(stream):
+    # Номер строки считается с заголовком, как в редакторе таблиц.
+    for number, row in enumerate(csv.DictReader(stream), 2):
+        yield number, row
+
+
+READERS = {'ndjson': read_ndjson, 'csv': read_csv}
+
+
+def parse_date(value):
+    if not value:
+        return timezone.now()
+    date = parse_datetime(value)
+    if date is None:
+        raise RowError(f'некорректная дата {value!r}')
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date, timezone.utc)
+    return date
+
+
+def parse_id(value):
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise RowError(f'некорректный id {value!r}')
+
+
+@contextmanager
+def explicit_dates():
+    """Отключает auto_now и auto_now_add, чтобы сохранить даты из файла.
+
+    bulk_create вызывает pre_save полей и иначе заменил бы их текущим
+    временем. Действует на весь процесс, только для команд.
+    """
+    fields = [
+        field
+        for model in MODELS.values()
+        for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False)
+        or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Importer:
+    """Потоковая загрузка записей, комментариев и подписок пакетами.
+
+    Каждый пакет проверяется целиком (авторы, группы, записи
+    комментариев и повторы — по одному запросу на модель)
+    и сохраняется bulk_create в своей транзакции. В памяти хранятся
+    только текущий пакет и словари имя → id пользователей и групп.
+    """
+
+    def __init__(self, batch_size=1000, create_missing=False,
+                 default_type=POST, on_error=None):
+        self.batch_size = batch_size
+        self.create_missing = create_missing
+        self.default_type = default_type
+        self.on_error = on_error
+        self.users = {}
+        self.groups = {}
+        self.created = dict.fromkeys(TYPES, 0)
+        self.rows = 0
+        self.errors = 0
+
+    def run(self, rows, progress=None):
+        """Загружает строки read_ndjson или read_csv.
+
+        progress(importer) вызывается после каждого пакета.
+        """
+        rows = iter(rows)
+        with explicit_dates():
+            while True:
+                batch = list(islice(rows, self.batch_size))
+                if not batch:
+                    break
+                with transaction.atomic():
+                    self.load_batch(batch)
+                self.rows += len(batch)
+                if progress is not None:
+                    progress(self)
+        return self.created
+
+    def finish(self):
+        """Досчитывает то, что не делают сигналы при bulk_create."""
+        if self.created[POST] or self.created[COMMENT]:
+            # Явные id не сдвигают последовательности в PostgreSQL.
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(
+                    no_style(), [Post, Comment]
+                ):
+                    cursor.execute(sql)
+        counters.reconcile(batch_size=self.batch_size)
+        if self.created[POST] or self.created[FOLLOW]:
+            timeline.rebuild()
+        feed_cache.invalidate()
+
+    def load_batch(self, batch):
+        grouped = {row_type: [] for row_type in TYPES}
+        for number, row in batch:
+            if isinstance(row, RowError):
+                self.error(number, row)
+                continue
+            row_type = row.get('type') or self.default_type
+            if row_type not in grouped:
+                self.error(number, f'неизвестный тип {row_type!r}')
+                continue
+            grouped[row_type].append((number, row))
+        self.resolve_users(
+            row[field]
+            for row_type, fields in (
+                (POST, ('author',)), (COMMENT, ('author',)),
+                (FOLLOW, ('user', 'author')),
+            )
+            for _, row in grouped[row_type]
+            for field in fields
+            if row.get(field)
+        )
+        self.resolve_groups(
+            row['group'] for _, row in grouped[POST] if row.get('group')
+        )
+        for row_type in TYPES:
+            rows = grouped[row_type]
+            if rows:
+                build = getattr(self, f'build_{row_type}s')
+                objects = self.validate(rows, build)
+                if row_type == FOLLOW:
+                    objects = self.skip_existing_follows(objects)
+                self.insert(
+                    MODELS[row_type], objects,
+                    ignore_conflicts=row_type == FOLLOW
+                )
+                self.created[row_type] += len(objects)
+
+    def error(self, number, message):
+        self.errors += 1
+        if self.on_error is not None:
+            self.on_error(number, str(message))
+
+    def validate(self, rows, build):
+        """Объекты моделей для строк пакета без строк с ошибками."""
+        objects = []
+        for number, obj in build(rows):
+            if isinstance(obj, RowError):
+                self.error(number, obj)
+            else:
+                objects.append(obj)
+        return objects
+
+    def skip_existing_follows(self, follows):
+        """Подписки без сохранённых ранее и без повторов в пакете.
+
+        Повторные подписки не ошибка: в старой базе они могли остаться
+        после отписки и новой подписки. Но в итог импорта они
+        не входят.
+        """
+        users = sorted({follow.user_id for follow in follows})
+        seen = set()
+        for start in range(0, len(users), LOOKUP_SIZE):
+            seen.update(Follow.objects.filter(
+                user_id__in=users[start:start + LOOKUP_SIZE]
+            ).values_list('user_id', 'author_id'))
+        new = []
+        for follow in follows:
+            pair = (follow.user_id, follow.author_id)
+            if pair not in seen:
+                seen.add(pair)
+                new.append(follow)
+        return new
+
+    def insert(self, model, objects, **kwargs):
+        db.bulk_create(model, objects, batch_size=self.batch_size, **kwargs)
+
+    def resolve_users(self, usernames):
+        missing = set(usernames) - self.users.keys()
+        if not missing:
+            return
+        self.users.update(User.objects.filter(
+            username__in=missing
+        ).values_list('username', 'pk'))
+        missing -= self.users.keys()
+        if missing and self.create_missing:
+            self.insert(User, [
+                User(username=username, password='!')
+                for username in missing
+            ])
+            self.users.update(User.objects.filter(
+                username__in=missing
+            ).values_list('username', 'pk'))
+
+    def resolve_groups(self, slugs):
+        missing = set(slugs) - self.groups.keys()
+        if not missing:
+            return
+        self.groups.update(Group.objects.filter(
+            slug__in=missing
+        ).values_list('slug', 'pk'))
+        missing -= self.groups.keys()
+        if missing and self.create_missing:
+            self.insert(Group, [
+                Group(title=slug, slug=slug) for slug in missing
+            ])
+            self.groups.update(Group.objects.filter(
+                slug__in=missing
+            ).values_list('slug', 'pk'))
+
+    def get_user(self, username):
+        if not username:
+            raise RowError('не указан пользователь')
+        try:
+            return self.users[username]
+        except KeyError:
+            raise RowError(f'нет пользователя {username!r}')
+
+    def get_existing(self, model, rows, field='id'):
+        ids = set()
+        for _, row in rows:
+            try:
+                ids.add(parse_id(row.get(field)))
+            except RowError:
+                pass
+        ids.discard(None)
+        return set(model.objects.filter(
+            pk__in=ids
+        ).values_list('pk', flat=True))
+
+    def build_posts(self, rows):
+        existing = self.get_existing(Post, rows)
+        seen = set()
+        for number, row in rows:
+            try:
+                pk = parse_id(row.get('id'))
+                if pk is not None and (pk in existing or pk in seen):
+                    raise RowError(f'запись {pk} уже есть')
+                seen.add(pk)
+                text = row.get('text')
+                if not text:
+                    raise RowError('пустой текст записи')
+                group = row.get('group')
+                if group and group not in self.groups:
+                    raise RowError(f'нет группы {group!r}')
+                pub_date = parse_date(row.get('pub_date'))
+                updated = row.get('updated')
+                yield number, Post(
+                    pk=pk, text=text,
+                    author_id=self.get_user(row.get('author')),
+                    group_id=self.groups.get(group) if group else None,
+                    pub_date=pub_date,
+                    updated=parse_date(updated) if updated else pub_date,
+                )
+            except RowError as error:
+                yield number, error
+
+    def build_comments(self, rows):
+        existing = self.get_existing(Comment, rows)
+        posts = self.get_existing(Post, rows, 'post')
+        seen = set()
+        for number, row in rows:
+            try:
+                pk = parse_id(row.get('id'))
+                if pk is not None and (pk in existing or pk in seen):
+                    raise RowError(f'комментарий {pk} уже есть')
+                seen.add(pk)
+                post = parse_id(row.get('post'))
+                if post not in posts:
+                    raise RowError(f'нет записи {post!r}')
+                text = row.get('text')
+                if not text:
+                    raise RowError('пустой текст комментария')
+                yield number, Comment(
+                    pk=pk, post_id=post, text=text,
+                    author_id=self.get_user(row.get('author')),
+                    created=parse_date(row.get('created')),
+                )
+            except RowError as error:
+                yield number, error
+
+    def build_follows(self, rows):
+        for number, row in rows:
+            try:
+                user = self.get_user(row.get('user'))
+                author = self.get_user(row.get('author'))
+                if user == author:
+                    raise RowError('подписка на самого себя')
+                yield number, Follow(user_id=user, author_id=author)
+            except RowError as error:
+                yield number, error
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import recommendations
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает подсказки «кого почитать» и «группы» '
+        'по графу подписок.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Скольким пользователям сохранять подсказки '
+                 'в одной транзакции.'
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        graph = recommendations.Graph.load()
+        loaded = time.monotonic()
+        users = recommendations.rebuild(options['batch_size'], graph)
+        finished = time.monotonic()
+        self.stdout.write(
+            f'Граф: {len(graph)} подписок, '
+            f'{graph.nbytes() / 2 ** 20:.1f} МБ, '
+            f'загружен за {loaded - started:.1f} с. '
+            f'Подсказки для {users} пользователей '
+            f'за {finished - loaded:.1f} с.'
+        )
@@ -0,0 +1,70 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import exporter
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает записи, комментарии и подписки в NDJSON или CSV '
+        'без загрузки всей таблицы в память.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--content', nargs='+', choices=list(exporter.CONTENT),
+            default=list(exporter.CONTENT),
+            help='Что выгружать; для CSV — ровно одно.'
+        )
+        parser.add_argument(
+            '--format', choices=list(exporter.FORMATS), default='ndjson'
+        )
+        parser.add_argument(
+            '--output', default='-',
+            help='Файл для выгрузки; «-» — стандартный вывод.'
+        )
+        parser.add_argument(
+            '--gzip', action='store_true', help='Сжимать gzip на лету.'
+        )
+        parser.add_argument(
+            '--since',
+            help='Только записи и комментарии новее этой даты (ISO 8601), '
+                 'например водяного знака прошлой выгрузки.'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=2000,
+            help='Сколько строк читать из базы за раз.'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            since = exporter.parse_since(options['since'])
+        except ValueError:
+            raise CommandError('--since: ожидается дата ISO 8601.')
+        names = options['content']
+        until = exporter.get_watermarks(names, since)
+        try:
+            chunks = exporter.export(
+                names, options['format'], since, until,
+                options['chunk_size']
+            )
+        except ValueError as error:
+            raise CommandError(error)
+        data = exporter.encode(chunks, options['gzip'])
+        if options['output'] == '-':
+            output = sys.stdout.buffer
+            self.write(output, data)
+            output.flush()
+        else:
+            with open(options['output'], 'wb') as output:
+                self.write(output, data)
+        for name, watermark in until.items():
+            if watermark is not None:
+                self.stderr.write(
+                    f'Водяной знак {name}: {watermark.isoformat()}'
+                )
+
+    def write(self, output, data):
+        for block in data:
+            output.write(block)
@@ -0,0 +1,83 @@
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from posts.models import Follow, Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Показывает распределение стоимости fan-out по текущим подпискам, '
+        'чтобы подобрать TIMELINE_FANOUT_THRESHOLD.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threshold', type=int,
+            default=settings.TIMELINE_FANOUT_THRESHOLD,
+            help='Порог числа подписчиков, выше которого записи не '
+                 'раскладываются по лентам.'
+        )
+
+    def handle(self, *args, **options):
+        threshold = options['threshold']
+        followers = dict(
+            Follow.objects.values_list('author_id').annotate(
+                followers=Count('id')
+            ).order_by()
+        )
+        posts = Counter(dict(
+            Post.objects.values_list('author_id').annotate(
+                posts=Count('id')
+            ).order_by()
+        ))
+        if not followers:
+            self.stdout.write('Подписок пока нет.')
+            return
+
+        buckets = {}
+        for author_id, count in followers.items():
+            bucket = 1
+            while bucket * 10 <= count:
+                bucket *= 10
+            authors, follows, writes = buckets.get(bucket, (0, 0, 0))
+            buckets[bucket] = (
+                authors + 1,
+                follows + count,
+                writes + count * posts[author_id],
+            )
+
+        total_writes = sum(writes for _, _, writes in buckets.values())
+        self.stdout.write(
+            f'{"подписчиков":>16} {"авторов":>10} {"подписок":>12} '
+            f'{"записей в ленты":>16} {"доля":>7}'
+        )
+        for bucket in sorted(buckets):
+            authors, follows, writes = buckets[bucket]
+            share = writes / total_writes if total_writes else 0
+            self.stdout.write(
+                f'{bucket:>7} – {bucket * 10 - 1:<6} {authors:>10} '
+                f'{follows:>12} {writes:>16} {share:>7.1%}'
+            )
+
+        counts = sorted(followers.values())
+        for percentile in (50, 90, 99):
+            index = min(len(counts) - 1, len(counts) * percentile // 100)
+            self.stdout.write(
+                f'p{percentile} подписчиков на автора: {counts[index]}'
+            )
+
+        pulled = [
+            author_id for author_id, count in followers.items()
+            if count > threshold
+        ]
+        pulled_writes = sum(
+            followers[author_id] * posts[author_id] for author_id in pulled
+        )
+        share = pulled_writes / total_writes if total_writes else 0
+        self.stdout.write(
+            f'Порог {threshold}: {len(pulled)} авторов читаются при показе, '
+            f'экономия {pulled_writes} записей в ленты ({share:.1%}).'
+        )
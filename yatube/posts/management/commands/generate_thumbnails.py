@@ -0,0 +1,54 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts.models import Post
+from posts.thumbnails import fill_gap, init_worker
+
+
+class Command(BaseCommand):
+    help = (
+        'Создаёт недостающие миниатюры и варианты картинок записей '
+        'параллельно на всех ядрах.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Число процессов.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько картинок отдавать пулу за раз.'
+        )
+
+    def handle(self, *args, **options):
+        checked = created = 0
+        last_pk = 0
+        with ProcessPoolExecutor(
+            max_workers=options['workers'], initializer=init_worker
+        ) as executor:
+            while True:
+                batch = list(
+                    Post.objects.filter(pk__gt=last_pk).exclude(
+                        image=''
+                    ).order_by('pk').values_list(
+                        'pk', 'image'
+                    )[:options['batch_size']]
+                )
+                if not batch:
+                    break
+                last_pk = batch[-1][0]
+                # Пул может запустить новые процессы на каждом map(),
+                # открытое соединение с базой им передавать нельзя.
+                connections.close_all()
+                created += sum(
+                    bool(done) for done in
+                    executor.map(fill_gap, (name for _, name in batch))
+                )
+                checked += len(batch)
+        self.stdout.write(
+            f'Проверено картинок: {checked}, создано миниатюр: {created}.'
+        )
@@ -0,0 +1,99 @@
+import io
+import os
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import importer
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает записи, комментарии и подписки из NDJSON или CSV '
+        'пакетными вставками.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default='-',
+            help='Файл для загрузки; «-» или ничего — стандартный ввод.'
+        )
+        parser.add_argument(
+            '--format', choices=sorted(importer.READERS),
+            help='Формат файла; по умолчанию по расширению, для ввода — '
+                 'ndjson.'
+        )
+        parser.add_argument(
+            '--type', choices=importer.TYPES, default=importer.POST,
+            help='Тип строк без поля type (для CSV — всех строк).'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько строк проверять и сохранять в одной транзакции.'
+        )
+        parser.add_argument(
+            '--create-missing', action='store_true',
+            help='Создавать неизвестных пользователей и группы.'
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        path = options['path']
+        file_format = options['format']
+        if file_format is None:
+            extension = os.path.splitext(path)[1].lstrip('.').lower()
+            file_format = extension if extension in importer.READERS else (
+                'ndjson'
+            )
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля.')
+        loader = importer.Importer(
+            batch_size=options['batch_size'],
+            create_missing=options['create_missing'],
+            default_type=options['type'],
+            on_error=self.report_error,
+        )
+        self.started = self.reported = time.monotonic()
+        if path == '-':
+            stream = io.TextIOWrapper(
+                sys.stdin.buffer, encoding='utf-8', newline=''
+            )
+        else:
+            try:
+                stream = open(path, encoding='utf-8', newline='')
+            except OSError as error:
+                raise CommandError(f'Не удалось открыть {path}: {error}')
+        with stream:
+            loader.run(
+                importer.READERS[file_format](stream), self.report_progress
+            )
+        loader.finish()
+        elapsed = time.monotonic() - self.started
+        created = loader.created
+        self.stdout.write(
+            f'Загружено: записей {created[importer.POST]}, '
+            f'комментариев {created[importer.COMMENT]}, '
+            f'подписок {created[importer.FOLLOW]}; '
+            f'строк с ошибками {loader.errors}. '
+            f'{loader.rows} строк за {elapsed:.1f} с '
+            f'({self.get_rate(loader.rows, elapsed)} строк/с).'
+        )
+
+    def get_rate(self, rows, elapsed):
+        return round(rows / elapsed) if elapsed else rows
+
+    def report_progress(self, loader):
+        now = time.monotonic()
+        if now - self.reported < 1 or self.verbosity < 1:
+            return
+        self.reported = now
+        elapsed = now - self.started
+        self.stderr.write(
+            f'{loader.rows} строк, {loader.errors} с ошибками, '
+            f'{self.get_rate(loader.rows, elapsed)} строк/с'
+        )
+
+    def report_error(self, number, message):
+        if self.verbosity >= 1:
+            self.stderr.write(f'Строка {number}: {message}')
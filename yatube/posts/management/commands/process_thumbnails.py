@@ -0,0 +1,92 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Q
+from django.utils import timezone
+
+from posts.models import ThumbnailTask
+from posts.thumbnails import fill_gap, init_worker
+
+
+class Command(BaseCommand):
+    help = (
+        'Обрабатывает очередь миниатюр: создаёт миниатюры и варианты '
+        'картинок, загруженных через формы записей.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Число процессов.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Сколько задач забирать из очереди за раз.'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=1.0,
+            help='Пауза в секундах, когда очередь пуста.'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Разобрать очередь и завершиться.'
+        )
+
+    def retry_later(self, tasks):
+        """Откладывает неудачные задачи, удваивая паузу с каждой попыткой."""
+        now = timezone.now()
+        ThumbnailTask.objects.bulk_update([
+            ThumbnailTask(
+                pk=pk, attempts=attempts + 1,
+                next_attempt=now + timedelta(seconds=min(
+                    settings.THUMBNAIL_RETRY_DELAY * 2 ** attempts,
+                    settings.THUMBNAIL_RETRY_MAX_DELAY
+                ))
+            )
+            for pk, _, attempts in tasks
+        ], ['attempts', 'next_attempt'])
+
+    def handle(self, *args, **options):
+        processed = failed = 0
+        with ProcessPoolExecutor(
+            max_workers=options['workers'], initializer=init_worker
+        ) as executor:
+            while True:
+                due = Q(next_attempt__isnull=True) | Q(
+                    next_attempt__lte=timezone.now()
+                )
+                tasks = list(ThumbnailTask.objects.filter(due).order_by(
+                    'pk'
+                ).values_list(
+                    'pk', 'name', 'attempts'
+                )[:options['batch_size']])
+                if not tasks:
+                    if options['once']:
+                        break
+                    time.sleep(options['interval'])
+                    continue
+                # Открытое соединение с базой не передаём в новые процессы.
+                connections.close_all()
+                results = executor.map(
+                    fill_gap, (name for _, name, _ in tasks)
+                )
+                # Задачу снимаем только при успехе; упавшая остаётся
+                # в очереди и берётся снова после паузы.
+                errors = [
+                    task for task, result in zip(tasks, results)
+                    if result is None
+                ]
+                ThumbnailTask.objects.filter(pk__in=[
+                    pk for pk, _, _ in tasks
+                ]).exclude(pk__in=[pk for pk, _, _ in errors]).delete()
+                self.retry_later(errors)
+                processed += len(tasks) - len(errors)
+                failed += len(errors)
+        self.stdout.write(
+            f'Обработано задач: {processed}, отложено после ошибки: {failed}.'
+        )
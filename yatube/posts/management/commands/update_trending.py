@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import trending
+
+
+class Command(BaseCommand):
+    help = (
+        'Добавляет к рейтингу популярных записей комментарии и подписки, '
+        'появившиеся после прошлого запуска.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько строк читать и записывать за один запрос.'
+        )
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help='Пересчитать рейтинг с нуля по всем комментариям.'
+        )
+        parser.add_argument(
+            '--interval', type=float,
+            help='Повторять каждые столько секунд.'
+        )
+
+    def handle(self, *args, **options):
+        run = trending.rebuild if options['rebuild'] else trending.update
+        while True:
+            events = run(options['batch_size'])
+            self.stdout.write(f'Учтено событий: {events}.')
+            if options['interval'] is None:
+                break
+            run = trending.update
+            time.sleep(options['interval'])
@@ -1,9 +1,26 @@
-from django.db import models
+from django.core.files.storage import default_storage
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
 
+class CountedModel(models.Model):
+    """Модель, от которой зависят счётчики AuthorStats.
+
+    Обработчики post_save (posts.signals) меняют счётчики в той же
+    транзакции, что и запись строки. post_delete Django и так
+    отправляет внутри транзакции удаления.
+    """
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+
 class Group(models.Model):
     title = models.CharField(
         max_length=200,
@@ -24,7 +41,23 @@ class Group(models.Model):
         return self.title
 
 
-class Post(models.Model):
+class PostQuerySet(models.QuerySet):
+    feed_related = ('author', 'group')
+    # Поля, которые выводятся в карточке записи (posts/includes/post_card).
+    feed_fields = (
+        'text', 'pub_date', 'updated', 'image',
+        'author__username', 'author__first_name', 'author__last_name',
+        'group__title', 'group__slug',
+    )
+
+    def for_feed(self):
+        """Записи для лент: автор и группа одним запросом, без лишних полей."""
+        return self.select_related(*self.feed_related).only(
+            *self.feed_related, *self.feed_fields
+        ).prefetch_related('image_variants')
+
+
+class Post(CountedModel):
     text = models.TextField(
         verbose_name='Текст записи',
         help_text='Введите текст')
@@ -34,6 +67,10 @@ class Post(models.Model):
         help_text='Укажите дату',
         db_index=True
     )
+    updated = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения'
+    )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -54,16 +91,38 @@ class Post(models.Model):
         blank=True
     )
 
+    objects = PostQuerySet.as_manager()
+
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        # Ленты группы и автора фильтруют по FK и идут по ключу
+        # (pub_date, id) в обратном порядке, см. posts.paginator.
+        indexes = (
+            models.Index(
+                fields=('group', '-pub_date', '-id'),
+                name='post_group_date_idx'
+            ),
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                name='post_author_date_idx'
+            ),
+        )
 
     def __str__(self):
         return self.text[:15]
 
 
-class Comment(models.Model):
+class CommentQuerySet(models.QuerySet):
+    def for_thread(self):
+        """Комментарии для вывода под записью: авторы одним запросом."""
+        return self.select_related('author').only(
+            'post', 'text', 'created', 'author', 'author__username'
+        )
+
+
+class Comment(CountedModel):
     post = models.ForeignKey(
         Post,
         on_delete=models.CASCADE,
@@ -85,16 +144,24 @@ class Comment(models.Model):
     )
     created = models.DateTimeField(auto_now_add=True)
 
+    objects = CommentQuerySet.as_manager()
+
     class Meta:
         ordering = ('-created',)
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
+        indexes = (
+            models.Index(
+                fields=('post', '-created', '-id'),
+                name='comment_post_created_idx'
+            ),
+        )
 
     def __str__(self):
         return self.text[:15]
 
 
-class Follow(models.Model):
+class Follow(CountedModel):
     user = models.ForeignKey(
         User,
         related_name='follower',
@@ -119,6 +186,266 @@ class Follow(models.Model):
                 name='unique_users'
             ),
         )
+        # unique_users начинается с author и не помогает выборке
+        # подписок пользователя; этот индекс покрывает её целиком.
+        indexes = (
+            models.Index(
+                fields=('user', 'author'),
+                name='follow_user_author_idx'
+            ),
+        )
 
     def __str__(self):
         return f'{self.user} подписан на {self.author}'
+
+
+class ImageVariant(models.Model):
+    """Готовая копия картинки записи заданной ширины и формата."""
+
+    JPEG = 'jpeg'
+    WEBP = 'webp'
+    FORMAT_CHOICES = (
+        (JPEG, 'JPEG'),
+        (WEBP, 'WebP'),
+    )
+
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='image_variants',
+        verbose_name='Запись'
+    )
+    format = models.CharField(
+        max_length=4, choices=FORMAT_CHOICES, verbose_name='Формат'
+    )
+    width = models.PositiveIntegerField(verbose_name='Ширина')
+    height = models.PositiveIntegerField(verbose_name='Высота')
+    name = models.CharField(max_length=255, verbose_name='Путь к файлу')
+    size = models.PositiveIntegerField(verbose_name='Размер в байтах')
+
+    class Meta:
+        ordering = ('width',)
+        verbose_name = 'Вариант картинки'
+        verbose_name_plural = 'Варианты картинок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('post', 'format', 'width'),
+                name='unique_image_variant'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.name} ({self.width}x{self.height})'
+
+    @property
+    def url(self):
+        return default_storage.url(self.name)
+
+
+class ThumbnailTask(models.Model):
+    """Картинка в очереди на создание миниатюры и вариантов."""
+
+    name = models.CharField(
+        max_length=255, unique=True, verbose_name='Путь к картинке'
+    )
+    created = models.DateTimeField(auto_now_add=True)
+    attempts = models.PositiveSmallIntegerField(
+        default=0, verbose_name='Неудачных попыток'
+    )
+    next_attempt = models.DateTimeField(
+        null=True, blank=True, verbose_name='Следующая попытка'
+    )
+
+    class Meta:
+        verbose_name = 'Задача на миниатюру'
+        verbose_name_plural = 'Задачи на миниатюры'
+
+    def __str__(self):
+        return self.name
+
+
+class TimelineEntryQuerySet(models.QuerySet):
+    def for_feed(self):
+        related = [
+            f'post__{field}' for field in PostQuerySet.feed_related
+        ]
+        fields = [f'post__{field}' for field in PostQuerySet.feed_fields]
+        return self.select_related(*related).only(
+            'pub_date', 'post', *related, *fields
+        ).prefetch_related('post__image_variants')
+
+
+class TimelineEntry(models.Model):
+    """Запись персональной ленты подписок (fan-out on write)."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Подписчик'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Запись'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор записи'
+    )
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    objects = TimelineEntryQuerySet.as_manager()
+
+    class Meta:
+        ordering = ('-pub_date',)
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'post'),
+                name='unique_timeline_entry'
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('user', '-pub_date', '-post'),
+                name='timeline_user_date_idx'
+            ),
+            models.Index(
+                fields=('user', 'author'),
+                name='timeline_user_author_idx'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.post} в ленте {self.user}'
+
+
+class AuthorStats(models.Model):
+    """Денормализованные счётчики пользователя."""
+
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Пользователь'
+    )
+    posts_count = models.PositiveIntegerField(
+        default=0, verbose_name='Записей'
+    )
+    comments_count = models.PositiveIntegerField(
+        default=0, verbose_name='Комментариев'
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0, db_index=True, verbose_name='Подписчиков'
+    )
+    following_count = models.PositiveIntegerField(
+        default=0, verbose_name='Подписок'
+    )
+
+    class Meta:
+        verbose_name = 'Счётчики пользователя'
+        verbose_name_plural = 'Счётчики пользователей'
+
+    def __str__(self):
+        return f'Счётчики {self.user}'
+
+
+class TrendingScore(models.Model):
+    """Счёт записи в рейтинге популярных (posts.trending)."""
+
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='trending',
+        verbose_name='Запись'
+    )
+    group = models.ForeignKey(
+        Group,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name='+',
+        verbose_name='Группа записи'
+    )
+    # Логарифм суммы весов событий, умноженных на e^(λ·t): порядок
+    # по нему совпадает с порядком по затухающему счёту в любой момент,
+    # поэтому старые строки не нужно пересчитывать.
+    score = models.FloatField(verbose_name='Счёт')
+
+    class Meta:
+        verbose_name = 'Счёт популярности'
+        verbose_name_plural = 'Счета популярности'
+        indexes = (
+            models.Index(fields=('-score',), name='trending_score_idx'),
+            models.Index(
+                fields=('group', '-score'), name='trending_group_score_idx'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.post}: {self.score:.2f}'
+
+
+class TrendingWatermark(models.Model):
+    """Последний учтённый id событий каждого вида."""
+
+    source = models.CharField(
+        max_length=20, primary_key=True, verbose_name='Источник'
+    )
+    last_id = models.PositiveIntegerField(
+        default=0, verbose_name='Последний id'
+    )
+
+    class Meta:
+        verbose_name = 'Водяной знак рейтинга'
+        verbose_name_plural = 'Водяные знаки рейтинга'
+
+    def __str__(self):
+        return f'{self.source}: {self.last_id}'
+
+
+class Suggestion(models.Model):
+    """Подсказка пользователю: автор или группа (posts.recommendations)."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='suggestions',
+        verbose_name='Пользователь'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True,
+        related_name='+',
+        verbose_name='Автор'
+    )
+    group = models.ForeignKey(
+        Group,
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True,
+        related_name='+',
+        verbose_name='Группа'
+    )
+    score = models.FloatField(verbose_name='Счёт')
+
+    class Meta:
+        verbose_name = 'Подсказка'
+        verbose_name_plural = 'Подсказки'
+        indexes = (
+            models.Index(
+                fields=('user', '-score'), name='suggestion_user_score_idx'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.author or self.group} для {self.user}'
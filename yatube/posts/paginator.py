@@ -0,0 +1,181 @@
+import base64
+import binascii
+import heapq
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+class CursorPaginator(Paginator):
+    """Постраничный вывод по ключу (дата, id) без COUNT(*) и OFFSET.
+
+    Страницы адресуются непрозрачными курсорами ?after=/?before=,
+    поэтому стоимость запроса не зависит от глубины страницы.
+    Дополнительные источники (add_source) сливаются с основным
+    по тому же ключу, совпадающие ключи выводятся один раз.
+    """
+
+    has_last_page = True
+
+    def __init__(self, object_list, per_page, fields=('pub_date', 'id'),
+                 transform=None, version='updated'):
+        super().__init__(object_list, per_page)
+        self.sources = []
+        self.add_source(object_list, fields, transform, version)
+        self.next_cursor = None
+        self.previous_cursor = None
+
+    def add_source(self, queryset, fields=('pub_date', 'id'),
+                   transform=None, version='updated'):
+        """version — поле с датой изменения строки для get_versions."""
+        self.sources.append((queryset, fields, transform, version))
+
+    def encode(self, key):
+        value, pk = key
+        raw = f'{value.isoformat()}|{pk}'.encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode(self, cursor):
+        if not cursor:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            value, pk = raw.decode().split('|')
+            value = parse_datetime(value)
+            pk = int(pk)
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            return None
+        if value is None:
+            return None
+        return value, pk
+
+    def filter_source(self, source, cursor, reverse):
+        queryset, (date_field, id_field), _, _ = source
+        if cursor is not None:
+            value, pk = cursor
+            lookup = 'gt' if reverse else 'lt'
+            queryset = queryset.filter(
+                Q(**{f'{date_field}__{lookup}': value})
+                | Q(**{date_field: value, f'{id_field}__{lookup}': pk})
+            )
+        if reverse:
+            ordering = (date_field, id_field)
+        else:
+            ordering = (f'-{date_field}', f'-{id_field}')
+        return queryset.order_by(*ordering)
+
+    def get_source_rows(self, source, cursor, reverse):
+        _, (date_field, id_field), transform, _ = source
+        queryset = self.filter_source(source, cursor, reverse)
+        for obj in queryset[:self.per_page + 1]:
+            key = (getattr(obj, date_field), getattr(obj, id_field))
+            yield key, transform(obj) if transform else obj
+
+    def get_rows(self, cursor, reverse):
+        if len(self.sources) == 1:
+            return list(self.get_source_rows(self.sources[0], cursor, reverse))
+        merged = heapq.merge(
+            *(list(self.get_source_rows(source, cursor, reverse))
+              for source in self.sources),
+            key=itemgetter(0), reverse=not reverse,
+        )
+        rows = []
+        for key, obj in merged:
+            if rows and rows[-1][0] == key:
+                continue
+            rows.append((key, obj))
+            if len(rows) > self.per_page:
+                break
+        return rows
+
+    def get_page(self, after=None, before=None, last=False):
+        after, before = self.decode(after), self.decode(before)
+        if before is not None or last:
+            rows = self.get_rows(before, reverse=True)
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            has_next = before is not None
+        else:
+            rows = self.get_rows(after, reverse=False)
+            has_next = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            has_previous = after is not None
+        if not rows and (after is not None or before is not None):
+            return self.get_page()
+        if rows and has_previous:
+            self.previous_cursor = self.encode(rows[0][0])
+        if rows and has_next:
+            self.next_cursor = self.encode(rows[-1][0])
+        # Page вычисляет has_next/has_previous через number и num_pages,
+        # поэтому номера страниц здесь условные и COUNT(*) не нужен.
+        number = 2 if has_previous else 1
+        self.num_pages = number + 1 if has_next else number
+        return Page([obj for key, obj in rows], number, self)
+
+    def get_versions(self, after=None, before=None, last=False):
+        """(id, дата изменения) строк, из которых собирается страница.
+
+        Дешёвая замена get_page для условных запросов: выбираются
+        только ключи по тем же индексам, объекты не создаются.
+        """
+        after, before = self.decode(after), self.decode(before)
+        cursor, reverse = (before, True) if before or last else (after, False)
+        versions = []
+        for source in self.sources:
+            _, (_, id_field), _, version = source
+            versions.extend(
+                self.filter_source(source, cursor, reverse).prefetch_related(
+                    None
+                ).values_list(id_field, version)[:self.per_page + 1]
+            )
+        if not versions and cursor is not None:
+            return self.get_versions()
+        return sorted(versions)
+
+
+class FrozenPaginator(Paginator):
+    """Состояние CursorPaginator после get_page, без querysets."""
+
+    def __init__(self, per_page, num_pages, next_cursor, previous_cursor,
+                 has_last_page):
+        super().__init__([], per_page)
+        self.num_pages = num_pages
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.has_last_page = has_last_page
+
+
+def freeze(page):
+    """Страница в виде, пригодном для кеша; обратное — thaw()."""
+    paginator = page.paginator
+    return (
+        list(page.object_list), page.number, paginator.per_page,
+        paginator.num_pages, paginator.next_cursor,
+        paginator.previous_cursor, paginator.has_last_page,
+    )
+
+
+def thaw(state):
+    object_list, number, *paginator_state = state
+    return Page(object_list, number, FrozenPaginator(*paginator_state))
+
+
+def paginate(request, queryset, per_page=None, **kwargs):
+    return get_page(request, CursorPaginator(
+        queryset, per_page or settings.PAGE_COUNT, **kwargs
+    ))
+
+
+def get_cursor(request):
+    return {
+        'after': request.GET.get('after'),
+        'before': request.GET.get('before'),
+        'last': 'last' in request.GET,
+    }
+
+
+def get_page(request, paginator):
+    return paginator.get_page(**get_cursor(request))
@@ -0,0 +1,226 @@
+"""Подсказки «кого почитать» и «какие группы посмотреть».
+
+Граф подписок — разреженная матрица F в формате CSR (scipy): строка u
+отмечает авторов u, номер строки и столбца — id пользователя. Счета
+авторов для пачки пользователей B считаются произведениями матриц:
+    F[B]·F — друзья друзей: на кого подписаны авторы u;
+    F[B]·W·R·F — совместные подписки: на кого ещё подписаны читатели
+    авторов u. R оставляет не больше RECOMMENDATIONS_COFOLLOW_SAMPLE
+    читателей на автора, W уменьшает вклад популярного автора
+    как 1 / ln(2 + подписчиков).
+Группы оцениваются произведением F[B]·G, где G — число записей
+каждого автора в каждой группе. Сам пользователь и уже прочитанные
+авторы (и группы, где он пишет сам) из счёта вычёркиваются.
+
+rebuild() считает подсказки пачками пользователей и сохраняет лучшие
+RECOMMENDATIONS_LENGTH каждого вида в Suggestion. Страницы только
+читают готовые строки.
+"""
+from array import array
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
+from scipy import sparse
+
+from core import db
+from .models import Follow, Post, Suggestion
+
+
+class Graph:
+    """Граф подписок: матрица CSR и её копия по столбцам (CSC)."""
+
+    def __init__(self, size, edges):
+        """edges — пары (подписчик, автор), упорядоченные по подписчику."""
+        self.size = size
+        counts = np.zeros(size + 1, dtype=np.int64)
+        authors = array('i')
+        for user, author in edges:
+            authors.append(author)
+            counts[user + 1] += 1
+        self.matrix = sparse.csr_matrix((
+            np.ones(len(authors), dtype=np.float32),
+            np.frombuffer(authors, dtype=np.int32),
+            np.cumsum(counts),
+        ), shape=(size, size))
+        self.matrix.sort_indices()
+        self.reverse = self.matrix.tocsc()
+        self.reverse.sort_indices()
+        self._cofollow = None
+
+    @classmethod
+    def load(cls, chunk_size=10000):
+        """Граф из таблицы подписок одним упорядоченным проходом."""
+        last = Follow.objects.aggregate(
+            user=Max('user_id'), author=Max('author_id')
+        )
+        size = max(last['user'] or 0, last['author'] or 0) + 1
+        edges = Follow.objects.order_by('user_id', 'author_id').values_list(
+            'user_id', 'author_id'
+        ).iterator(chunk_size=chunk_size)
+        return cls(size, edges)
+
+    def __len__(self):
+        return self.matrix.nnz
+
+    def following(self, user):
+        matrix = self.matrix
+        return matrix.indices[matrix.indptr[user]:matrix.indptr[user + 1]]
+
+    def followers(self, author):
+        reverse = self.reverse
+        return reverse.indices[
+            reverse.indptr[author]:reverse.indptr[author + 1]
+        ]
+
+    def users(self):
+        """Пользователи с подписками по возрастанию id."""
+        return np.flatnonzero(np.diff(self.matrix.indptr))
+
+    def nbytes(self):
+        return sum(
+            values.nbytes for matrix in (self.matrix, self.reverse)
+            for values in (matrix.data, matrix.indices, matrix.indptr)
+        )
+
+    def cofollow(self, sample):
+        """W·R: первые sample читателей каждого автора с весом автора."""
+        if self._cofollow is None or self._cofollow[0] != sample:
+            indptr = self.reverse.indptr
+            counts = np.diff(indptr)
+            authors = np.repeat(np.arange(self.size), counts)
+            rank = np.arange(len(authors)) - indptr[authors]
+            sampled = rank < sample
+            weights = 1 / np.log(2 + counts)
+            self._cofollow = sample, sparse.csr_matrix((
+                weights[authors[sampled]],
+                (authors[sampled], self.reverse.indices[sampled]),
+            ), shape=(self.size, self.size))
+        return self._cofollow[1]
+
+    def author_scores(self, users, sample):
+        """Счета авторов для users: строка i — пользователь users[i]."""
+        rows = self.matrix[users]
+        scores = rows @ self.matrix + (
+            rows @ self.cofollow(sample)
+        ) @ self.matrix
+        own = sparse.csr_matrix((
+            np.ones(len(users)), (np.arange(len(users)), users)
+        ), shape=scores.shape)
+        return drop(scores, rows + own)
+
+
+def drop(scores, mask):
+    """Вычёркивает из scores ненулевые позиции mask."""
+    scores = sparse.csr_matrix(scores - scores.multiply(mask > 0))
+    scores.eliminate_zeros()
+    return scores
+
+
+def top(scores, limit):
+    """Лучшие limit значений каждой строки: (строки, столбцы, счета).
+
+    При равном счёте выше меньший id: сортировка устойчива,
+    а столбцы в строке уже упорядочены.
+    """
+    scores.sort_indices()
+    rows = np.repeat(
+        np.arange(scores.shape[0]), np.diff(scores.indptr)
+    )
+    order = np.lexsort((-scores.data, rows))
+    rank = np.arange(len(order)) - scores.indptr[rows[order]]
+    order = order[rank < limit]
+    return rows[order], scores.indices[order], scores.data[order]
+
+
+def load_author_groups(size):
+    """Матрица G: число записей автора (строка) в группе (столбец)."""
+    rows = Post.objects.filter(
+        group__isnull=False, author_id__lt=size
+    ).values_list('author_id', 'group_id').annotate(
+        posts=Count('pk')
+    ).order_by()
+    authors, groups, posts = np.array(
+        list(rows), dtype=np.int64
+    ).reshape(-1, 3).T
+    width = groups.max() + 1 if len(groups) else 1
+    return sparse.csr_matrix(
+        (posts.astype(np.float64), (authors, groups)), shape=(size, width)
+    )
+
+
+def group_scores(graph, author_groups, users):
+    # Группы, где пользователь пишет сам, он уже знает.
+    return drop(graph.matrix[users] @ author_groups, author_groups[users])
+
+
+def build(graph, author_groups, users):
+    limit = settings.RECOMMENDATIONS_LENGTH
+    sample = settings.RECOMMENDATIONS_COFOLLOW_SAMPLE
+    users = np.asarray(users, dtype=np.int64)
+    if not len(users):
+        return
+    rows, authors, scores = top(graph.author_scores(users, sample), limit)
+    for row, author, score in zip(rows, authors, scores):
+        yield Suggestion(
+            user_id=int(users[row]), author_id=int(author),
+            score=float(score),
+        )
+    rows, groups, scores = top(
+        group_scores(graph, author_groups, users), limit
+    )
+    for row, group, score in zip(rows, groups, scores):
+        yield Suggestion(
+            user_id=int(users[row]), group_id=int(group), score=float(score)
+        )
+
+
+def save(suggestions, first, last):
+    """Заменяет подсказки пользователей с id в (first, last]."""
+    with transaction.atomic():
+        stale = Suggestion.objects.filter(user_id__gt=first)
+        if last is not None:
+            stale = stale.filter(user_id__lte=last)
+        stale.delete()
+        db.bulk_create(Suggestion, suggestions)
+
+
+def rebuild(batch_size=1000, graph=None):
+    """Пересчитывает подсказки всех пользователей.
+
+    Каждые batch_size пользователей считаются одним произведением
+    матриц и сохраняются своей транзакцией, поэтому запись в базу
+    не блокируется на всё время расчёта. Возвращает число
+    пользователей с подсказками.
+    """
+    if graph is None:
+        graph = Graph.load()
+    author_groups = load_author_groups(graph.size)
+    users = graph.users()
+    first = -1
+    for start in range(0, len(users), batch_size):
+        batch = users[start:start + batch_size]
+        last = int(batch[-1]) if start + batch_size < len(users) else None
+        save(list(build(graph, author_groups, batch)), first, last)
+        first = last
+    if not len(users):
+        save([], first, None)
+    return len(users)
+
+
+def get_suggestions(user):
+    """Готовые подсказки: (авторы, группы) по убыванию счёта."""
+    if not user.is_authenticated:
+        return [], []
+    suggestions = Suggestion.objects.filter(user=user).exclude(
+        author__following__user=user
+    ).select_related('author', 'group').order_by('-score')
+    shown = settings.RECOMMENDATIONS_SHOWN
+    authors, groups = [], []
+    for suggestion in suggestions:
+        if suggestion.author is not None:
+            authors.append(suggestion.author)
+        else:
+            groups.append(suggestion.group)
+    return authors[:shown], groups[:shown]
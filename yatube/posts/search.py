@@ -0,0 +1,166 @@
+import re
+
+from django.conf import settings
+from django.core.paginator import Page, Paginator
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Post
+
+FTS_TABLE = 'posts_post_fts'
+# Маркеры совпадений в snippet(): не встречаются в тексте записей
+# и переживают экранирование HTML.
+MATCH_START, MATCH_END = '\x02', '\x03'
+
+INSTALL_SQL = (
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        text, content='posts_post', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS posts_post_fts_insert
+        AFTER INSERT ON posts_post BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text);
+        END""",
+    f"""CREATE TRIGGER IF NOT EXISTS posts_post_fts_delete
+        AFTER DELETE ON posts_post BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text)
+            VALUES ('delete', old.id, old.text);
+        END""",
+    f"""CREATE TRIGGER IF NOT EXISTS posts_post_fts_update
+        AFTER UPDATE OF text ON posts_post BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text)
+            VALUES ('delete', old.id, old.text);
+            INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text);
+        END""",
+)
+
+
+def is_available():
+    return connection.vendor == 'sqlite'
+
+
+def install(using_connection=connection):
+    """Создаёт индекс FTS5 и триггеры синхронизации, если их нет.
+
+    На SQLite изменение схемы posts_post пересоздаёт таблицу вместе
+    с триггерами, поэтому установка повторяется после каждой миграции.
+    """
+    with using_connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+            [FTS_TABLE]
+        )
+        created = cursor.fetchone() is None
+        for sql in INSTALL_SQL:
+            cursor.execute(sql)
+        if created:
+            rebuild(using_connection)
+
+
+def rebuild(using_connection=connection):
+    with using_connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+        )
+
+
+def get_terms(query):
+    return re.findall(r'\w+', query)
+
+
+def to_match(query):
+    """Запрос пользователя в синтаксисе MATCH: все слова, по префиксу."""
+    return ' '.join(f'"{term}"*' for term in get_terms(query))
+
+
+def filter_posts(queryset, query):
+    """Оставляет в queryset записи, подходящие под запрос."""
+    terms = get_terms(query)
+    if not terms:
+        return queryset
+    if not is_available():
+        condition = Q()
+        for term in terms:
+            condition &= Q(text__icontains=term)
+        return queryset.filter(condition)
+    return queryset.filter(pk__in=RawSQL(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+        (to_match(query),)
+    ))
+
+
+def highlight(snippet):
+    return mark_safe(
+        escape(snippet)
+        .replace(MATCH_START, '<mark>')
+        .replace(MATCH_END, '</mark>')
+    )
+
+
+def find(query, offset, limit):
+    """Возвращает [(id, фрагмент)] по убыванию релевантности (bm25)."""
+    if not get_terms(query):
+        return []
+    if not is_available():
+        posts = filter_posts(Post.objects.all(), query)
+        return [
+            (pk, text[:settings.SEARCH_SNIPPET_LENGTH])
+            for pk, text in posts.values_list('pk', 'text')[
+                offset:offset + limit
+            ]
+        ]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""SELECT rowid, snippet({FTS_TABLE}, 0, %s, %s, '…', %s)
+                FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s
+                ORDER BY rank LIMIT %s OFFSET %s""",
+            [
+                MATCH_START, MATCH_END, settings.SEARCH_SNIPPET_TOKENS,
+                to_match(query), limit, offset,
+            ]
+        )
+        return cursor.fetchall()
+
+
+class SearchPaginator(Paginator):
+    """Постраничный вывод результатов поиска без COUNT(*).
+
+    Курсоры — смещения в выдаче, упорядоченной по релевантности.
+    """
+
+    has_last_page = False
+
+    def __init__(self, query, per_page):
+        super().__init__([], per_page)
+        self.query = query
+        self.next_cursor = None
+        self.previous_cursor = None
+
+    def get_page(self, after=None, before=None, last=False):
+        try:
+            if before:
+                offset = max(int(before) - self.per_page, 0)
+            else:
+                offset = max(int(after or 0), 0)
+        except ValueError:
+            offset = 0
+        rows = find(self.query, offset, self.per_page + 1)
+        has_next = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        posts = Post.objects.for_feed().in_bulk([pk for pk, _ in rows])
+        results = []
+        for pk, snippet in rows:
+            post = posts.get(pk)
+            if post is not None:
+                post.snippet = highlight(snippet)
+                results.append(post)
+        if has_next:
+            self.next_cursor = offset + self.per_page
+        if offset:
+            self.previous_cursor = offset
+        number = 2 if offset else 1
+        self.num_pages = number + 1 if has_next else number
+        return Page(results, number, self)
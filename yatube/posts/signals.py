@@ -0,0 +1,116 @@
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.db.models.signals import (
+    post_delete, post_migrate, post_save, pre_delete
+)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import counters, events, feed_cache, search, timeline
+from .models import AuthorStats, Comment, Follow, Group, Post
+
+User = get_user_model()
+
+# Поля автора, которые выводятся в карточке записи.
+CARD_AUTHOR_FIELDS = {'username', 'first_name', 'last_name'}
+COUNTER_FIELDS = {Post: 'posts_count', Comment: 'comments_count'}
+
+
+@receiver(post_save, sender=Post)
+def push_to_timelines(sender, instance, created, **kwargs):
+    if created:
+        timeline.push_post(instance)
+
+
+@receiver(post_save, sender=Post)
+def publish_new_post(sender, instance, created, **kwargs):
+    if created:
+        events.publish(instance)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_feed_cache(sender, instance, **kwargs):
+    feed_cache.invalidate()
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, **kwargs):
+    if created:
+        timeline.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def trim_timeline(sender, instance, **kwargs):
+    timeline.remove_author(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Group)
+def invalidate_group_cards(sender, instance, created, **kwargs):
+    if not created:
+        Post.objects.filter(group=instance).update(updated=timezone.now())
+        feed_cache.invalidate()
+
+
+@receiver(pre_delete, sender=Group)
+def invalidate_deleted_group_cards(sender, instance, **kwargs):
+    # Пока записи ещё ссылаются на группу: SET_NULL не меняет updated.
+    Post.objects.filter(group=instance).update(updated=timezone.now())
+
+
+@receiver(post_delete, sender=Group)
+def invalidate_feed_cache_for_group(sender, instance, **kwargs):
+    feed_cache.invalidate()
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_cards(sender, instance, created, update_fields,
+                            **kwargs):
+    if created:
+        AuthorStats.objects.get_or_create(user=instance)
+        return
+    if update_fields is not None and not CARD_AUTHOR_FIELDS & update_fields:
+        return
+    Post.objects.filter(author=instance).update(updated=timezone.now())
+    feed_cache.invalidate()
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Comment)
+def increment_author_counter(sender, instance, created, **kwargs):
+    if created:
+        counters.change(instance.author_id, COUNTER_FIELDS[sender], 1)
+
+
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=Comment)
+def decrement_author_counter(sender, instance, **kwargs):
+    counters.change(instance.author_id, COUNTER_FIELDS[sender], -1)
+
+
+@receiver(post_save, sender=Follow)
+def increment_follow_counters(sender, instance, created, **kwargs):
+    if created:
+        counters.change(instance.author_id, 'followers_count', 1)
+        counters.change(instance.user_id, 'following_count', 1)
+
+
+@receiver(post_delete, sender=Follow)
+def decrement_follow_counters(sender, instance, **kwargs):
+    counters.change(instance.author_id, 'followers_count', -1)
+    counters.change(instance.user_id, 'following_count', -1)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def check_fanout_threshold(sender, instance, created=True, **kwargs):
+    # Выполняется после обработчиков счётчиков, они объявлены выше.
+    if created:
+        timeline.check_threshold(instance.author_id)
+
+
+@receiver(post_migrate)
+def install_search_index(sender, using, **kwargs):
+    connection = connections[using]
+    if sender.name == 'posts' and connection.vendor == 'sqlite':
+        search.install(connection)
@@ -0,0 +1,43 @@
+from django import template
+from django.conf import settings
+
+from posts import thumbnails
+from posts.models import ImageVariant
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_thumbnail(image):
+    """Готовая миниатюра или None: в запросе картинка не масштабируется."""
+    if not image:
+        return None
+    thumbnail = thumbnails.lookup(image)
+    if thumbnail is None:
+        thumbnails.schedule(image.name)
+    return thumbnail
+
+
+@register.simple_tag
+def variant_srcsets(post):
+    """srcset по форматам из сохранённых вариантов картинки.
+
+    Рассчитан на prefetch_related('image_variants'): файлы и Pillow
+    при выводе не используются.
+    """
+    srcsets = {}
+    fallback = None
+    for variant in post.image_variants.all():
+        srcsets.setdefault(variant.format, []).append(
+            f'{variant.url} {variant.width}w'
+        )
+        if variant.format == ImageVariant.JPEG and (
+            fallback is None
+            or variant.width <= settings.POST_IMAGE_DEFAULT_WIDTH
+        ):
+            fallback = variant.url
+    if not srcsets:
+        return {}
+    srcsets = {key: ', '.join(value) for key, value in srcsets.items()}
+    srcsets['src'] = fallback
+    return srcsets
@@ -0,0 +1,154 @@
+from django.contrib.auth import get_user_model
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts import write_buffer
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class ApiTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(
+            username='author', first_name='Лев', last_name='Толстой'
+        )
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, group=cls.group, text='Запись'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def assert_not_modified(self, client, url):
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(1):
+            repeat = client.get(
+                url, HTTP_IF_NONE_MATCH=response['ETag']
+            )
+        self.assertEqual(repeat.status_code, 304)
+        self.assertEqual(repeat.content, b'')
+        self.assertEqual(repeat['ETag'], response['ETag'])
+        return response
+
+    def test_feeds(self):
+        feeds = (
+            (self.client, reverse('posts:api_index')),
+            (self.client, reverse('posts:api_group_list', args=('group',))),
+            (self.client, reverse('posts:api_profile', args=('author',))),
+        )
+        for client, url in feeds:
+            with self.subTest(url=url):
+                response = self.assert_not_modified(client, url)
+                self.assertFalse(response['ETag'].startswith('W/'))
+                self.assertIn('Last-Modified', response)
+                self.assertEqual(response.json()['results'], [{
+                    'id': self.post.pk,
+                    'text': 'Запись',
+                    'pub_date': self.post.pub_date.isoformat(),
+                    'author': 'author',
+                    'group': 'group',
+                    'image': None,
+                }])
+
+    def test_follow_feed(self):
+        url = reverse('posts:api_follow_index')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 403)
+        self.assertIn('detail', response.json())
+        response = self.reader_client.get(url)
+        self.assertEqual(
+            [post['id'] for post in response.json()['results']],
+            [self.post.pk]
+        )
+
+    def test_extra_fields(self):
+        group = self.client.get(
+            reverse('posts:api_group_list', args=('group',))
+        ).json()['group']
+        self.assertEqual(group['description'], 'Описание')
+        author = self.client.get(
+            reverse('posts:api_profile', args=('author',))
+        ).json()['author']
+        self.assertEqual(author['full_name'], 'Лев Толстой')
+
+    def test_missing_objects(self):
+        urls = (
+            reverse('posts:api_group_list', args=('missing',)),
+            reverse('posts:api_profile', args=('missing',)),
+            reverse('posts:api_post_detail', args=(0,)),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_empty_group(self):
+        Group.objects.create(title='Пустая', slug='empty')
+        response = self.client.get(
+            reverse('posts:api_group_list', args=('empty',))
+        )
+        self.assertEqual(response.json()['results'], [])
+
+    def test_changes_invalidate_etag(self):
+        url = reverse('posts:api_index')
+        etag = self.client.get(url)['ETag']
+        post = Post.objects.create(author=self.author, text='Новая')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        post.text = 'Исправленная'
+        post.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['text'], 'Исправленная')
+
+    def test_post_detail(self):
+        url = reverse('posts:api_post_detail', args=(self.post.pk,))
+        response = self.assert_not_modified(self.client, url)
+        data = response.json()
+        self.assertEqual(data['post']['group']['slug'], 'group')
+        self.assertEqual(data['comments'], [])
+        Comment.objects.create(
+            post=self.post, author=self.reader, text='Комментарий'
+        )
+        response = self.client.get(
+            url, HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()['comments'][0]['text'], 'Комментарий'
+        )
+
+    @override_settings(
+        WRITE_BUFFER_ENABLED=True, WRITE_BUFFER_MAX_ROWS=100,
+        WRITE_BUFFER_MAX_DELAY=3600, WRITE_BUFFER_DURABILITY='memory',
+    )
+    def test_pending_comment_changes_etag(self):
+        self.addCleanup(write_buffer.flush)
+        url = reverse('posts:api_post_detail', args=(self.post.pk,))
+        etag = self.client.get(url)['ETag']
+        self.reader_client.post(
+            reverse('posts:add_comment', args=(self.post.pk,)),
+            {'text': 'В буфере'}
+        )
+        self.assertFalse(Comment.objects.exists())
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['comments'][0]['text'], 'В буфере')
+
+    def test_if_modified_since(self):
+        url = reverse('posts:api_index')
+        response = self.client.get(url)
+        repeat = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        )
+        self.assertEqual(repeat.status_code, 304)
@@ -0,0 +1,541 @@
+import gzip
+import json
+import math
+import os
+import re
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from posts import recommendations, thumbnails, trending
+from posts.models import (AuthorStats, Comment, Follow, Group, Post,
+                          Suggestion, ThumbnailTask, TimelineEntry,
+                          TrendingScore)
+
+User = get_user_model()
+
+
+class FanoutReportTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        for index in range(3):
+            Follow.objects.create(
+                user=User.objects.create_user(username=f'reader{index}'),
+                author=cls.author
+            )
+        Post.objects.create(text='Запись', author=cls.author)
+
+    def test_report_counts_pulled_authors(self):
+        out = StringIO()
+        call_command('fanout_report', threshold=2, stdout=out)
+        self.assertIn('Порог 2: 1 авторов', out.getvalue())
+        self.assertIn('экономия 3 записей', out.getvalue())
+
+
+class ReconcileCountersTest(TestCase):
+    def test_drift_is_repaired(self):
+        author = User.objects.create_user(username='author')
+        Post.objects.bulk_create(
+            Post(text=f'Запись {index}', author=author) for index in range(3)
+        )
+        reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=reader, author=author)
+        AuthorStats.objects.filter(user=author).delete()
+        AuthorStats.objects.filter(user=reader).update(following_count=7)
+        out = StringIO()
+        call_command('reconcile_counters', stdout=out)
+        self.assertIn('без счётчиков 1, с расхождениями 1', out.getvalue())
+        stats = AuthorStats.objects.get(user=author)
+        self.assertEqual(stats.posts_count, 3)
+        self.assertEqual(stats.followers_count, 1)
+        self.assertEqual(
+            AuthorStats.objects.get(user=reader).following_count, 1
+        )
+
+    def test_large_batch_size(self):
+        User.objects.bulk_create(
+            User(username=f'user{index}') for index in range(600)
+        )
+        out = StringIO()
+        call_command('reconcile_counters', batch_size=1000, stdout=out)
+        self.assertIn('без счётчиков 600', out.getvalue())
+        self.assertEqual(AuthorStats.objects.count(), 600)
+
+
+class GenerateThumbnailsTest(TestCase):
+    def test_fill_gap_skips_missing_and_ready_images(self):
+        self.assertFalse(thumbnails.fill_gap('posts/missing.jpg'))
+
+
+@override_settings(THUMBNAIL_RETRY_DELAY=60, THUMBNAIL_RETRY_MAX_DELAY=100)
+class ProcessThumbnailsTest(TestCase):
+    def process(self, results):
+        out = StringIO()
+        with mock.patch(
+            'posts.management.commands.process_thumbnails.fill_gap',
+            side_effect=lambda name: results[name]
+        ), mock.patch(
+            'posts.management.commands.process_thumbnails'
+            '.ProcessPoolExecutor', ThreadPoolExecutor
+        ):
+            call_command('process_thumbnails', once=True, stdout=out)
+        return out.getvalue()
+
+    def test_failed_tasks_are_kept_with_backoff(self):
+        ThumbnailTask.objects.bulk_create([
+            ThumbnailTask(name='posts/ok.jpg'),
+            ThumbnailTask(name='posts/ready.jpg'),
+            ThumbnailTask(name='posts/broken.jpg'),
+        ])
+        out = self.process({
+            'posts/ok.jpg': True, 'posts/ready.jpg': False,
+            'posts/broken.jpg': None,
+        })
+        self.assertIn('Обработано задач: 2, отложено после ошибки: 1', out)
+        task = ThumbnailTask.objects.get()
+        self.assertEqual(task.name, 'posts/broken.jpg')
+        self.assertEqual(task.attempts, 1)
+        delay = task.next_attempt - timezone.now()
+        self.assertTrue(
+            timedelta(seconds=50) < delay <= timedelta(seconds=60)
+        )
+
+        # Отложенную задачу не берём, пока не подошла её очередь.
+        self.process({})
+        self.assertEqual(ThumbnailTask.objects.get().attempts, 1)
+
+        ThumbnailTask.objects.update(next_attempt=timezone.now())
+        self.process({'posts/broken.jpg': None})
+        task = ThumbnailTask.objects.get()
+        self.assertEqual(task.attempts, 2)
+        delay = task.next_attempt - timezone.now()
+        self.assertTrue(
+            timedelta(seconds=90) < delay <= timedelta(seconds=100)
+        )
+
+        ThumbnailTask.objects.update(next_attempt=None)
+        self.process({'posts/broken.jpg': True})
+        self.assertFalse(ThumbnailTask.objects.exists())
+
+
+class ImportPostsTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        Group.objects.create(title='Новости', slug='news')
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as output:
+            output.write(content)
+        return path
+
+    def import_rows(self, rows, **options):
+        path = self.write('rows.ndjson', '\n'.join(
+            row if isinstance(row, str) else json.dumps(row) for row in rows
+        ))
+        out, err = StringIO(), StringIO()
+        call_command(
+            'import_posts', path, stdout=out, stderr=err, **options
+        )
+        return out.getvalue(), err.getvalue()
+
+    def test_ndjson_import(self):
+        out, err = self.import_rows([
+            {'type': 'post', 'id': 100, 'text': 'Старая запись',
+             'author': 'author', 'group': 'news',
+             'pub_date': '2015-03-01T10:00:00+00:00'},
+            {'type': 'comment', 'post': 100, 'text': 'Комментарий',
+             'author': 'reader'},
+            {'type': 'follow', 'user': 'reader', 'author': 'author'},
+        ], batch_size=1)
+        self.assertIn(
+            'записей 1, комментариев 1, подписок 1; строк с ошибками 0',
+            out
+        )
+        self.assertIn('строк/с', out)
+        post = Post.objects.get(pk=100)
+        self.assertEqual(post.group.slug, 'news')
+        self.assertEqual(post.pub_date.year, 2015)
+        self.assertEqual(post.updated, post.pub_date)
+        self.assertTrue(Comment.objects.filter(post=post).exists())
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.reader, post=post
+        ).exists())
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.author).posts_count, 1
+        )
+
+    def test_dates_are_automatic_again_after_import(self):
+        self.import_rows([
+            {'text': 'Запись', 'author': 'author', 'pub_date': '2015-01-01'},
+        ])
+        post = Post.objects.create(text='Новая запись', author=self.author)
+        self.assertNotEqual(post.pub_date.year, 2015)
+
+    def test_invalid_rows_are_reported_and_skipped(self):
+        out, err = self.import_rows([
+            {'text': 'Запись', 'author': 'author'},
+            'не JSON',
+            {'text': '', 'author': 'author'},
+            {'text': 'Запись', 'author': 'stranger'},
+            {'text': 'Запись', 'author': 'author', 'group': 'missing'},
+            {'type': 'comment', 'post': 999, 'text': 'Текст',
+             'author': 'author'},
+            {'type': 'follow', 'user': 'author', 'author': 'author'},
+        ])
+        self.assertIn('записей 1, комментариев 0, подписок 0', out)
+        self.assertIn('строк с ошибками 6', out)
+        self.assertIn('Строка 4: нет пользователя', err)
+        self.assertIn('Строка 6: нет записи 999', err)
+
+    def test_duplicate_ids_are_rejected(self):
+        Post.objects.create(pk=5, text='Запись', author=self.author)
+        out, err = self.import_rows([
+            {'id': 5, 'text': 'Повтор', 'author': 'author'},
+            {'id': 6, 'text': 'Запись', 'author': 'author'},
+            {'id': 6, 'text': 'Повтор', 'author': 'author'},
+        ])
+        self.assertIn('записей 1', out)
+        self.assertEqual(Post.objects.get(pk=6).text, 'Запись')
+
+    def test_repeated_follows_are_not_counted(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        other = User.objects.create_user(username='other')
+        out, _ = self.import_rows([
+            {'type': 'follow', 'user': 'reader', 'author': 'author'},
+            {'type': 'follow', 'user': 'other', 'author': 'author'},
+            {'type': 'follow', 'user': 'other', 'author': 'author'},
+        ])
+        self.assertIn('подписок 1; строк с ошибками 0', out)
+        self.assertEqual(Follow.objects.filter(user=other).count(), 1)
+
+    def test_create_missing(self):
+        out, err = self.import_rows([
+            {'text': 'Запись', 'author': 'newcomer', 'group': 'fresh'},
+        ], create_missing=True)
+        post = Post.objects.get(author__username='newcomer')
+        self.assertEqual(post.group.slug, 'fresh')
+        self.assertTrue(AuthorStats.objects.filter(user=post.author).exists())
+
+    def test_csv_import(self):
+        path = self.write(
+            'comments.csv',
+            'post,author,text,created\n'
+            f'{self.post_id()},reader,"Текст, с запятой",2020-01-01T00:00\n'
+        )
+        out = StringIO()
+        call_command(
+            'import_posts', path, type='comment', stdout=out,
+            stderr=StringIO()
+        )
+        self.assertIn('комментариев 1', out.getvalue())
+        comment = Comment.objects.get()
+        self.assertEqual(comment.text, 'Текст, с запятой')
+        self.assertEqual(comment.created.year, 2020)
+
+    def post_id(self):
+        return Post.objects.create(text='Запись', author=self.author).pk
+
+
+class ExportContentTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Новости', slug='news')
+        cls.post = Post.objects.create(
+            text='Запись, с запятой', author=cls.author, group=cls.group
+        )
+        Comment.objects.create(
+            post=cls.post, author=cls.reader, text='Комментарий'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'export')
+
+    def export(self, **options):
+        err = StringIO()
+        call_command(
+            'export_content', output=self.path, stderr=err, **options
+        )
+        opener = gzip.open if options.get('gzip') else open
+        with opener(self.path, 'rt', encoding='utf-8') as source:
+            return source.read(), err.getvalue()
+
+    def test_ndjson_export(self):
+        content, err = self.export()
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([row['type'] for row in rows], [
+            'post', 'comment', 'follow'
+        ])
+        self.assertEqual(rows[0]['author'], 'author')
+        self.assertEqual(rows[0]['group'], 'news')
+        self.assertEqual(rows[1]['post'], self.post.pk)
+        self.assertEqual(rows[2], {
+            'type': 'follow', 'user': 'reader', 'author': 'author'
+        })
+        self.assertIn(
+            f'Водяной знак posts: {self.post.pub_date.isoformat()}', err
+        )
+
+    def test_gzip_csv_export(self):
+        content, _ = self.export(
+            content=['posts'], format='csv', gzip=True
+        )
+        self.assertEqual(
+            content.splitlines()[0], 'id,text,author,group,pub_date,updated'
+        )
+        self.assertIn('"Запись, с запятой",author,news', content)
+
+    def test_incremental_export(self):
+        content, err = self.export(since=self.post.pub_date.isoformat())
+        self.assertNotIn('"type": "post"', content)
+        self.assertIn('"type": "follow"', content)
+        self.assertIn(
+            f'Водяной знак posts: {self.post.pub_date.isoformat()}', err
+        )
+        newer = Post.objects.create(text='Новая запись', author=self.author)
+        content, _ = self.export(
+            content=['posts'], since=self.post.pub_date.isoformat()
+        )
+        self.assertEqual(json.loads(content)['id'], newer.pk)
+
+    def test_naive_since(self):
+        since = timezone.localtime(self.post.pub_date).replace(tzinfo=None)
+        content, err = self.export(since=since.isoformat())
+        self.assertNotIn('"type": "post"', content)
+        self.assertIn(
+            f'Водяной знак posts: {self.post.pub_date.isoformat()}', err
+        )
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        self.client.force_login(admin)
+        response = self.client.get(reverse('admin:posts_export'), {
+            'content': 'posts', 'since': '2020-01-01T00:00:00',
+        })
+        self.assertEqual(response.status_code, 200)
+        row = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(row['id'], self.post.pk)
+
+    def test_export_round_trip(self):
+        content, _ = self.export()
+        Post.objects.all().delete()
+        Follow.objects.all().delete()
+        path = os.path.join(self.directory, 'rows.ndjson')
+        with open(path, 'w', encoding='utf-8') as output:
+            output.write(content)
+        call_command('import_posts', path, stdout=StringIO())
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(post.pub_date, self.post.pub_date)
+        self.assertEqual(post.comments.count(), 1)
+        self.assertTrue(Follow.objects.filter(user=self.reader).exists())
+
+    def test_admin_download(self):
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_export'), {'content': 'posts', 'gzip': ''}
+        )
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        row = json.loads(gzip.decompress(
+            b''.join(response.streaming_content)
+        ))
+        self.assertEqual(row['id'], self.post.pk)
+        self.assertEqual(
+            response['X-Export-Watermark-posts'],
+            self.post.pub_date.isoformat()
+        )
+        response = self.client.get(
+            reverse('admin:posts_post_changelist')
+        )
+        self.assertContains(response, reverse('admin:posts_export'))
+
+    def test_admin_download_requires_view_permission(self):
+        staff = User.objects.create_user(username='staff', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(reverse('admin:posts_export'))
+        self.assertEqual(response.status_code, 403)
+
+
+class UpdateTrendingTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.old = Post.objects.create(text='Старая', author=cls.author)
+        cls.new = Post.objects.create(
+            text='Новая', author=cls.author, group=cls.group
+        )
+
+    def comment(self, post, age=timedelta()):
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text='Комментарий'
+        )
+        Comment.objects.filter(pk=comment.pk).update(
+            created=timezone.now() - age
+        )
+
+    def update(self, **options):
+        out = StringIO()
+        call_command('update_trending', stdout=out, **options)
+        return out.getvalue()
+
+    def test_recent_activity_ranks_higher(self):
+        for _ in range(3):
+            self.comment(self.old, age=timedelta(days=1))
+        self.comment(self.new)
+        self.assertIn('Учтено событий: 4', self.update())
+        self.assertEqual(trending.get_ranking(), [self.new.pk, self.old.pk])
+        self.assertEqual(trending.get_ranking(self.group), [self.new.pk])
+
+    def test_update_reads_only_new_events(self):
+        self.comment(self.old)
+        self.update()
+        score = TrendingScore.objects.get(post=self.old).score
+        self.assertIn('Учтено событий: 0', self.update())
+        self.assertEqual(TrendingScore.objects.get(post=self.old).score, score)
+        self.comment(self.old)
+        self.assertIn('Учтено событий: 1', self.update())
+        self.assertGreater(
+            TrendingScore.objects.get(post=self.old).score, score
+        )
+
+    def test_follow_raises_latest_post(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.update()
+        self.assertEqual(trending.get_ranking(), [self.new.pk])
+
+    def test_many_follows_fit_query_limits(self):
+        User.objects.bulk_create(
+            User(username=f'author{index}') for index in range(1100)
+        )
+        authors = User.objects.filter(username__regex=r'^author\d+$')
+        Post.objects.bulk_create(
+            Post(text='Запись', author=author) for author in authors
+        )
+        Follow.objects.bulk_create(
+            Follow(user=self.reader, author=author) for author in authors
+        )
+        with CaptureQueriesContext(connection) as queries:
+            out = self.update(batch_size=1000)
+        self.assertIn('Учтено событий: 1100', out)
+        self.assertEqual(TrendingScore.objects.count(), 1100)
+        # Списки id в IN не упираются в предел SQLite на 999 параметров.
+        lists = re.findall(
+            r' IN \(([^)]*)\)', ' '.join(q['sql'] for q in queries)
+        )
+        self.assertLessEqual(
+            max(len(ids.split(',')) for ids in lists), trending.LOOKUP_SIZE
+        )
+
+    def test_faded_posts_are_pruned(self):
+        self.comment(self.old, age=timedelta(days=30))
+        self.update()
+        self.assertFalse(TrendingScore.objects.exists())
+
+    def test_rebuild_skips_old_follows(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.comment(self.old)
+        self.update()
+        self.assertIn('Учтено событий: 1', self.update(rebuild=True))
+        self.assertEqual(trending.get_ranking(), [self.old.pk])
+
+
+class BuildRecommendationsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.users = {
+            name: User.objects.create_user(username=name)
+            for name in ('reader', 'author', 'friend', 'neighbour', 'other')
+        }
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        for user, author in (
+            ('reader', 'author'), ('author', 'friend'),
+            ('neighbour', 'author'), ('neighbour', 'other'),
+        ):
+            Follow.objects.create(
+                user=cls.users[user], author=cls.users[author]
+            )
+        Post.objects.create(
+            text='Запись', author=cls.users['author'], group=cls.group
+        )
+
+    def test_graph_arrays(self):
+        graph = recommendations.Graph.load()
+        reader, author = self.users['reader'].pk, self.users['author'].pk
+        self.assertEqual(len(graph), 4)
+        self.assertEqual(list(graph.following(reader)), [author])
+        self.assertEqual(
+            sorted(graph.followers(author)),
+            [reader, self.users['neighbour'].pk]
+        )
+
+    def test_suggestions_are_stored(self):
+        out = StringIO()
+        call_command('build_recommendations', stdout=out)
+        self.assertIn('Граф: 4 подписок', out.getvalue())
+        authors, groups = recommendations.get_suggestions(
+            self.users['reader']
+        )
+        self.assertEqual(authors[0], self.users['friend'])
+        self.assertIn(self.users['other'], authors)
+        self.assertNotIn(self.users['author'], authors)
+        self.assertEqual(groups, [self.group])
+
+    def test_author_scores(self):
+        recommendations.rebuild()
+        scores = dict(Suggestion.objects.filter(
+            user=self.users['reader'], author__isnull=False
+        ).values_list('author__username', 'score'))
+        # friend — друг друга, other — совместная подписка через author
+        # с двумя читателями.
+        self.assertEqual(scores.keys(), {'friend', 'other'})
+        self.assertAlmostEqual(scores['friend'], 1)
+        self.assertAlmostEqual(scores['other'], 1 / math.log(4))
+
+    def test_followed_authors_are_hidden_before_rebuild(self):
+        recommendations.rebuild()
+        Follow.objects.create(
+            user=self.users['reader'], author=self.users['friend']
+        )
+        authors, _ = recommendations.get_suggestions(self.users['reader'])
+        self.assertNotIn(self.users['friend'], authors)
+
+    def test_rebuild_replaces_old_suggestions(self):
+        recommendations.rebuild(batch_size=1)
+        Follow.objects.filter(user=self.users['reader']).delete()
+        recommendations.rebuild(batch_size=1)
+        self.assertFalse(
+            Suggestion.objects.filter(user=self.users['reader']).exists()
+        )
+        self.assertTrue(
+            Suggestion.objects.filter(user=self.users['neighbour']).exists()
+        )
@@ -0,0 +1,104 @@
+import asyncio
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import Client, TransactionTestCase
+
+from posts.events import follow_events, get_broker
+from posts.models import Follow, Post
+
+User = get_user_model()
+
+
+class EventStream:
+    """Подключение к follow_events без сервера ASGI."""
+
+    def __init__(self, headers=()):
+        self.receive_queue = asyncio.Queue()
+        self.sent = asyncio.Queue()
+        self.task = asyncio.ensure_future(follow_events({
+            'type': 'http',
+            'method': 'GET',
+            'path': settings.EVENTS_PATH,
+            'headers': list(headers),
+        }, self.receive_queue.get, self.sent.put))
+
+    async def next_message(self):
+        return await asyncio.wait_for(self.sent.get(), timeout=5)
+
+    async def close(self):
+        await self.receive_queue.put({'type': 'http.disconnect'})
+        await asyncio.wait_for(self.task, timeout=5)
+
+
+class FollowEventsTest(TransactionTestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author')
+        self.other = User.objects.create_user(username='other')
+        self.reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=self.reader, author=self.author)
+        client = Client()
+        client.force_login(self.reader)
+        cookie = client.cookies[settings.SESSION_COOKIE_NAME].value
+        self.headers = [
+            (b'cookie', f'{settings.SESSION_COOKIE_NAME}={cookie}'.encode())
+        ]
+
+    def run_stream(self, scenario, headers=None):
+        async def run():
+            stream = EventStream(
+                self.headers if headers is None else headers
+            )
+            try:
+                return await scenario(stream)
+            finally:
+                if not stream.task.done():
+                    await stream.close()
+
+        return asyncio.run(run())
+
+    def test_anonymous_is_forbidden(self):
+        async def scenario(stream):
+            return await stream.next_message()
+
+        start = self.run_stream(scenario, headers=[])
+        self.assertEqual(start['status'], 403)
+
+    def test_new_post_is_pushed(self):
+        async def scenario(stream):
+            start = await stream.next_message()
+            await stream.next_message()
+            Post.objects.create(author=self.other, text='Чужая запись')
+            Post.objects.create(author=self.author, text='Новая запись')
+            event = await stream.next_message()
+            await stream.close()
+            return start, event
+
+        start, event = self.run_stream(scenario)
+        self.assertEqual(start['status'], 200)
+        self.assertIn(
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            start['headers']
+        )
+        body = event['body'].decode()
+        self.assertTrue(body.startswith('id: '))
+        self.assertIn('event: post', body)
+        self.assertIn('Новая запись', body)
+        self.assertNotIn('Чужая', body)
+        self.assertEqual(get_broker().subscribers, {})
+
+    def test_missed_posts_are_replayed(self):
+        first = Post.objects.create(author=self.author, text='Прочитанная')
+        Post.objects.create(author=self.author, text='Пропущенная')
+
+        async def scenario(stream):
+            await stream.next_message()
+            return await stream.next_message()
+
+        replay = self.run_stream(
+            scenario,
+            headers=self.headers + [(b'last-event-id', str(first.pk).encode())]
+        )
+        body = replay['body'].decode()
+        self.assertIn('Пропущенная', body)
+        self.assertNotIn('Прочитанная', body)
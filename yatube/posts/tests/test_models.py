@@ -1,6 +1,9 @@
+from unittest import mock
+
+from django.db import DatabaseError, connection, transaction
 from django.test import TestCase
 from django.contrib.auth import get_user_model
-from posts.models import Group, Post, Comment, Follow
+from posts.models import AuthorStats, Group, Post, Comment, Follow
 
 User = get_user_model()
 
@@ -181,3 +184,104 @@ class FollowModelTest(TestCase):
                     follow._meta.get_field(field).help_text,
                     expected
                 )
+
+
+class AuthorStatsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def get_stats(self, user):
+        return AuthorStats.objects.get(user=user)
+
+    def test_post_and_comment_counters(self):
+        post = Post.objects.create(author=self.author, text='Запись')
+        comment = Comment.objects.create(
+            author=self.reader, post=post, text='Комментарий'
+        )
+        self.assertEqual(self.get_stats(self.author).posts_count, 1)
+        self.assertEqual(self.get_stats(self.reader).comments_count, 1)
+        comment.delete()
+        post.delete()
+        self.assertEqual(self.get_stats(self.author).posts_count, 0)
+        self.assertEqual(self.get_stats(self.reader).comments_count, 0)
+
+    def test_follow_counters(self):
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(self.get_stats(self.author).followers_count, 1)
+        self.assertEqual(self.get_stats(self.reader).following_count, 1)
+        follow.delete()
+        self.assertEqual(self.get_stats(self.author).followers_count, 0)
+        self.assertEqual(self.get_stats(self.reader).following_count, 0)
+
+    def test_failed_counter_rolls_back_row(self):
+        with mock.patch(
+            'posts.counters.change', side_effect=DatabaseError
+        ):
+            with self.assertRaises(DatabaseError):
+                Post.objects.create(author=self.author, text='Запись')
+            with self.assertRaises(DatabaseError):
+                Follow.objects.create(user=self.reader, author=self.author)
+        self.assertFalse(Post.objects.exists())
+        self.assertFalse(Follow.objects.exists())
+        post = Post.objects.create(author=self.author, text='Запись')
+        with mock.patch(
+            'posts.counters.change', side_effect=DatabaseError
+        ):
+            # Как вне TestCase: удаление Django не ставит savepoint.
+            with self.assertRaises(DatabaseError), transaction.atomic():
+                post.delete()
+        self.assertTrue(Post.objects.filter(pk=post.pk).exists())
+        self.assertEqual(self.get_stats(self.author).posts_count, 1)
+
+    def test_deleting_author_keeps_counters_consistent(self):
+        author = User.objects.create_user(username='leaving')
+        post = Post.objects.create(author=author, text='Запись')
+        Comment.objects.create(author=self.reader, post=post, text='Текст')
+        Follow.objects.create(user=self.reader, author=author)
+        author.delete()
+        stats = self.get_stats(self.reader)
+        self.assertEqual(stats.comments_count, 0)
+        self.assertEqual(stats.following_count, 0)
+        self.assertFalse(AuthorStats.objects.filter(user=author.pk).exists())
+
+
+class FeedIndexTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.post = Post.objects.create(
+            author=cls.user, group=cls.group, text='Запись'
+        )
+
+    def get_plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return ' '.join(row[-1] for row in cursor.fetchall())
+
+    def test_feed_queries_use_composite_indexes(self):
+        feed_order = ('-pub_date', '-id')
+        queries = {
+            'post_group_date_idx': Post.objects.filter(
+                group=self.group
+            ).order_by(*feed_order)[:10],
+            'post_author_date_idx': Post.objects.filter(
+                author=self.user
+            ).order_by(*feed_order)[:10],
+            'comment_post_created_idx': Comment.objects.filter(
+                post=self.post
+            ).order_by('-created', '-id'),
+            'follow_user_author_idx': Follow.objects.filter(
+                user=self.user
+            ).values_list('author_id'),
+        }
+        for index, queryset in queries.items():
+            with self.subTest(index=index):
+                plan = self.get_plan(queryset)
+                self.assertIn(index, plan)
+                self.assertNotIn('TEMP B-TREE', plan)
@@ -1,19 +1,39 @@
 import tempfile
 import shutil
+from io import BytesIO
 
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 import datetime as dt
-from posts.models import Post, Group, Comment, Follow
+from posts.models import (
+    AuthorStats, Post, Group, Comment, Follow, ThumbnailTask, TimelineEntry
+)
 from django import forms
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.conf import settings
 from django.core.cache import cache
+from PIL import Image
+from core.cache import get_coalesced
+from posts import (
+    feed_cache, recommendations, thumbnails, timeline, trending, variants,
+    write_buffer,
+)
 
 User = get_user_model()
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
 
 
 class PaginatorTestViews(TestCase):
@@ -42,10 +62,14 @@ class PaginatorTestViews(TestCase):
         response = self.authorized_client.get(reverse('posts:index'))
         self.assertEqual(len(response.context['page_obj']), 10)
 
+    def get_second_page(self, url):
+        response = self.authorized_client.get(url)
+        cache.clear()
+        cursor = response.context['page_obj'].paginator.next_cursor
+        return self.authorized_client.get(url, {'after': cursor})
+
     def test_second_homepage_contains_three_records(self):
-        response = self.authorized_client.get(
-            reverse('posts:index') + '?page=2'
-        )
+        response = self.get_second_page(reverse('posts:index'))
         self.assertEqual(len(response.context['page_obj']), 3)
 
     def test_first_grouplist_page_contains_ten_records(self):
@@ -56,9 +80,8 @@ class PaginatorTestViews(TestCase):
         self.assertEqual(len(response.context['page_obj']), 10)
 
     def test_second_grouplist_page_contains_three_records(self):
-        response = self.authorized_client.get(
-            reverse('posts:group_list',
-                    kwargs={'slug': self.group.slug}) + '?page=2'
+        response = self.get_second_page(
+            reverse('posts:group_list', kwargs={'slug': self.group.slug})
         )
         self.assertEqual(len(response.context['page_obj']), 3)
 
@@ -71,12 +94,41 @@ class PaginatorTestViews(TestCase):
         self.assertEqual(len(response.context['page_obj']), 10)
 
     def test_second_profile_page_contains_three_records(self):
-        response = self.authorized_client.get(
-            reverse('posts:profile',
-                    kwargs={'username': self.user}) + '?page=2'
+        response = self.get_second_page(
+            reverse('posts:profile', kwargs={'username': self.user})
         )
         self.assertEqual(len(response.context['page_obj']), 3)
 
+    def test_previous_page_returns_first_records(self):
+        url = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        first_page = self.authorized_client.get(url).context['page_obj']
+        second_page = self.get_second_page(url).context['page_obj']
+        self.assertTrue(second_page.has_previous())
+        self.assertFalse(second_page.has_next())
+        response = self.authorized_client.get(
+            url, {'before': second_page.paginator.previous_cursor}
+        )
+        self.assertEqual(
+            list(response.context['page_obj']), list(first_page)
+        )
+
+    def test_last_page_ends_with_oldest_record(self):
+        response = self.authorized_client.get(
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            {'last': ''}
+        )
+        page_obj = response.context['page_obj']
+        self.assertEqual(page_obj[len(page_obj) - 1].text, 'запись №:0')
+        self.assertTrue(page_obj.has_previous())
+        self.assertFalse(page_obj.has_next())
+
+    def test_invalid_cursor_returns_first_page(self):
+        response = self.authorized_client.get(
+            reverse('posts:index'), {'after': 'broken'}
+        )
+        self.assertEqual(len(response.context['page_obj']), 10)
+        self.assertFalse(response.context['page_obj'].has_previous())
+
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class ViewTest(TestCase):
@@ -295,6 +347,228 @@ class CacheTest(TestCase):
         self.assertEqual(len(response.context['page_obj']), count2)
 
 
+class FeedQueryBudgetTest(TestCase):
+    """Число запросов на страницу ленты не зависит от числа записей."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='test_slug')
+        for index in range(settings.PAGE_COUNT + 3):
+            author = User.objects.create_user(username=f'author{index}')
+            Follow.objects.create(user=cls.reader, author=author)
+            Post.objects.create(
+                text=f'запись №:{index}',
+                author=author,
+                group=Group.objects.create(
+                    title=f'Группа {index}', slug=f'group_{index}'
+                ) if index % 2 else cls.group,
+            )
+        cls.author = author
+
+    def setUp(self):
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        cache.clear()
+
+    def assert_page_budget(self, client, url, budget):
+        with self.assertNumQueries(budget):
+            response = client.get(url)
+        self.assertEqual(
+            len(response.context['page_obj']), settings.PAGE_COUNT
+        )
+        cache.clear()
+        cursor = response.context['page_obj'].paginator.next_cursor
+        with self.assertNumQueries(budget):
+            client.get(url, {'after': cursor})
+
+    def test_index_budget(self):
+        self.assert_page_budget(self.client, reverse('posts:index'), 2)
+
+    def test_group_list_budget(self):
+        Post.objects.bulk_create(
+            Post(text=f'запись {index}', author=self.author, group=self.group)
+            for index in range(settings.PAGE_COUNT)
+        )
+        self.assert_page_budget(
+            self.client,
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            3
+        )
+
+    def test_profile_budget(self):
+        Post.objects.bulk_create(
+            Post(text=f'запись {index}', author=self.author)
+            for index in range(settings.PAGE_COUNT)
+        )
+        self.assert_page_budget(
+            self.client,
+            reverse('posts:profile', kwargs={'username': self.author}),
+            3
+        )
+
+    def test_follow_index_budget(self):
+        # Шестой запрос — готовые подсказки авторов и групп.
+        self.assert_page_budget(
+            self.reader_client, reverse('posts:follow_index'), 6
+        )
+
+
+class FeedCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='TestUser')
+        cls.group = Group.objects.create(title='Группа', slug='test_slug')
+        cls.post = Post.objects.create(
+            text='Первая запись', author=cls.user, group=cls.group
+        )
+        cls.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': cls.group.slug}),
+            reverse('posts:profile', kwargs={'username': cls.user}),
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_page_is_served_from_cache(self):
+        self.client.get(reverse('posts:index'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('posts:index'))
+        self.assertEqual(list(response.context['page_obj']), [self.post])
+
+    def test_new_post_is_visible_at_once(self):
+        for url in self.urls:
+            self.client.get(url)
+        post = Post.objects.create(
+            text='Вторая запись', author=self.user, group=self.group
+        )
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.context['page_obj'][0], post)
+
+    def test_stale_page_is_served_during_recompute(self):
+        url = reverse('posts:index')
+        self.client.get(url)
+        Post.objects.create(text='Вторая запись', author=self.user)
+        key = feed_cache.get_key(self.client.get(url).wsgi_request, 'index')
+        Post.objects.create(text='Третья запись', author=self.user)
+        cache.add(f'{key}:lease', True)
+        response = self.client.get(url)
+        self.assertEqual(len(response.context['page_obj']), 2)
+        self.assertEqual(get_coalesced(key), 1)
+
+
+class PostCardCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='TestUser')
+        cls.group = Group.objects.create(
+            title='Старая группа',
+            slug='test_slug',
+        )
+        cls.post = Post.objects.create(
+            text='Исходный текст',
+            author=cls.user,
+            group=cls.group,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def get_index(self):
+        return self.client.get(reverse('posts:index')).content.decode()
+
+    def test_card_is_served_from_cache(self):
+        self.get_index()
+        Post.objects.filter(pk=self.post.pk).update(text='Новый текст')
+        self.assertIn('Исходный текст', self.get_index())
+
+    def test_post_save_invalidates_card(self):
+        self.get_index()
+        self.post.text = 'Новый текст'
+        self.post.save()
+        self.assertIn('Новый текст', self.get_index())
+
+    def test_group_save_invalidates_card(self):
+        self.get_index()
+        self.group.title = 'Новая группа'
+        self.group.save()
+        self.assertIn('Новая группа', self.get_index())
+
+    def test_group_delete_invalidates_card(self):
+        group = Group.objects.create(title='Удаляемая', slug='deleted')
+        Post.objects.create(text='В группе', author=self.user, group=group)
+        group_url = reverse('posts:group_list', kwargs={'slug': 'deleted'})
+        self.assertIn(group_url, self.get_index())
+        group.delete()
+        self.assertNotIn(group_url, self.get_index())
+
+    def test_cards_shared_between_pages(self):
+        self.get_index()
+        Post.objects.filter(pk=self.post.pk).update(text='Новый текст')
+        response = self.client.get(
+            reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        )
+        self.assertIn('Исходный текст', response.content.decode())
+
+
+class CommentThreadTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(text='Запись', author=cls.author)
+        cls.quiet_post = Post.objects.create(text='Тихая', author=cls.author)
+        count = settings.COMMENTS_PAGE_COUNT + 5
+        for index in range(count):
+            Comment.objects.create(
+                post=cls.post if index else cls.quiet_post,
+                author=User.objects.create_user(username=f'reader{index}'),
+                text=f'Комментарий {index}',
+            )
+
+    def get_detail(self, post):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('posts:post_detail', kwargs={'post_id': post.pk})
+            )
+        return response, len(queries)
+
+    def test_first_render_is_bounded(self):
+        response, queries = self.get_detail(self.post)
+        comments = response.context['comments']
+        self.assertEqual(len(comments), settings.COMMENTS_PAGE_COUNT)
+        self.assertEqual(comments[0].text, 'Комментарий 24')
+        _, quiet_queries = self.get_detail(self.quiet_post)
+        self.assertEqual(queries, quiet_queries)
+
+    def test_next_batch_fragment(self):
+        response, _ = self.get_detail(self.post)
+        cursor = response.context['comments'].paginator.next_cursor
+        response = self.client.get(
+            reverse('posts:post_comments', kwargs={'post_id': self.post.pk}),
+            {'after': cursor}
+        )
+        self.assertTemplateUsed(response, 'posts/includes/comments.html')
+        self.assertTemplateNotUsed(response, 'base.html')
+        self.assertEqual(
+            [comment.text for comment in response.context['comments']],
+            [f'Комментарий {index}' for index in range(4, 0, -1)]
+        )
+        self.assertNotContains(response, 'Показать ещё')
+
+    def test_fragment_for_missing_post(self):
+        response = self.client.get(
+            reverse('posts:post_comments', kwargs={'post_id': 0})
+        )
+        self.assertEqual(response.status_code, 404)
+
+
 class FollowingTest(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -360,3 +634,464 @@ class FollowingTest(TestCase):
         response = self.unfollower_client.get(reverse('posts:follow_index'))
         after_new_post = len(response.context['page_obj'])
         self.assertEqual(before_new_post, after_new_post)
+
+    def test_follow_backfills_timeline(self):
+        Post.objects.create(text='Старая запись', author=self.user2)
+        self.follower_client.get(
+            reverse('posts:profile_follow', kwargs={'username': self.user2})
+        )
+        response = self.follower_client.get(reverse('posts:follow_index'))
+        texts = [post.text for post in response.context['page_obj']]
+        self.assertIn('Старая запись', texts)
+
+    def test_unfollow_removes_author_from_timeline(self):
+        self.follower_client.get(
+            reverse('posts:profile_unfollow', kwargs={'username': self.author})
+        )
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.user).exists()
+        )
+        response = self.follower_client.get(reverse('posts:follow_index'))
+        self.assertEqual(len(response.context['page_obj']), 0)
+
+    def test_no_events_script_under_wsgi(self):
+        response = self.follower_client.get(reverse('posts:follow_index'))
+        self.assertNotContains(response, 'EventSource')
+
+    def test_suggestions_panel(self):
+        liked = User.objects.create_user(username='liked')
+        Follow.objects.create(user=self.user2, author=self.author)
+        Follow.objects.create(user=self.user2, author=liked)
+        recommendations.rebuild()
+        for url in (
+            reverse('posts:follow_index'),
+            reverse('posts:profile', kwargs={'username': self.author}),
+        ):
+            with self.subTest(url=url):
+                response = self.follower_client.get(url)
+                authors, _ = response.context['suggestions']
+                self.assertEqual([a.username for a in authors], ['liked'])
+                self.assertContains(response, 'Кого почитать')
+
+    @override_settings(TIMELINE_LENGTH=2)
+    def test_timeline_is_trimmed(self):
+        for text in range(3):
+            Post.objects.create(text=f'запись {text}', author=self.user2)
+        Follow.objects.create(user=self.user, author=self.user2)
+        entries = TimelineEntry.objects.filter(user=self.user)
+        self.assertEqual(entries.count(), 2)
+        self.assertFalse(entries.filter(post=self.post).exists())
+
+    @override_settings(TIMELINE_FANOUT_THRESHOLD=1)
+    def test_author_dropping_below_threshold_is_fanned_out(self):
+        Follow.objects.create(user=self.user2, author=self.author)
+        post = Post.objects.create(
+            text='Пока подмешивался', author=self.author
+        )
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.user, post=post).exists()
+        )
+        Follow.objects.filter(user=self.user2, author=self.author).delete()
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.user, post=post).exists()
+        )
+        cache.clear()
+        response = self.follower_client.get(reverse('posts:follow_index'))
+        self.assertIn(post, response.context['page_obj'])
+
+    def test_rebuild_keeps_authors_without_stats(self):
+        AuthorStats.objects.filter(user=self.author).delete()
+        timeline.rebuild()
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.user, post=self.post
+        ).exists())
+
+    @override_settings(TIMELINE_LENGTH=2)
+    def test_push_keeps_timeline_length(self):
+        for text in range(5):
+            Post.objects.create(text=f'запись {text}', author=self.author)
+        entries = TimelineEntry.objects.filter(user=self.user)
+        self.assertEqual(entries.count(), 2)
+        self.assertEqual(
+            [entry.post.text for entry in entries],
+            ['запись 4', 'запись 3']
+        )
+
+    @override_settings(TIMELINE_FANOUT_THRESHOLD=0)
+    def test_popular_author_is_pulled_on_read(self):
+        post = Post.objects.create(text='Популярно', author=self.author)
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.user, post=post).exists()
+        )
+        response = self.follower_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']), [post, self.post]
+        )
+
+
+@override_settings(PAGE_COUNT=2)
+class PopularTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.posts = [
+            Post.objects.create(
+                text=f'Запись {index}', author=cls.author,
+                group=cls.group if index % 2 else None,
+            )
+            for index in range(5)
+        ]
+        for index, post in enumerate(cls.posts):
+            for _ in range(index):
+                Comment.objects.create(
+                    post=post, author=cls.author, text='Комментарий'
+                )
+        trending.update()
+
+    def test_popular_pages(self):
+        response = self.client.get(reverse('posts:popular'))
+        self.assertEqual(
+            list(response.context['page_obj']), self.posts[4:2:-1]
+        )
+        cursor = response.context['page_obj'].paginator.next_cursor
+        response = self.client.get(reverse('posts:popular'), {'after': cursor})
+        self.assertEqual(
+            list(response.context['page_obj']), self.posts[2:0:-1]
+        )
+        self.assertFalse(response.context['page_obj'].has_next())
+        previous = response.context['page_obj'].paginator.previous_cursor
+        response = self.client.get(
+            reverse('posts:popular'), {'before': previous}
+        )
+        self.assertEqual(
+            list(response.context['page_obj']), self.posts[4:2:-1]
+        )
+
+    def test_group_popular(self):
+        response = self.client.get(
+            reverse('posts:group_popular', kwargs={'slug': 'group'})
+        )
+        self.assertEqual(
+            list(response.context['page_obj']),
+            [self.posts[3], self.posts[1]]
+        )
+
+    def test_popular_query_budget(self):
+        with self.assertNumQueries(3):
+            self.client.get(reverse('posts:popular'))
+
+
+@override_settings(
+    WRITE_BUFFER_ENABLED=True, WRITE_BUFFER_MAX_ROWS=3,
+    WRITE_BUFFER_MAX_DELAY=3600, WRITE_BUFFER_DURABILITY='memory',
+)
+class WriteBufferTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(text='Запись', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(write_buffer.flush)
+        self.client.force_login(self.user)
+
+    def comment(self, text):
+        return self.client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.pk}),
+            {'text': text}
+        )
+
+    def follow(self, author):
+        return self.client.get(
+            reverse('posts:profile_follow', kwargs={'username': author})
+        )
+
+    def test_pending_comment_is_shown_until_flush(self):
+        self.comment('Первый')
+        self.assertFalse(Comment.objects.exists())
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        )
+        self.assertContains(response, 'Первый')
+        write_buffer.flush()
+        comment = Comment.objects.get()
+        self.assertEqual(comment.author, self.user)
+        self.user.stats.refresh_from_db()
+        self.assertEqual(self.user.stats.comments_count, 1)
+
+    def test_flush_on_size(self):
+        with CaptureQueriesContext(connection) as queries:
+            for text in ('Один', 'Два', 'Три'):
+                self.comment(text)
+        self.assertEqual(Comment.objects.count(), 3)
+        inserts = [
+            query for query in queries
+            if query['sql'].startswith('INSERT INTO "posts_comment"')
+        ]
+        self.assertEqual(len(inserts), 1)
+
+    def test_invalid_comment_is_rejected_synchronously(self):
+        response = self.client.post(
+            reverse('posts:add_comment', kwargs={'post_id': 0}),
+            {'text': 'Текст'}
+        )
+        self.assertEqual(response.status_code, 404)
+        self.comment('')
+        self.assertEqual(write_buffer.pending_comments(self.post.pk), [])
+
+    def test_follow_is_buffered(self):
+        Post.objects.create(text='Старая запись', author=self.author)
+        self.follow(self.author)
+        self.follow(self.author)
+        response = self.client.get(
+            reverse('posts:profile', kwargs={'username': self.author})
+        )
+        self.assertTrue(response.context['following'])
+        self.assertFalse(Follow.objects.exists())
+        write_buffer.flush()
+        self.assertEqual(Follow.objects.count(), 1)
+        self.assertTrue(TimelineEntry.objects.filter(user=self.user).exists())
+        self.author.stats.refresh_from_db()
+        self.assertEqual(self.author.stats.followers_count, 1)
+
+    def test_existing_follow_is_ignored(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        self.follow(self.author)
+        write_buffer.flush()
+        self.assertEqual(Follow.objects.count(), 1)
+        self.author.stats.refresh_from_db()
+        self.assertEqual(self.author.stats.followers_count, 1)
+
+    def test_unfollow_discards_pending_follow(self):
+        self.follow(self.author)
+        self.client.get(
+            reverse('posts:profile_unfollow', kwargs={'username': self.author})
+        )
+        write_buffer.flush()
+        self.assertFalse(Follow.objects.exists())
+
+    def test_unfollow_removes_saved_follow(self):
+        self.follow(self.author)
+        write_buffer.flush()
+        self.follow(self.author)
+        self.assertFalse(
+            write_buffer.is_following(self.user.pk, self.author.pk)
+        )
+        # Повтор, принятый до сохранения первой подписки.
+        write_buffer.add_follow(Follow(user=self.user, author=self.author))
+        self.client.get(
+            reverse('posts:profile_unfollow', kwargs={'username': self.author})
+        )
+        write_buffer.flush()
+        self.assertFalse(Follow.objects.exists())
+        self.author.stats.refresh_from_db()
+        self.assertEqual(self.author.stats.followers_count, 0)
+
+    def test_deleted_post_is_skipped(self):
+        post = Post.objects.create(text='Удалённая', author=self.author)
+        self.client.post(
+            reverse('posts:add_comment', kwargs={'post_id': post.pk}),
+            {'text': 'Поздно'}
+        )
+        post.delete()
+        write_buffer.flush()
+        self.assertFalse(Comment.objects.exists())
+
+    @override_settings(
+        WRITE_BUFFER_DURABILITY='commit', WRITE_BUFFER_MAX_DELAY=0
+    )
+    def test_commit_durability_waits_for_flush(self):
+        self.comment('Сразу')
+        self.assertTrue(Comment.objects.filter(text='Сразу').exists())
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='TestUser')
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text='Запись с картинкой',
+            image=SimpleUploadedFile(
+                name='thumbnail.gif', content=SMALL_GIF,
+                content_type='image/gif'
+            ),
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_missing_thumbnail_renders_placeholder(self):
+        response = self.client.get(reverse('posts:index'))
+        self.assertIsNone(thumbnails.lookup(self.post.image))
+        self.assertTrue(
+            ThumbnailTask.objects.filter(name=self.post.image.name).exists()
+        )
+        self.assertContains(response, 'bg-light')
+        self.assertNotContains(response, '<img class="card-img')
+
+    def test_generated_thumbnail_is_rendered(self):
+        self.client.get(reverse('posts:index'))
+        thumbnail = thumbnails.generate(self.post.image.name)
+        self.assertEqual(thumbnails.lookup(self.post.image).url, thumbnail.url)
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, '<img class="card-img')
+        self.assertNotContains(response, 'bg-light')
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT, POST_IMAGE_WIDTHS=(320, 640, 1920)
+)
+class ImageVariantTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='TestUser')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        buffer = BytesIO()
+        Image.new('RGB', (800, 600)).save(buffer, 'PNG')
+        self.post = Post.objects.create(
+            author=self.user,
+            text='Запись с картинкой',
+            image=SimpleUploadedFile('large.png', buffer.getvalue()),
+        )
+
+    def test_variants_are_built_up_to_source_width(self):
+        thumbnails.generate(self.post.image.name)
+        variants = self.post.image_variants.all()
+        self.assertEqual(
+            sorted((v.format, v.width, v.height) for v in variants),
+            [('jpeg', 320, 113), ('jpeg', 640, 226),
+             ('webp', 320, 113), ('webp', 640, 226)]
+        )
+        for variant in variants:
+            self.assertTrue(default_storage.exists(variant.name))
+            self.assertEqual(default_storage.size(variant.name), variant.size)
+
+    def test_feed_renders_srcset(self):
+        thumbnails.generate(self.post.image.name)
+        response = self.client.get(reverse('posts:index'))
+        variant = self.post.image_variants.get(format='webp', width=640)
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, f'{variant.url} 640w')
+
+    def test_edit_drops_stale_variants(self):
+        thumbnails.generate(self.post.image.name)
+        old_variants = list(self.post.image_variants.all())
+        buffer = BytesIO()
+        Image.new('RGB', (400, 300), 'red').save(buffer, 'PNG')
+        client = Client()
+        client.force_login(self.user)
+        client.post(
+            reverse('posts:post_edit', kwargs={'post_id': self.post.pk}),
+            {
+                'text': 'Новая картинка',
+                'image': SimpleUploadedFile('red.png', buffer.getvalue()),
+            }
+        )
+        self.assertFalse(self.post.image_variants.exists())
+        response = client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        )
+        for variant in old_variants:
+            self.assertNotContains(response, variant.url)
+            self.assertFalse(default_storage.exists(variant.name))
+        self.post.refresh_from_db()
+        self.assertTrue(
+            ThumbnailTask.objects.filter(name=self.post.image.name).exists()
+        )
+        thumbnails.generate(self.post.image.name)
+        response = client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        )
+        self.assertContains(response, 'red-320.')
+
+    def test_rebuild_replaces_old_files(self):
+        thumbnails.generate(self.post.image.name)
+        old_names = list(
+            self.post.image_variants.values_list('name', flat=True)
+        )
+        self.post.image = ''
+        self.post.save()
+        self.assertEqual(variants.build(self.post), [])
+        self.assertFalse(self.post.image_variants.exists())
+        for name in old_names:
+            self.assertFalse(default_storage.exists(name))
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='TestUser')
+        cls.post = Post.objects.create(
+            author=cls.user,
+            text='Ночью <b>ёжики</b> гуляли по лесу и искали грибы',
+        )
+        Post.objects.create(author=cls.user, text='Совсем другая запись')
+
+    def get_results(self, query):
+        response = self.client.get(reverse('posts:search'), {'q': query})
+        return response, list(response.context['page_obj'])
+
+    def test_search_finds_and_highlights(self):
+        response, results = self.get_results('грибы')
+        self.assertEqual(results, [self.post])
+        self.assertContains(response, '<mark>грибы</mark>')
+        self.assertContains(response, '&lt;b&gt;')
+
+    def test_search_matches_prefix_of_every_word(self):
+        self.assertEqual(self.get_results('гуля лес')[1], [self.post])
+        self.assertEqual(self.get_results('гуля море')[1], [])
+
+    def test_index_follows_updates_and_deletes(self):
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Теперь здесь про море'
+        post.save()
+        self.assertEqual(self.get_results('грибы')[1], [])
+        self.assertEqual(self.get_results('море')[1], [post])
+        post.delete()
+        self.assertEqual(self.get_results('море')[1], [])
+
+    def test_search_is_paginated(self):
+        Post.objects.bulk_create(
+            Post(text=f'грибная запись {index}', author=self.user)
+            for index in range(settings.PAGE_COUNT + 2)
+        )
+        response, results = self.get_results('грибн')
+        self.assertEqual(len(results), settings.PAGE_COUNT)
+        self.assertContains(response, 'q=%D0%B3%D1%80%D0%B8%D0%B1%D0%BD&')
+        cursor = response.context['page_obj'].paginator.next_cursor
+        response = self.client.get(
+            reverse('posts:search'), {'q': 'грибн', 'after': cursor}
+        )
+        self.assertEqual(len(response.context['page_obj']), 2)
+
+    def test_admin_search_uses_index(self):
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'гуля'}
+        )
+        self.assertEqual(list(response.context['cl'].result_list), [self.post])
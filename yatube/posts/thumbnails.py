@@ -0,0 +1,110 @@
+import logging
+
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.utils import timezone
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile
+
+from . import feed_cache, variants
+from .models import Post, ThumbnailTask
+
+logger = logging.getLogger(__name__)
+
+
+class PostThumbnailBackend(ThumbnailBackend):
+    def get_options(self, source, options):
+        options = dict(options)
+        if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(thumbnail_settings, attr)
+            if value != getattr(default_settings, attr):
+                options.setdefault(key, value)
+        return options
+
+    def get_cached_thumbnail(self, file_, geometry_string, **options):
+        """Как get_thumbnail, но только читает хранилище ключей.
+
+        Возвращает None, если миниатюра ещё не создана.
+        """
+        source = ImageFile(file_)
+        options = self.get_options(source, options)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return default.kvstore.get(ImageFile(name, default.storage))
+
+
+backend = PostThumbnailBackend()
+
+
+def lookup(image):
+    """Готовая миниатюра записи или None. Никогда не создаёт её сама."""
+    return backend.get_cached_thumbnail(
+        image,
+        settings.POST_THUMBNAIL_GEOMETRY,
+        **settings.POST_THUMBNAIL_OPTIONS
+    )
+
+
+def generate(name):
+    """Создаёт миниатюру и варианты картинки, сбрасывает кеш карточек."""
+    if not default.storage.exists(name):
+        return None
+    thumbnail = backend.get_thumbnail(
+        name,
+        settings.POST_THUMBNAIL_GEOMETRY,
+        **settings.POST_THUMBNAIL_OPTIONS
+    )
+    posts = Post.objects.filter(image=name)
+    for post in posts.only('image'):
+        variants.build(post)
+    posts.update(updated=timezone.now())
+    feed_cache.invalidate()
+    return thumbnail
+
+
+def init_worker():
+    django.setup()
+    connections.close_all()
+
+
+def fill_gap(name):
+    """Создаёт миниатюру и варианты, если их ещё нет.
+
+    Выполняется в процессах пула. Возвращает True при создании,
+    False — если создавать нечего, и None, если создать не удалось.
+    """
+    try:
+        ready = (
+            lookup(name) is not None
+            and not Post.objects.filter(
+                image=name, image_variants__isnull=True
+            ).exists()
+        )
+        if ready:
+            return False
+        return generate(name) is not None
+    except Exception:
+        logger.exception('Не удалось создать миниатюру %s', name)
+        return None
+    finally:
+        connections.close_all()
+
+
+def schedule(name):
+    """Ставит картинку в очередь manage.py process_thumbnails."""
+    if not name:
+        return
+    if not cache.add(f'thumbnail_task:{name}', True,
+                     settings.THUMBNAIL_TASK_TIMEOUT):
+        return
+    ThumbnailTask.objects.bulk_create(
+        [ThumbnailTask(name=name)], ignore_conflicts=True
+    )
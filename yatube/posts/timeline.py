@@ -0,0 +1,219 @@
+from operator import attrgetter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from .models import AuthorStats, Follow, Post, TimelineEntry
+from .paginator import CursorPaginator
+
+REBUILD_SQL = """
+    INSERT INTO {timeline} (user_id, post_id, author_id, pub_date)
+    SELECT user_id, post_id, author_id, pub_date FROM (
+        SELECT follow.user_id, post.id AS post_id, post.author_id,
+               post.pub_date,
+               ROW_NUMBER() OVER (
+                   PARTITION BY follow.user_id
+                   ORDER BY post.pub_date DESC, post.id DESC
+               ) AS position
+        FROM {follow} AS follow
+        JOIN {post} AS post ON post.author_id = follow.author_id
+        LEFT JOIN {stats} AS stats ON stats.user_id = follow.author_id
+        WHERE COALESCE(stats.followers_count, 0) <= %s
+    ) AS entries WHERE position <= %s
+"""
+
+TRIM_SQL = """
+    DELETE FROM {timeline} WHERE id IN (
+        SELECT id FROM (
+            SELECT id, ROW_NUMBER() OVER (
+                PARTITION BY user_id ORDER BY pub_date DESC, post_id DESC
+            ) AS position
+            FROM {timeline} WHERE user_id IN ({users})
+        ) AS entries WHERE position > %s
+    )
+"""
+# Подписчиков в одном запросе TRIM_SQL: SQLite принимает не больше
+# 999 параметров.
+TRIM_BATCH_SIZE = 500
+
+
+def get_pulled_key():
+    return f'timeline:pulled_authors:{settings.TIMELINE_FANOUT_THRESHOLD}'
+
+
+def get_pulled_authors():
+    """Авторы, у которых подписчиков больше TIMELINE_FANOUT_THRESHOLD.
+
+    Их записи не раскладываются по лентам, а подмешиваются при чтении.
+    """
+    threshold = settings.TIMELINE_FANOUT_THRESHOLD
+    key = get_pulled_key()
+    authors = cache.get(key)
+    if authors is None:
+        authors = set(
+            AuthorStats.objects.filter(
+                followers_count__gt=threshold
+            ).values_list('user_id', flat=True)
+        )
+        cache.set(key, authors, settings.TIMELINE_PULLED_AUTHORS_TIMEOUT)
+    return authors
+
+
+def push_post(post):
+    """Раскладывает новую запись по лентам подписчиков автора."""
+    if post.author_id in get_pulled_authors():
+        return
+    followers = list(Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True))
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(
+                user_id=user_id,
+                post_id=post.pk,
+                author_id=post.author_id,
+                pub_date=post.pub_date,
+            )
+            for user_id in followers
+        ),
+        ignore_conflicts=True,
+    )
+    trim_many(followers)
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту последние записи нового избранного автора."""
+    if author_id in get_pulled_authors():
+        return
+    posts = Post.objects.filter(
+        author_id=author_id
+    ).values_list('pk', 'pub_date')[:settings.TIMELINE_LENGTH]
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(
+                user_id=user_id,
+                post_id=post_id,
+                author_id=author_id,
+                pub_date=pub_date,
+            )
+            for post_id, pub_date in posts
+        ),
+        ignore_conflicts=True,
+    )
+    trim(user_id)
+
+
+def check_threshold(author_id):
+    """Обрабатывает пересечение автором TIMELINE_FANOUT_THRESHOLD.
+
+    Вызывается после изменения счётчика подписчиков. При переходе
+    порога сбрасывается кеш get_pulled_authors, а записи автора,
+    опустившегося до порога, раскладываются по лентам: пока его
+    подмешивали при чтении, новые записи в ленты не попадали.
+    """
+    followers_count = AuthorStats.objects.filter(
+        user_id=author_id
+    ).values_list('followers_count', flat=True).first()
+    threshold = settings.TIMELINE_FANOUT_THRESHOLD
+    if followers_count == threshold + 1:
+        cache.delete(get_pulled_key())
+    elif followers_count == threshold:
+        cache.delete(get_pulled_key())
+        release_author(author_id)
+
+
+def release_author(author_id):
+    """Раскладывает последние записи автора по лентам подписчиков."""
+    posts = list(Post.objects.filter(
+        author_id=author_id
+    ).values_list('pk', 'pub_date')[:settings.TIMELINE_LENGTH])
+    followers = list(Follow.objects.filter(
+        author_id=author_id
+    ).values_list('user_id', flat=True))
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(
+                user_id=user_id,
+                post_id=post_id,
+                author_id=author_id,
+                pub_date=pub_date,
+            )
+            for user_id in followers
+            for post_id, pub_date in posts
+        ),
+        ignore_conflicts=True,
+    )
+    trim_many(followers)
+
+
+def remove_author(user_id, author_id):
+    TimelineEntry.objects.filter(
+        user_id=user_id, author_id=author_id
+    ).delete()
+    trim(user_id)
+
+
+def trim(user_id):
+    trim_many([user_id])
+
+
+def trim_many(user_ids):
+    """Оставляет в лентах не больше TIMELINE_LENGTH свежих записей."""
+    user_ids = list(user_ids)
+    with connection.cursor() as cursor:
+        for start in range(0, len(user_ids), TRIM_BATCH_SIZE):
+            batch = user_ids[start:start + TRIM_BATCH_SIZE]
+            cursor.execute(
+                TRIM_SQL.format(
+                    timeline=TimelineEntry._meta.db_table,
+                    users=', '.join(['%s'] * len(batch)),
+                ),
+                [*batch, settings.TIMELINE_LENGTH]
+            )
+
+
+def rebuild():
+    """Заполняет все ленты заново одним запросом.
+
+    Для записей и подписок, созданных через bulk_create, которые
+    не отправляют сигналов. Счётчики AuthorStats должны быть
+    актуальны: по ним определяются авторы, подмешиваемые при чтении.
+    """
+    cache.delete(get_pulled_key())
+    with transaction.atomic(), connection.cursor() as cursor:
+        TimelineEntry.objects.all().delete()
+        cursor.execute(
+            REBUILD_SQL.format(
+                timeline=TimelineEntry._meta.db_table,
+                follow=Follow._meta.db_table,
+                post=Post._meta.db_table,
+                stats=AuthorStats._meta.db_table,
+            ),
+            [settings.TIMELINE_FANOUT_THRESHOLD, settings.TIMELINE_LENGTH]
+        )
+    return TimelineEntry.objects.count()
+
+
+def get_follow_feed(user, pulled_authors=None):
+    """Гибридная лента: разложенные записи плюс записи популярных авторов.
+
+    pulled_authors — уже полученный результат get_pulled_authors().
+    """
+    if pulled_authors is None:
+        pulled_authors = get_pulled_authors()
+    paginator = CursorPaginator(
+        TimelineEntry.objects.filter(user=user).for_feed(),
+        settings.PAGE_COUNT,
+        fields=('pub_date', 'post_id'),
+        transform=attrgetter('post'),
+        version='post__updated',
+    )
+    pulled = list(Follow.objects.filter(
+        user=user, author_id__in=pulled_authors
+    ).values_list('author_id', flat=True))
+    if pulled:
+        paginator.add_source(
+            Post.objects.for_feed().filter(author_id__in=pulled)
+        )
+    return paginator
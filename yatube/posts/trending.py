@@ -0,0 +1,219 @@
+"""Рейтинг популярных записей по комментариям и подпискам.
+
+Каждое событие добавляет к счёту записи вес, который затухает вдвое
+за TRENDING_HALF_LIFE секунд. Вместо затухающего значения хранится
+ln(Σ вес·e^(λ·t)), где t отсчитывается от EPOCH: порядок по нему тот же,
+а новые события только прибавляются к сумме. Поэтому update() читает
+лишь события после прошлого запуска, а страницы /popular/ — готовый
+порядок id из TrendingScore.
+"""
+import math
+from collections import defaultdict
+from datetime import datetime, timezone
+from itertools import islice
+
+from django.conf import settings
+from django.core.paginator import Page, Paginator
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone as django_timezone
+
+from core import db
+from .models import Comment, Follow, Post, TrendingScore, TrendingWatermark
+
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+SOURCES = ('comment', 'follow')
+# id в одном запросе с IN: SQLite принимает не больше 999 параметров.
+LOOKUP_SIZE = 500
+
+
+def get_rate():
+    return math.log(2) / settings.TRENDING_HALF_LIFE
+
+
+def to_score(weight, moment):
+    """Вклад события с весом weight в момент moment."""
+    return math.log(weight) + get_rate() * (moment - EPOCH).total_seconds()
+
+
+def add_scores(*scores):
+    """ln(Σ e^score) без переполнения."""
+    top = max(scores)
+    return top + math.log(sum(math.exp(score - top) for score in scores))
+
+
+def get_cutoff(now=None):
+    """Счёт, ниже которого запись выпадает из рейтинга."""
+    return to_score(
+        settings.TRENDING_MIN_SCORE, now or django_timezone.now()
+    )
+
+
+def read_comments(last_id, batch_size):
+    comments = Comment.objects.filter(pk__gt=last_id).order_by(
+        'pk'
+    ).values_list('pk', 'post_id', 'created')
+    for pk, post_id, created in comments.iterator(chunk_size=batch_size):
+        yield pk, post_id, to_score(settings.TRENDING_COMMENT_WEIGHT, created)
+
+
+def read_follows(last_id, now, batch_size):
+    """Подписка поднимает последнюю запись автора.
+
+    У подписок нет даты, поэтому их время — время запуска update().
+    Для авторов без записей post_id — None.
+    """
+    follows = Follow.objects.filter(pk__gt=last_id).order_by(
+        'pk'
+    ).values_list('pk', 'author_id').iterator(chunk_size=batch_size)
+    score = to_score(settings.TRENDING_FOLLOW_WEIGHT, now)
+    while True:
+        chunk = list(islice(follows, LOOKUP_SIZE))
+        if not chunk:
+            break
+        latest = dict(Post.objects.filter(
+            author_id__in={author_id for _, author_id in chunk}
+        ).values_list('author_id').annotate(latest=Max('pk')).order_by())
+        for pk, author_id in chunk:
+            yield pk, latest.get(author_id), score
+
+
+def update(batch_size=1000, now=None):
+    """Учитывает события после прошлого запуска; возвращает их число."""
+    now = now or django_timezone.now()
+    events = 0
+    with transaction.atomic():
+        watermarks = {
+            watermark.source: watermark
+            for watermark in TrendingWatermark.objects.select_for_update()
+        }
+        for source in SOURCES:
+            if source not in watermarks:
+                watermarks[source] = TrendingWatermark(source=source)
+        added = defaultdict(list)
+        readers = {
+            'comment': read_comments(
+                watermarks['comment'].last_id, batch_size
+            ),
+            'follow': read_follows(
+                watermarks['follow'].last_id, now, batch_size
+            ),
+        }
+        for source, rows in readers.items():
+            for pk, post_id, score in rows:
+                watermarks[source].last_id = pk
+                if post_id is not None:
+                    added[post_id].append(score)
+                    events += 1
+        save_scores(added, batch_size)
+        for watermark in watermarks.values():
+            watermark.save()
+        prune(now)
+    return events
+
+
+def save_scores(added, batch_size):
+    post_ids = list(added)
+    size = min(batch_size, LOOKUP_SIZE)
+    for start in range(0, len(post_ids), size):
+        chunk = post_ids[start:start + size]
+        groups = dict(
+            Post.objects.filter(pk__in=chunk).values_list('pk', 'group_id')
+        )
+        existing = TrendingScore.objects.in_bulk(chunk)
+        created, changed = [], []
+        for post_id in chunk:
+            # Комментарии к удалённым записям пропускаются.
+            if post_id not in groups:
+                continue
+            item = existing.get(post_id)
+            if item is None:
+                created.append(TrendingScore(
+                    post_id=post_id, group_id=groups[post_id],
+                    score=add_scores(*added[post_id]),
+                ))
+            else:
+                item.group_id = groups[post_id]
+                item.score = add_scores(item.score, *added[post_id])
+                changed.append(item)
+        db.bulk_create(TrendingScore, created)
+        TrendingScore.objects.bulk_update(
+            changed, ('group', 'score'), batch_size=batch_size
+        )
+
+
+def prune(now=None):
+    """Удаляет записи, чей затухший счёт ниже TRENDING_MIN_SCORE."""
+    return TrendingScore.objects.filter(
+        score__lt=get_cutoff(now)
+    ).delete()[0]
+
+
+def rebuild(batch_size=1000):
+    """Пересчитывает рейтинг с нуля по всем комментариям.
+
+    Старые подписки пропускаются: их времени мы не знаем, и все они
+    получили бы вес сегодняшних.
+    """
+    with transaction.atomic():
+        TrendingScore.objects.all().delete()
+        TrendingWatermark.objects.all().delete()
+        last_follow = Follow.objects.aggregate(last=Max('pk'))['last']
+        TrendingWatermark.objects.create(
+            source='follow', last_id=last_follow or 0
+        )
+        return update(batch_size)
+
+
+def get_ranking(group=None):
+    """id записей рейтинга по убыванию счёта."""
+    scores = TrendingScore.objects.filter(score__gte=get_cutoff())
+    if group is not None:
+        scores = scores.filter(group=group)
+    return list(scores.order_by('-score').values_list(
+        'post_id', flat=True
+    )[:settings.TRENDING_LENGTH])
+
+
+class RankingPaginator(Paginator):
+    """Страницы готового рейтинга с курсорами как у CursorPaginator.
+
+    Курсор — позиция в списке id, записи загружаются только
+    для текущей страницы.
+    """
+
+    has_last_page = True
+
+    def __init__(self, ids, queryset, per_page):
+        super().__init__(ids, per_page)
+        self.queryset = queryset
+        self.next_cursor = None
+        self.previous_cursor = None
+
+    def decode(self, cursor):
+        try:
+            position = int(cursor)
+        except (TypeError, ValueError):
+            return None
+        return position if 0 <= position < len(self.object_list) else None
+
+    def get_page(self, after=None, before=None, last=False):
+        after, before = self.decode(after), self.decode(before)
+        total = len(self.object_list)
+        if before is not None:
+            start = max(before - self.per_page, 0)
+        elif last:
+            start = max(total - self.per_page, 0)
+        else:
+            start = after or 0
+        end = min(start + self.per_page, total)
+        if start > 0:
+            self.previous_cursor = str(start)
+        if end < total:
+            self.next_cursor = str(end)
+        posts = self.queryset.in_bulk(self.object_list[start:end])
+        number = 2 if start > 0 else 1
+        self.num_pages = number + 1 if end < total else number
+        return Page([
+            posts[pk] for pk in self.object_list[start:end] if pk in posts
+        ], number, self)
@@ -0,0 +1,80 @@
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps, features
+
+from .models import ImageVariant
+
+PIL_FORMATS = {
+    ImageVariant.JPEG: ('JPEG', 'jpg'),
+    ImageVariant.WEBP: ('WEBP', 'webp'),
+}
+
+
+def get_formats():
+    formats = list(settings.POST_IMAGE_FORMATS)
+    if ImageVariant.WEBP in formats and not features.check('webp'):
+        formats.remove(ImageVariant.WEBP)
+    return formats
+
+
+def get_widths(source_width):
+    """Ширины из POST_IMAGE_WIDTHS, не превышающие исходную картинку."""
+    widths = sorted(settings.POST_IMAGE_WIDTHS)
+    return [width for width in widths if width <= source_width] or widths[:1]
+
+
+def encode(image, image_format):
+    pil_format, _ = PIL_FORMATS[image_format]
+    buffer = BytesIO()
+    image.save(
+        buffer, pil_format,
+        quality=settings.POST_IMAGE_QUALITY, optimize=True
+    )
+    return buffer.getvalue()
+
+
+def discard(post):
+    """Удаляет варианты картинки записи вместе с файлами."""
+    names = list(post.image_variants.values_list('name', flat=True))
+    post.image_variants.all().delete()
+    for name in names:
+        default_storage.delete(name)
+
+
+def build(post):
+    """Пересоздаёт варианты картинки записи. Возвращает их список."""
+    old_names = list(post.image_variants.values_list('name', flat=True))
+    variants = []
+    if post.image and default_storage.exists(post.image.name):
+        with default_storage.open(post.image.name) as source:
+            image = Image.open(source)
+            image = ImageOps.exif_transpose(image).convert('RGB')
+        geometry_width, geometry_height = map(
+            int, settings.POST_THUMBNAIL_GEOMETRY.split('x')
+        )
+        stem = os.path.splitext(os.path.basename(post.image.name))[0]
+        for width in get_widths(image.width):
+            height = round(width * geometry_height / geometry_width)
+            resized = ImageOps.fit(image, (width, height), Image.LANCZOS)
+            for image_format in get_formats():
+                content = encode(resized, image_format)
+                _, extension = PIL_FORMATS[image_format]
+                name = default_storage.save(
+                    f'posts/variants/{post.pk}/{stem}-{width}.{extension}',
+                    ContentFile(content)
+                )
+                variants.append(ImageVariant(
+                    post=post, format=image_format, width=width,
+                    height=height, name=name, size=len(content),
+                ))
+    with transaction.atomic():
+        post.image_variants.all().delete()
+        ImageVariant.objects.bulk_create(variants)
+    for name in old_names:
+        default_storage.delete(name)
+    return variants
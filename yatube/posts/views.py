@@ -1,61 +1,188 @@
+import asyncio
+
 from django.shortcuts import render, get_object_or_404, redirect
-from .models import Post, Group, Follow
-from django.core.paginator import Paginator
+from .models import Comment, Post, Group, Follow
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
 from django.contrib.auth import get_user_model
-from posts.forms import PostForm, CommentForm
 from django.conf import settings
-from django.views.decorators.cache import cache_page
+from django.utils import timezone
+from django.utils.http import urlencode
+from core.asgi import load_user, run_sync
+from posts import feed_cache, recommendations, trending, write_buffer
+from posts.forms import PostForm, CommentForm
+from posts.paginator import get_cursor, get_page, paginate
+from posts.search import SearchPaginator
+from posts.thumbnails import schedule as schedule_thumbnail
+from posts.timeline import get_follow_feed, get_pulled_authors
+from posts.variants import discard as discard_variants
 
 
 User = get_user_model()
 
 
-@cache_page(20, key_prefix='index_page')
+def get_index_context(request):
+    return {'page_obj': feed_cache.get_page(
+        request, 'index', Post.objects.for_feed()
+    )}
+
+
+def get_group_context(request, group):
+    page_obj = feed_cache.get_page(
+        request, 'group_list', group.posts.for_feed(), group.pk
+    )
+    return {'group': group, 'page_obj': page_obj}
+
+
+def get_author(username):
+    return get_object_or_404(
+        User.objects.select_related('stats'), username=username
+    )
+
+
+def get_profile_context(request, user):
+    page_obj = feed_cache.get_page(
+        request, 'profile', user.posts.for_feed(), user.pk
+    )
+    following = False
+    if request.user.is_authenticated:
+        following = write_buffer.is_following(
+            request.user.pk, user.pk
+        ) or Follow.objects.filter(user=request.user, author=user).exists()
+    return {
+        'username': user, 'page_obj': page_obj, 'following': following,
+        'suggestions': recommendations.get_suggestions(request.user),
+    }
+
+
+def get_follow_context(request, user, pulled_authors=None):
+    return {
+        'page_obj': get_page(request, get_follow_feed(user, pulled_authors)),
+        'suggestions': recommendations.get_suggestions(user),
+    }
+
+
 def index(request):
-    post_list = Post.objects.all()
-    paginator = Paginator(post_list, settings.PAGE_COUNT)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    context = {'page_obj': page_obj}
+    context = get_index_context(request)
     return render(request, 'posts/index.html', context)
 
 
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
-    paginator = Paginator(posts, settings.PAGE_COUNT)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    context = {
-        'group': group, 'page_obj': page_obj,
-    }
+    context = get_group_context(request, group)
     return render(request, 'posts/group_list.html', context)
 
 
 def profile(request, username):
-    user = get_object_or_404(User, username=username)
-    posts = user.posts.all()
-    paginator = Paginator(posts, settings.PAGE_COUNT)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    following = False
-    if request.user.is_authenticated:
-        following = Follow.objects.filter(user=request.user, author=user)
-    context = {
-        'username': user, 'page_obj': page_obj, 'following': following,
-    }
+    context = get_profile_context(request, get_author(username))
     return render(request, 'posts/profile.html', context)
 
 
+def popular(request):
+    paginator = trending.RankingPaginator(
+        trending.get_ranking(), Post.objects.for_feed(), settings.PAGE_COUNT
+    )
+    context = {'page_obj': get_page(request, paginator), 'popular': True}
+    return render(request, 'posts/popular.html', context)
+
+
+def group_popular(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    paginator = trending.RankingPaginator(
+        trending.get_ranking(group), group.posts.for_feed(),
+        settings.PAGE_COUNT
+    )
+    context = {'group': group, 'page_obj': get_page(request, paginator)}
+    return render(request, 'posts/popular.html', context)
+
+
+async def index_async(request):
+    """index для ASGI: лента и пользователь загружаются одновременно."""
+    _, context = await asyncio.gather(
+        run_sync(load_user, request),
+        run_sync(get_index_context, request),
+    )
+    return await run_sync(render, request, 'posts/index.html', context)
+
+
+async def group_posts_async(request, slug):
+    _, group = await asyncio.gather(
+        run_sync(load_user, request),
+        run_sync(get_object_or_404, Group, slug=slug),
+    )
+    context = await run_sync(get_group_context, request, group)
+    return await run_sync(render, request, 'posts/group_list.html', context)
+
+
+async def profile_async(request, username):
+    _, user = await asyncio.gather(
+        run_sync(load_user, request),
+        run_sync(get_author, username),
+    )
+    context = await run_sync(get_profile_context, request, user)
+    return await run_sync(render, request, 'posts/profile.html', context)
+
+
+async def follow_index_async(request):
+    """follow_index для ASGI, где posts.events отдаёт поток новых записей."""
+    user, pulled_authors = await asyncio.gather(
+        run_sync(load_user, request),
+        run_sync(get_pulled_authors),
+    )
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+    context = await run_sync(
+        get_follow_context, request, user, pulled_authors
+    )
+    context['events_url'] = settings.EVENTS_PATH
+    return await run_sync(render, request, 'posts/follow.html', context)
+
+
+def get_comments(request, post_id):
+    comments = paginate(
+        request,
+        Comment.objects.filter(post_id=post_id).for_thread(),
+        per_page=settings.COMMENTS_PAGE_COUNT,
+        fields=('created', 'id'),
+    )
+    if not any(get_cursor(request).values()):
+        # Ещё не сохранённые комментарии — в начало первой страницы.
+        pending = write_buffer.pending_comments(post_id)
+        if pending:
+            comments.object_list = pending + list(comments.object_list)
+    return comments
+
+
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), pk=post_id
+    )
     form = CommentForm()
-    context = {'post': post, 'form': form, 'comments': post.comments.all()
-               }
+    context = {
+        'post': post, 'form': form,
+        'comments': get_comments(request, post.pk),
+    }
     return render(request, 'posts/post_detail.html', context)
 
 
+def post_comments(request, post_id):
+    """Следующая пачка комментариев фрагментом HTML для post_detail."""
+    post = get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    context = {'post': post, 'comments': get_comments(request, post.pk)}
+    return render(request, 'posts/includes/comments.html', context)
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    paginator = SearchPaginator(query, settings.PAGE_COUNT)
+    context = {
+        'query': query,
+        'page_obj': get_page(request, paginator),
+        'page_query': urlencode({'q': query}) + '&',
+    }
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
 def post_create(request):
     if request.method != 'POST':
@@ -67,6 +194,7 @@ def post_create(request):
     new_post = form.save(commit=False)
     new_post.author = request.user
     form.save()
+    schedule_thumbnail(new_post.image.name)
     return redirect('posts:profile', request.user)
 
 
@@ -86,6 +214,13 @@ def post_edit(request, post_id):
                       {'form': form, 'is_edit': is_edit, 'post': post}
                       )
     form.save()
+    if 'image' in form.changed_data:
+        # Варианты прежней картинки удаляются сразу, а updated сдвигается
+        # после этого: до process_thumbnails карточки покажут миниатюру
+        # или заглушку, а не старую картинку.
+        discard_variants(post)
+        Post.objects.filter(pk=post.pk).update(updated=timezone.now())
+        schedule_thumbnail(post.image.name)
     return redirect('posts:post_detail', post_id)
 
 
@@ -97,31 +232,38 @@ def add_comment(request, post_id):
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
-        comment.save()
+        if write_buffer.is_enabled():
+            write_buffer.add_comment(comment)
+        else:
+            comment.save()
     return redirect('posts:post_detail', post_id=post_id)
 
 
 @login_required
 def follow_index(request):
-    posts = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(posts, settings.PAGE_COUNT)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    context = {'page_obj': page_obj}
+    context = get_follow_context(request, request.user)
     return render(request, 'posts/follow.html', context)
 
 
 @login_required
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
-    if request.user != author:
+    if request.user == author:
+        return redirect('posts:profile', author)
+    if not write_buffer.is_enabled():
         Follow.objects.get_or_create(user=request.user, author=author)
+    elif not Follow.objects.filter(user=request.user, author=author).exists():
+        write_buffer.add_follow(Follow(user=request.user, author=author))
     return redirect('posts:profile', author)
 
 
 @login_required
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
+    if write_buffer.discard_follow(request.user.pk, author.pk):
+        # Подписка могла быть и в базе: убираем обе.
+        Follow.objects.filter(user=request.user, author=author).delete()
+        return redirect('posts:profile', author)
     unfollow = get_object_or_404(Follow, user=request.user, author=author)
     unfollow.delete()
     return redirect('posts:profile', author)
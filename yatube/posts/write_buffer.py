@@ -0,0 +1,231 @@
+"""Отложенная пакетная запись комментариев и подписок.
+
+При WRITE_BUFFER_ENABLED add_comment и profile_follow проверяют данные
+сразу, а строки складывают в буфер процесса. Буфер сохраняется одной
+транзакцией через bulk_create, когда в нём WRITE_BUFFER_MAX_ROWS строк
+или самой старой строке WRITE_BUFFER_MAX_DELAY секунд.
+
+WRITE_BUFFER_DURABILITY:
+    'commit' — запрос ждёт сохранения своей пачки (групповой коммит),
+    ответ уходит только после записи в базу;
+    'memory' — запрос не ждёт, пачку по времени сохраняет таймер;
+    при падении процесса несохранённые строки теряются.
+
+Несохранённые строки видны только процессу, который их принял:
+pending_comments и is_following добавляют их к чтению.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from core import db, metrics
+from . import counters, timeline
+from .models import Comment, Follow, Post
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+DURABILITY = ('commit', 'memory')
+
+
+class Batch:
+    """Строки, которые сохраняются вместе."""
+
+    def __init__(self):
+        self.comments = []
+        self.follows = {}
+        self.started = time.monotonic()
+        self.done = threading.Event()
+        self.error = None
+        self.timer = None
+
+    def __len__(self):
+        return len(self.comments) + len(self.follows)
+
+    def is_due(self):
+        return (
+            len(self) >= settings.WRITE_BUFFER_MAX_ROWS
+            or time.monotonic() - self.started
+            >= settings.WRITE_BUFFER_MAX_DELAY
+        )
+
+
+_lock = threading.Condition()
+_batch = Batch()
+
+
+def is_enabled():
+    return settings.WRITE_BUFFER_ENABLED
+
+
+def add_comment(comment):
+    """Ставит проверенный комментарий в очередь на запись."""
+    comment.created = comment.created or timezone.now()
+    _add(lambda batch: batch.comments.append(comment))
+
+
+def add_follow(follow):
+    _add(lambda batch: batch.follows.setdefault(
+        (follow.user_id, follow.author_id), follow
+    ))
+
+
+def discard_follow(user_id, author_id):
+    """Убирает несохранённую подписку; True, если она была в буфере."""
+    with _lock:
+        return _batch.follows.pop((user_id, author_id), None) is not None
+
+
+def pending_comments(post_id):
+    """Несохранённые комментарии к записи, новые первыми."""
+    with _lock:
+        comments = [c for c in _batch.comments if c.post_id == post_id]
+    return comments[::-1]
+
+
+def is_following(user_id, author_id):
+    with _lock:
+        return (user_id, author_id) in _batch.follows
+
+
+def flush():
+    """Сохраняет всё, что накопилось, в текущем потоке."""
+    with _lock:
+        batch = _take()
+    _write(batch)
+    if batch.error is not None:
+        raise batch.error
+
+
+def _add(append):
+    durability = settings.WRITE_BUFFER_DURABILITY
+    if durability not in DURABILITY:
+        raise ValueError(
+            f'WRITE_BUFFER_DURABILITY: ожидается одно из {DURABILITY}.'
+        )
+    with _lock:
+        batch = _batch
+        append(batch)
+        metrics.increment('yatube_write_buffer_rows_total', {})
+        full = len(batch) >= settings.WRITE_BUFFER_MAX_ROWS
+        if full:
+            _take()
+        elif durability == 'memory' and batch.timer is None:
+            batch.timer = threading.Timer(
+                settings.WRITE_BUFFER_MAX_DELAY, _flush_on_timer, (batch,)
+            )
+            batch.timer.daemon = True
+            batch.timer.start()
+    if full:
+        # Пачку заполнил этот запрос, он её и сохраняет.
+        _write(batch)
+    if durability == 'commit':
+        _wait(batch)
+
+
+def _wait(batch):
+    """Ждёт, пока пачку сохранит другой запрос, или сохраняет её сам."""
+    with _lock:
+        while batch is _batch and not batch.is_due():
+            remaining = settings.WRITE_BUFFER_MAX_DELAY - (
+                time.monotonic() - batch.started
+            )
+            _lock.wait(max(remaining, 0))
+        if batch is _batch:
+            _take()
+            leader = True
+        else:
+            leader = False
+    if leader:
+        _write(batch)
+    batch.done.wait()
+    if batch.error is not None:
+        raise batch.error
+
+
+def _take():
+    """Заменяет текущую пачку пустой и возвращает старую."""
+    global _batch
+    batch = _batch
+    _batch = Batch()
+    if batch.timer is not None:
+        batch.timer.cancel()
+    _lock.notify_all()
+    return batch
+
+
+def _flush_on_timer(batch):
+    with _lock:
+        if batch is not _batch:
+            return
+        _take()
+    try:
+        _write(batch)
+    finally:
+        close_old_connections()
+
+
+def _write(batch):
+    try:
+        if len(batch):
+            save(batch.comments, list(batch.follows.values()))
+            metrics.increment('yatube_write_buffer_flushes_total', {})
+    except Exception as error:
+        logger.exception('Не удалось сохранить пачку из %d строк', len(batch))
+        batch.error = error
+    finally:
+        batch.done.set()
+
+
+def save(comments, follows):
+    """Записывает пачку и делает то, что при save() делают сигналы.
+
+    Строки, чьи записи или пользователи удалены после проверки,
+    пропускаются.
+    """
+    with transaction.atomic():
+        if comments:
+            posts = set(Post.objects.filter(
+                pk__in={comment.post_id for comment in comments}
+            ).values_list('pk', flat=True))
+            comments = [c for c in comments if c.post_id in posts]
+            db.bulk_create(Comment, comments)
+            for author_id, count in Counter(
+                comment.author_id for comment in comments
+            ).items():
+                counters.change(author_id, 'comments_count', count)
+        if follows:
+            user_ids = {f.user_id for f in follows} | {
+                f.author_id for f in follows
+            }
+            users = set(User.objects.filter(
+                pk__in=user_ids
+            ).values_list('pk', flat=True))
+            existing = set(Follow.objects.filter(
+                user_id__in=user_ids, author_id__in=user_ids
+            ).values_list('user_id', 'author_id'))
+            follows = [
+                follow for follow in follows
+                if (follow.user_id, follow.author_id) not in existing
+                and follow.user_id in users and follow.author_id in users
+            ]
+            db.bulk_create(Follow, follows, ignore_conflicts=True)
+            for follow in follows:
+                counters.change(follow.author_id, 'followers_count', 1)
+                counters.change(follow.user_id, 'following_count', 1)
+                timeline.backfill(follow.user_id, follow.author_id)
+                timeline.check_threshold(follow.author_id)
+
+
+@atexit.register
+def _flush_at_exit():
+    with _lock:
+        batch = _take()
+    _write(batch)
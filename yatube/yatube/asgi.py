@@ -0,0 +1,29 @@
+"""
+ASGI config for yatube project.
+
+Server-sent events are served natively by posts.events, the read-heavy
+pages in settings.ASYNC_VIEWS by their async variants, and every other
+request goes to the regular Django WSGI application in a fixed-size
+thread pool. Run with, for example::
+
+    uvicorn yatube.asgi:application
+"""
+
+import os
+
+from django.conf import settings
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+wsgi_application = get_wsgi_application()
+
+from core.asgi import AsyncViews, Router, WsgiBridge  # noqa: E402
+from posts.events import follow_events  # noqa: E402
+
+application = Router(
+    {settings.EVENTS_PATH: follow_events},
+    default=AsyncViews(
+        settings.ASYNC_VIEWS, fallback=WsgiBridge(wsgi_application)
+    ),
+)
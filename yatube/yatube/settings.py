@@ -50,6 +50,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -57,6 +58,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.MetricsMiddleware',
 ]
 
 ROOT_URLCONF = 'yatube.urls'
@@ -64,7 +66,7 @@ ROOT_URLCONF = 'yatube.urls'
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.template.MeasuredTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -85,12 +87,48 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# core.sqlite3 — sqlite3 с PRAGMA на каждом соединении и BEGIN IMMEDIATE
+# в atomic(): в WAL читатели не ждут писателей, а писатели ждут друг
+# друга до busy_timeout вместо ошибки «database is locked».
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'core.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': 60,
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'pragmas': {
+                'journal_mode': 'WAL',
+                'synchronous': 'NORMAL',
+                'busy_timeout': 5000,
+                'cache_size': -20000,
+                'mmap_size': 256 * 1024 * 1024,
+                'temp_store': 'MEMORY',
+            },
+        },
     }
 }
+# Реплика для чтения — копия default, которую обновляет
+# manage.py replicate. В тестах она указывает на тестовую default.
+DATABASES['replica'] = {
+    **DATABASES['default'],
+    'NAME': os.path.join(BASE_DIR, 'db.replica.sqlite3'),
+    'TEST': {'MIRROR': 'default'},
+}
+DATABASE_ROUTERS = ['core.replicas.ReplicaRouter']
+# Базы, с которых читают страницы READ_REPLICA_VIEWS; пусто — только
+# default. Например, ['replica'] после первого manage.py replicate.
+READ_REPLICAS = []
+READ_REPLICA_VIEWS = (
+    'posts:index',
+    'posts:group_list',
+    'posts:profile',
+    'posts:post_detail',
+    'posts:follow_index',
+)
+# После записи клиент читает с default столько секунд (cookie).
+READ_REPLICA_STICKY_SECONDS = 5
+READ_REPLICA_COOKIE = 'read_primary_until'
 
 
 # Password validation
@@ -143,13 +181,133 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 PAGE_COUNT = 10
 
+# Длина фрагмента текста в результатах поиска (в словах и в символах
+# для баз без полнотекстового индекса).
+SEARCH_SNIPPET_TOKENS = 24
+SEARCH_SNIPPET_LENGTH = 200
+
+# Комментариев под записью за один раз (остальные подгружаются).
+COMMENTS_PAGE_COUNT = 20
+
+# Сколько записей хранится в персональной ленте подписок.
+TIMELINE_LENGTH = 1000
+# Записи авторов с большим числом подписчиков не раскладываются по лентам,
+# а подмешиваются при чтении (см. manage.py fanout_report).
+TIMELINE_FANOUT_THRESHOLD = 1000
+TIMELINE_PULLED_AUTHORS_TIMEOUT = 300
+
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+POST_THUMBNAIL_GEOMETRY = '960x339'
+POST_THUMBNAIL_OPTIONS = {'crop': 'center', 'upscale': True}
+# Повторная постановка картинки в очередь миниатюр не чаще раза в период.
+THUMBNAIL_TASK_TIMEOUT = 60
+# Неудачную задачу повторяем с удвоением паузы, но не реже раза в сутки.
+THUMBNAIL_RETRY_DELAY = 60
+THUMBNAIL_RETRY_MAX_DELAY = 24 * 60 * 60
+# Варианты картинок для srcset: ширины и форматы.
+POST_IMAGE_WIDTHS = (320, 640, 960, 1920)
+POST_IMAGE_FORMATS = ('webp', 'jpeg')
+POST_IMAGE_QUALITY = 80
+POST_IMAGE_DEFAULT_WIDTH = 960
+
+# Кеш в файле SQLite общий для всех процессов сервера: сброс ключа
+# в одном процессе виден остальным. MAX_SIZE — предел суммарного
+# размера значений в байтах.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+            'MAX_SIZE': 64 * 1024 * 1024,
+        },
     }
 }
+# Тесты и замеры не трогают общий файл кеша (core.testing.isolate_cache).
+TEST_RUNNER = 'core.testing.TestRunner'
+
+# Страницы лент index, group_list и profile кешируются на
+# FEED_CACHE_TIMEOUT секунд и сбрасываются при изменении записей.
+FEED_CACHE_TIMEOUT = 20
+# Защита от одновременного пересчёта (core.cache.get_or_recompute).
+CACHE_STALE_TIMEOUT = 60
+CACHE_LEASE_TIMEOUT = 10
+CACHE_LEASE_WAIT = 1
+CACHE_LEASE_POLL = 0.02
+CACHE_EARLY_EXPIRY_BETA = 1
+
+# Рейтинг популярных записей (posts.trending, manage.py update_trending).
+# Вес события затухает вдвое за TRENDING_HALF_LIFE секунд; записи
+# со счётом ниже TRENDING_MIN_SCORE выпадают из рейтинга.
+TRENDING_HALF_LIFE = 6 * 60 * 60
+TRENDING_COMMENT_WEIGHT = 1
+TRENDING_FOLLOW_WEIGHT = 3
+TRENDING_MIN_SCORE = 0.05
+TRENDING_LENGTH = 100
+
+# Подсказки авторов и групп (posts.recommendations,
+# manage.py build_recommendations): хранится по LENGTH каждого вида,
+# на страницах показывается SHOWN.
+RECOMMENDATIONS_LENGTH = 10
+RECOMMENDATIONS_SHOWN = 5
+RECOMMENDATIONS_COFOLLOW_SAMPLE = 20
+
+# Отложенная пакетная запись комментариев и подписок (posts.write_buffer).
+# DURABILITY 'commit' — ответ после записи пачки в базу, 'memory' — сразу,
+# несохранённое при падении процесса теряется.
+WRITE_BUFFER_ENABLED = False
+WRITE_BUFFER_MAX_ROWS = 200
+WRITE_BUFFER_MAX_DELAY = 0.05
+WRITE_BUFFER_DURABILITY = 'commit'
+
+# Поток событий о новых записях (posts.events, yatube.asgi).
+EVENTS_PATH = '/follow/events/'
+EVENTS_BROKER = 'posts.events.LocalBroker'
+EVENTS_QUEUE_SIZE = 100
+EVENTS_KEEPALIVE = 15
+EVENTS_REPLAY_LIMIT = 50
+EVENTS_TEXT_LENGTH = 200
+# Потоков для синхронного кода при запуске через ASGI.
+ASGI_THREADS = 8
+# Страницы, которые под ASGI обслуживают асинхронные варианты view.
+ASYNC_VIEWS = {
+    'posts:index': 'posts.views.index_async',
+    'posts:group_list': 'posts.views.group_posts_async',
+    'posts:profile': 'posts.views.profile_async',
+    'posts:follow_index': 'posts.views.follow_index_async',
+}
+
+# Метрики запросов (core.middleware), отдаются администраторам в /metrics/.
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+METRICS_QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+# Запросы дольше порога (в секундах) с вероятностью SAMPLE_RATE
+# пишутся в журнал медленных запросов вместе с первыми SQL.
+METRICS_SLOW_REQUEST_THRESHOLD = 0.5
+METRICS_SLOW_REQUEST_SAMPLE_RATE = 0.1
+METRICS_TRACE_QUERIES = 50
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'slow_requests': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': os.path.join(BASE_DIR, 'slow_requests.log'),
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            'delay': True,
+            'encoding': 'utf-8',
+        },
+    },
+    'loggers': {
+        'core.slow_requests': {
+            'handlers': ['slow_requests'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}